@@ -0,0 +1,63 @@
+"""
+Speed and quality of the spectrogram inversion modes (Griffin-Lim vs phase reuse)
+Run from the repository root: python -m benchmarks.inversion_benchmark
+"""
+
+import argparse
+import time
+import numpy as np
+from src.spectogram_augmentation.spectogram_aug_pipeline import SpectrogramAugmentationPipeline
+from src.spectogram_augmentation.inversion import SpectrogramInverter
+
+
+def synthetic_speech(seconds, sr, seed=0):
+    """Harmonic tone with a gliding pitch, syllable-like envelope and a little noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    f0 = 120 + 30 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    y = sum(np.sin(k * phase) / k for k in range(1, 10))
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 4 * t))
+    y = y * envelope + 0.01 * rng.standard_normal(len(t))
+    return (0.5 * y / np.max(np.abs(y))).astype(np.float32)
+
+
+def log_mel_distance(inverter, y, target_log_mel):
+    """Mean absolute dB difference between the log-mel of y and the augmented target."""
+    log_mel, _ = inverter.analyze(y)
+    frames = min(log_mel.shape[1], target_log_mel.shape[1])
+    return float(np.mean(np.abs(log_mel[:, :frames] - target_log_mel[:, :frames])))
+
+
+def run(seconds, methods, n_iter, repeats, sr=16000, n_mels=80):
+    y = synthetic_speech(seconds, sr)
+    pipeline = SpectrogramAugmentationPipeline(sr=sr)
+    inverters = {
+        f"griffin_lim(n_iter={n_iter})": SpectrogramInverter(sr, n_mels=n_mels, mode="griffin_lim", n_iter=n_iter),
+        "phase": SpectrogramInverter(sr, n_mels=n_mels, mode="phase"),
+    }
+
+    print(f"{'method':<14} {'inversion':<22} {'sec/clip':>9} {'x realtime':>11} {'logmel dB err':>14}")
+    for method in methods:
+        for name, inverter in inverters.items():
+            log_mel, stft = inverter.analyze(y)
+            np.random.seed(0)
+            aug = pipeline.augment(log_mel, method)
+
+            start = time.perf_counter()
+            for _ in range(repeats):
+                y_recon = inverter.invert(aug, log_mel, stft, length=len(y))
+            elapsed = (time.perf_counter() - start) / repeats
+
+            error = log_mel_distance(inverter, y_recon, aug)
+            print(f"{method:<14} {name:<22} {elapsed:>9.4f} {seconds / elapsed:>11.1f} {error:>14.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=4.0)
+    parser.add_argument("--methods", nargs="+", default=["time_mask", "freq_mask", "add_noise", "time_shift"])
+    parser.add_argument("--n-iter", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    run(args.seconds, args.methods, args.n_iter, args.repeats)
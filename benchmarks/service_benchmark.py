@@ -0,0 +1,122 @@
+"""
+Single-clip request throughput and latency: a SingleAugHF per request (what upload workers
+did), one reused SingleAugHF, and AugmentationService called in process and over HTTP
+by concurrent clients. Clips and the HuggingFace TSV are synthetic and written to a
+temporary directory.
+Run from the repository root: python -m benchmarks.service_benchmark
+"""
+
+import argparse
+import contextlib
+import io
+import tempfile
+import threading
+import time
+from pathlib import Path
+import numpy as np
+import soundfile as sf
+from src.wave_augmentation.pipeline import SingleAugHF
+from src.wave_augmentation.service import AugmentationService, ServiceClient, make_server
+from benchmarks.inversion_benchmark import synthetic_speech
+
+
+def make_inputs(root, clips, seconds, manifest_rows, sr):
+    paths = []
+    for i in range(clips):
+        path = root / f"clip{i:03d}.wav"
+        sf.write(path, synthetic_speech(seconds, sr, seed=i), sr)
+        paths.append(str(path))
+    manifest = root / "metadata.tsv"
+    with open(manifest, "w", encoding="utf-8") as f:
+        f.write("path\tsentence\n")
+        for i in range(manifest_rows):
+            f.write(f"{paths[i % clips]}\ttranscript number {i}\n")
+    return paths, manifest
+
+
+def timed_requests(call, paths, requests, clients):
+    """Run requests calls of call(path, i) over `clients` threads; returns (requests/s, p50 ms, p99 ms)."""
+    latencies = []
+    lock = threading.Lock()
+
+    def client(index):
+        local = []
+        for i in range(index, requests, clients):
+            start = time.perf_counter()
+            call(paths[i % len(paths)], i)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000
+    return requests / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def run(method, backend, requests, clients, clip_count, seconds, manifest_rows, batch_window, sr=16000):
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        paths, manifest = make_inputs(root, clip_count, seconds, manifest_rows, sr)
+        rows = []
+
+        def per_request(path, i):
+            with contextlib.redirect_stdout(io.StringIO()):
+                augmenter = SingleAugHF(manifest, root / "per_request", sr=sr, backend=backend)
+                # Indexing the manifest is what constructing one used to cost.
+                len(augmenter.entries)
+                augmenter.augment_single(path, method, text=f"text {i}")
+                augmenter.close()
+        rows.append(("SingleAugHF per request", 1, timed_requests(per_request, paths, min(requests, 50), 1)))
+
+        reused = SingleAugHF(manifest, root / "reused", sr=sr, backend=backend)
+        reused_lock = threading.Lock()
+
+        def reused_call(path, i):
+            with reused_lock, contextlib.redirect_stdout(io.StringIO()):
+                reused.augment_single(path, method, text=f"text {i}")
+        rows.append(("SingleAugHF reused", clients, timed_requests(reused_call, paths, requests, clients)))
+        reused.close()
+
+        with AugmentationService(root / "service", sr=sr, backend=backend, methods=[method],
+                                 batch_window=batch_window) as service:
+            rows.append(("service in process", clients, timed_requests(
+                lambda path, i: service.augment(path, method, text=f"text {i}"), paths, requests, clients)))
+
+            server = make_server(service, port=0)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            local = threading.local()
+
+            def http_call(path, i):
+                if not hasattr(local, "client"):
+                    local.client = ServiceClient(f"http://127.0.0.1:{server.server_port}")
+                local.client.augment(path, method, text=f"text {i}")
+            rows.append(("service over HTTP", clients, timed_requests(http_call, paths, requests, clients)))
+            server.shutdown()
+            server.server_close()
+            mean_batch = service.stats()["mean_batch"]
+
+    print(f"{'mode':<26} {'clients':>7} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for name, mode_clients, (rate, p50, p99) in rows:
+        print(f"{name:<26} {mode_clients:>7} {rate:>9.1f} {p50:>9.2f} {p99:>9.2f}")
+    print(f"mean service batch: {mean_batch:.1f} requests")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--method", default="noise")
+    parser.add_argument("--backend", choices=("nlpaug", "numpy"), default="numpy")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--clips", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--manifest-rows", type=int, default=100000)
+    parser.add_argument("--batch-window-ms", type=float, default=2.0)
+    args = parser.parse_args()
+    run(args.method, args.backend, args.requests, args.clients, args.clips, args.seconds, args.manifest_rows,
+        args.batch_window_ms / 1000)
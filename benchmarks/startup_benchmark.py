@@ -0,0 +1,108 @@
+"""
+Worker startup cost: the time a fresh interpreter needs to import each entry module,
+and then to build a pipeline and augment its first clip with one method. With spawned
+process pools every worker pays this once, so it bounds how quickly a pool gets going.
+Every measurement runs in a new subprocess; the table shows the median of the repeats.
+Run from the repository root: python -m benchmarks.startup_benchmark
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+MODULES = [
+    "src.wave_augmentation.pipeline",
+    "src.spectogram_augmentation.spectogram_aug_pipeline",
+    "src.spectogram_augmentation.chain",
+    "src.utils.augmentation_iterator",
+    "src.dataset_preparation.data_format_to_aug",
+]
+
+# (name, setup statement, first augment statement); y is one second of float32 noise.
+FIRST_USE = [
+    ("wave nlpaug/noise",
+     "from src.wave_augmentation.pipeline import AudioAugmentationPipeline; p = AudioAugmentationPipeline(16000)",
+     "p.augment(y, 'noise')"),
+    ("wave numpy/noise",
+     "from src.wave_augmentation.pipeline import AudioAugmentationPipeline; "
+     "p = AudioAugmentationPipeline(16000, backend='numpy')",
+     "p.augment(y, 'noise')"),
+    ("wave numpy/pitch",
+     "from src.wave_augmentation.pipeline import AudioAugmentationPipeline; "
+     "p = AudioAugmentationPipeline(16000, backend='numpy')",
+     "p.augment(y, 'pitch')"),
+    ("spec time_mask + phase inversion",
+     "from src.spectogram_augmentation.spectogram_aug_pipeline import SpectrogramAugmentationPipeline; "
+     "from src.spectogram_augmentation.inversion import SpectrogramInverter; "
+     "p = SpectrogramAugmentationPipeline(16000); inv = SpectrogramInverter(16000, mode='phase')",
+     "log_mel, stft = inv.analyze(y); inv.invert(p.augment(log_mel, 'time_mask'), log_mel, stft, len(y))"),
+    ("spec resize_crop",
+     "from src.spectogram_augmentation.spectogram_aug_pipeline import SpectrogramAugmentationPipeline; "
+     "p = SpectrogramAugmentationPipeline(16000)",
+     "p.augment(np.random.rand(80, 100).astype(np.float32), 'resize_crop')"),
+]
+
+SCRIPT = """
+import time
+start = time.perf_counter()
+{setup}
+setup = time.perf_counter()
+import numpy as np
+y = np.random.default_rng(0).uniform(-0.5, 0.5, 16000).astype(np.float32)
+begin = time.perf_counter()
+{first}
+print(setup - start, time.perf_counter() - begin)
+"""
+
+
+def measure(setup, first="pass"):
+    """(setup seconds, first augment seconds) in a fresh interpreter."""
+    result = subprocess.run([sys.executable, "-c", SCRIPT.format(setup=setup, first=first)],
+                            capture_output=True, text=True, check=True)
+    setup_time, first_time = result.stdout.split()[-2:]
+    return float(setup_time), float(first_time)
+
+
+def _first_augment(method):
+    from src.wave_augmentation.pipeline import AudioAugmentationPipeline
+    import numpy as np
+
+    y = np.random.default_rng(0).uniform(-0.5, 0.5, 16000).astype(np.float32)
+    return len(AudioAugmentationPipeline(16000).augment(y, method))
+
+
+def pool_latency(workers, method):
+    """Seconds from creating a spawn-context pool until every worker has augmented a clip."""
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as executor:
+        list(executor.map(_first_augment, [method] * workers))
+        return time.perf_counter() - start
+
+
+def run(repeats, workers, method):
+    print(f"{'import':<56} {'ms':>9}")
+    for module in MODULES:
+        times = [measure(f"import {module}")[0] for _ in range(repeats)]
+        print(f"{module:<56} {statistics.median(times) * 1000:>9.1f}")
+
+    print(f"\n{'first use':<36} {'setup ms':>9} {'first call ms':>14}")
+    for name, setup, first in FIRST_USE:
+        setups, firsts = zip(*[measure(setup, first) for _ in range(repeats)])
+        print(f"{name:<36} {statistics.median(setups) * 1000:>9.1f} {statistics.median(firsts) * 1000:>14.1f}")
+
+    if workers:
+        latency = statistics.median([pool_latency(workers, method) for _ in range(repeats)])
+        print(f"\nspawn pool of {workers}, first '{method}' from every worker: {latency * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4, help="spawn pool size; 0 skips the pool measurement")
+    parser.add_argument("--method", default="noise", help="waveform method the pool workers run first")
+    args = parser.parse_args()
+    run(args.repeats, args.workers, args.method)
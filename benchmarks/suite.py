@@ -0,0 +1,259 @@
+"""
+Benchmark suite for every wave and spectrogram augmenter, feature extraction, inversion
+and the end-to-end pipelines, on synthetic audio (no network, no datasets needed)
+Run from the repository root: python -m benchmarks.suite --output results.json
+
+Every case reports its realtime factor (seconds of audio processed per wall-clock
+second), clips per second and peak RSS while it ran. Results are written as JSON together
+with the commit and library versions; pass --compare old.json to print the speed ratio of
+every case against an earlier run:
+
+    python -m benchmarks.suite --durations 1 10 --output new.json --compare old.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+import numpy as np
+import soundfile as sf
+from src.wave_augmentation.pipeline import AudioAugmentationPipeline, Augmentation
+from src.spectogram_augmentation.spectogram_aug_pipeline import SpectrogramAugmentationPipeline, SpectrogramAugmentation
+from src.spectogram_augmentation.inversion import SpectrogramInverter
+from benchmarks.inversion_benchmark import synthetic_speech
+
+
+GROUPS = ("wave", "spec", "features", "e2e")
+
+
+def _rss_bytes():
+    with open("/proc/self/statm", "r") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class PeakRSS:
+    """
+    Peak resident set size while the block runs, sampled every `interval` seconds from
+    /proc/self/statm. Without /proc it falls back to the process-wide ru_maxrss.
+    """
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.peak = 0
+
+    def _poll(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _rss_bytes())
+
+    def __enter__(self):
+        self._proc = os.path.exists("/proc/self/statm")
+        if self._proc:
+            self.peak = _rss_bytes()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._poll, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._proc:
+            self._stop.set()
+            self._thread.join()
+            self.peak = max(self.peak, _rss_bytes())
+        else:
+            scale = 1 if sys.platform == "darwin" else 1024
+            self.peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def measure(fn, audio_seconds, clips=1, min_time=1.0, max_repeats=20, warmup=False):
+    """
+    Run fn until min_time has passed (at least once); returns the timing and memory record.
+    warmup=True makes one untimed call first (imports, JIT compilation, cached filters).
+    """
+    if warmup:
+        fn()
+    repeats, elapsed = 0, 0.0
+    with PeakRSS() as rss:
+        while repeats == 0 or (elapsed < min_time and repeats < max_repeats):
+            start = time.perf_counter()
+            fn()
+            elapsed += time.perf_counter() - start
+            repeats += 1
+    per_run = elapsed / repeats
+    return {
+        "repeats": repeats,
+        "seconds_per_run": per_run,
+        "realtime_factor": audio_seconds / per_run,
+        "clips_per_second": clips / per_run,
+        "peak_rss_mb": rss.peak / 2**20,
+    }
+
+
+def wave_cases(y, sr, backend):
+    pipeline = AudioAugmentationPipeline(sr, backend=backend)
+    data = y.astype(np.float64)
+    for method in pipeline.augmenters:
+        yield f"wave/{backend}/{method}", lambda method=method: pipeline.augment(data, method)
+
+
+def spec_cases(y, sr, n_mels):
+    pipeline = SpectrogramAugmentationPipeline(sr=sr)
+    log_mel, _ = SpectrogramInverter(sr, n_mels=n_mels).analyze(y)
+    for method in pipeline.methods:
+        yield f"spec/{method}", lambda method=method: pipeline.augment(log_mel, method)
+
+
+def feature_cases(y, sr, n_mels, n_iter):
+    griffin_lim = SpectrogramInverter(sr, n_mels=n_mels, mode="griffin_lim", n_iter=n_iter)
+    phase = SpectrogramInverter(sr, n_mels=n_mels, mode="phase")
+    log_mel, _ = griffin_lim.analyze(y)
+    _, stft = phase.analyze(y)
+    yield "features/mel_extraction", lambda: griffin_lim.analyze(y)
+    yield f"features/invert_griffin_lim_{n_iter}", lambda: griffin_lim.invert(log_mel, log_mel, length=len(y))
+    yield "features/invert_phase", lambda: phase.invert(log_mel, log_mel, stft, length=len(y))
+
+
+def batch_cases(y, sr, n_mels, n_iter, batch_size=8):
+    """The feature cases on a length-bucketed batch of batch_size copies of the clip."""
+    griffin_lim = SpectrogramInverter(sr, n_mels=n_mels, mode="griffin_lim", n_iter=n_iter)
+    phase = SpectrogramInverter(sr, n_mels=n_mels, mode="phase")
+    ys = [np.roll(y, i * 997) for i in range(batch_size)]
+    lengths = [len(y)] * batch_size
+    features = phase.analyze_batch(ys)
+    log_mels = [log_mel for log_mel, _ in features]
+    stfts = [stft for _, stft in features]
+    yield f"features/mel_extraction_batch{batch_size}", lambda: griffin_lim.analyze_batch(ys)
+    yield (f"features/invert_griffin_lim_{n_iter}_batch{batch_size}",
+           lambda: griffin_lim.invert_batch(log_mels, lengths=lengths, seeds=range(batch_size)))
+    yield f"features/invert_phase_batch{batch_size}", lambda: phase.invert_batch(log_mels, log_mels, stfts, lengths)
+
+
+def e2e_cases(y, sr, clips, workdir, backends, inversion, n_iter):
+    wav_dir = Path(workdir) / "wavs"
+    wav_dir.mkdir(parents=True, exist_ok=True)
+    metadata = Path(workdir) / "metadata.txt"
+    with open(metadata, "w", encoding="utf-8") as f:
+        for i in range(clips):
+            path = wav_dir / f"clip_{i}.wav"
+            sf.write(path, np.roll(y, i * 997), sr, subtype="PCM_16")
+            f.write(f"{path}|synthetic clip {i}\n")
+
+    # Both runs make two outputs per clip.
+    for backend in backends:
+        wave = Augmentation(metadata, Path(workdir) / f"wave_{backend}", sr=sr, backend=backend)
+        yield f"e2e/Augmentation/{backend}", lambda wave=wave: _quiet(wave.augment, 100, ["noise", "speed"], seed=0)
+    spec = SpectrogramAugmentation(metadata, Path(workdir) / "spec", sr=sr, inversion=inversion, n_iter=n_iter)
+    yield (f"e2e/SpectrogramAugmentation/{inversion}",
+           lambda: _quiet(spec.augment, 100, ["time_mask", "freq_mask"], seed=0))
+    yield (f"e2e/SpectrogramAugmentation/{inversion}/batched",
+           lambda: _quiet(spec.augment, 100, ["time_mask", "freq_mask"], seed=0, batch_size=clips))
+
+
+def _quiet(fn, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn(*args, **kwargs)
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import librosa
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "librosa": librosa.__version__,
+    }
+
+
+def run(durations, groups, backends, only, sr=16000, n_mels=80, n_iter=32, inversion="griffin_lim", e2e_clips=4,
+        min_time=1.0, max_repeats=20):
+    results = []
+    print(f"{'case':<46} {'sec':>6} {'x realtime':>11} {'clips/s':>9} {'peak RSS MB':>12}")
+    for i, seconds in enumerate(sorted(durations)):
+        y = synthetic_speech(seconds, sr)
+        with tempfile.TemporaryDirectory() as workdir:
+            cases = []
+            if "wave" in groups:
+                for backend in backends:
+                    cases += [(name, fn, 1) for name, fn in wave_cases(y, sr, backend)]
+            if "spec" in groups:
+                cases += [(name, fn, 1) for name, fn in spec_cases(y, sr, n_mels)]
+            if "features" in groups:
+                cases += [(name, fn, 1) for name, fn in feature_cases(y, sr, n_mels, n_iter)]
+                # A batch of hour-scale clips would need gigabytes of padded STFT.
+                if seconds <= 60:
+                    cases += [(name, fn, 8) for name, fn in batch_cases(y, sr, n_mels, n_iter)]
+            if "e2e" in groups:
+                cases += [(name, fn, 2 * e2e_clips)
+                          for name, fn in e2e_cases(y, sr, e2e_clips, workdir, backends, inversion, n_iter)]
+
+            for name, fn, clips in cases:
+                if only and not any(pattern in name for pattern in only):
+                    continue
+                np.random.seed(0)
+                record = {"case": name, "seconds": seconds}
+                # One-off start-up costs are paid on the shortest clips, so longer ones time the steady state.
+                record.update(measure(fn, seconds * clips, clips=clips, min_time=min_time, max_repeats=max_repeats,
+                                      warmup=i == 0))
+                results.append(record)
+                print(f"{name:<46} {seconds:>6g} {record['realtime_factor']:>11.1f} "
+                      f"{record['clips_per_second']:>9.2f} {record['peak_rss_mb']:>12.1f}")
+    return results
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(r["case"], r["seconds"]): r for r in baseline["results"]}
+    print(f"\nCompared with {baseline_path} (commit {baseline['environment'].get('commit')}):")
+    print(f"{'case':<46} {'sec':>6} {'speed ratio':>12} {'RSS ratio':>10}")
+    for record in results:
+        old = previous.get((record["case"], record["seconds"]))
+        if old is None:
+            continue
+        speed = record["realtime_factor"] / old["realtime_factor"]
+        memory = record["peak_rss_mb"] / old["peak_rss_mb"]
+        print(f"{record['case']:<46} {record['seconds']:>6g} {speed:>11.2f}x {memory:>9.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", nargs="+", type=float, default=[1, 10, 60, 600])
+    parser.add_argument("--groups", nargs="+", choices=GROUPS, default=list(GROUPS))
+    parser.add_argument("--backends", nargs="+", choices=("nlpaug", "numpy"), default=["nlpaug", "numpy"])
+    parser.add_argument("--only", nargs="+", help="run only cases whose name contains one of these strings")
+    parser.add_argument("--n-iter", type=int, default=32, help="Griffin-Lim iterations")
+    parser.add_argument("--inversion", choices=("griffin_lim", "phase"), default="griffin_lim",
+                        help="inversion used by the end-to-end spectrogram run")
+    parser.add_argument("--e2e-clips", type=int, default=4)
+    parser.add_argument("--min-time", type=float, default=1.0, help="repeat each case for at least this many seconds")
+    parser.add_argument("--max-repeats", type=int, default=20)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args(argv)
+
+    results = run(args.durations, args.groups, args.backends, args.only, n_iter=args.n_iter, inversion=args.inversion,
+                  e2e_clips=args.e2e_clips, min_time=args.min_time, max_repeats=args.max_repeats)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Throughput of the nlpaug and native NumPy waveform backends, in seconds of audio per second
+Run from the repository root: python -m benchmarks.wave_backend_benchmark
+"""
+
+import argparse
+import time
+import numpy as np
+from src.wave_augmentation.pipeline import AudioAugmentationPipeline
+from benchmarks.inversion_benchmark import synthetic_speech
+
+
+def throughput(fn, seconds, repeats):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return seconds * repeats / (time.perf_counter() - start)
+
+
+def run(seconds, methods, repeats, batch_size, sr=16000):
+    y = synthetic_speech(seconds, sr).astype(np.float64)
+    pipelines = {backend: AudioAugmentationPipeline(sr, backend=backend) for backend in ("nlpaug", "numpy")}
+
+    batch = np.tile(y.astype(np.float32), (batch_size, 1))
+    lengths = np.full(batch_size, len(y))
+
+    print(f"{'method':<10} {'nlpaug':>12} {'numpy':>12} {'numpy batch':>12} {'speedup':>8}   (audio sec / sec)")
+    for method in methods:
+        np.random.seed(0)
+        base = throughput(lambda: pipelines["nlpaug"].augment(y, method), seconds, repeats)
+        native = throughput(lambda: pipelines["numpy"].augment(y, method), seconds, repeats)
+        batched = throughput(
+            lambda: pipelines["numpy"].augment_batch(batch, lengths, method), seconds * batch_size, repeats
+        )
+        print(f"{method:<10} {base:>12.1f} {native:>12.1f} {batched:>12.1f} {native / base:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--methods", nargs="+", default=["loudness", "noise", "shift", "mask", "crop", "speed", "pitch"])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=16)
+    args = parser.parse_args()
+    run(args.seconds, args.methods, args.repeats, args.batch_size)
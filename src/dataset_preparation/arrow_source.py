@@ -0,0 +1,119 @@
+"""
+Direct augmentation from a locally cached HuggingFace/Arrow dataset, without exporting WAVs
+Author: Ye Bhone Lin
+
+    source = ArrowAudioSource("mig_burmese", split="test")   # a save_to_disk directory or an .arrow file
+    HF_Augmentation(None, "output_of_aug", source=source).augment(10, ["noise", "pitch"])
+
+Clips are named like the WAVs AudioTSVWriter would have written (same duplicate handling),
+so outputs and metadata look the same as after an export. Audio is decoded from the
+memory-mapped Arrow table only when a clip is augmented, in whichever process does the work.
+"""
+
+import hashlib
+import os
+from functools import lru_cache
+
+from .data_format_to_aug import _decode, unique_filename
+
+
+@lru_cache(maxsize=None)
+def _open_dataset(dataset_path, split, audio_column):
+    import datasets
+
+    if dataset_path.endswith(".arrow"):
+        ds = datasets.Dataset.from_file(dataset_path)
+    else:
+        ds = datasets.load_from_disk(dataset_path)
+    if isinstance(ds, datasets.DatasetDict):
+        if split is None:
+            raise ValueError(f"{dataset_path} has splits {list(ds)}; pass split=")
+        ds = ds[split]
+    # Undecoded, the column holds {"bytes", "path"} whatever the datasets version, and the
+    # clip is decoded the same way AudioTSVWriter decodes it.
+    return ds, ds.select_columns([audio_column]).cast_column(audio_column, datasets.Audio(decode=False))
+
+
+def _fingerprint(ds):
+    """
+    The dataset's fingerprint. _fingerprint is private to datasets, so without it the
+    identity falls back to the cache files with their sizes and mtimes, or the row count.
+    """
+    fingerprint = getattr(ds, "_fingerprint", None)
+    if fingerprint is not None:
+        return fingerprint
+    files = []
+    for cache_file in ds.cache_files:
+        stat = os.stat(cache_file["filename"])
+        files.append((cache_file["filename"], stat.st_size, stat.st_mtime_ns))
+    return hashlib.sha1(repr(files or ds.num_rows).encode()).hexdigest()[:16]
+
+
+class _Entries(list):
+    """The (clip name, text) rows of an ArrowAudioSource."""
+
+    def durations(self):
+        # Called by sample_entries for stratify="duration" (see src/utils/manifest.py).
+        raise ValueError("stratify='duration' is not supported for an ArrowAudioSource, whose clips are not "
+                         "files; stratify by a column instead")
+
+
+class ArrowClip:
+    """
+    One example of an Arrow dataset, standing in for a WAV path in the augmentation
+    pipelines: it has a .name, exists(), and read() returning (audio, sr) like sf.read.
+    Only the dataset location and row index are pickled, so it is cheap to send to workers.
+    """
+
+    def __init__(self, dataset_path, split, audio_column, index, name):
+        self.dataset_path = dataset_path
+        self.split = split
+        self.audio_column = audio_column
+        self.index = index
+        self.name = name
+
+    def __str__(self):
+        return f"{self.dataset_path}::{self.name}"
+
+    def exists(self):
+        return True
+
+    def identity(self):
+        """Stable identity for caches: the dataset fingerprint changes when its contents do."""
+        ds, _ = _open_dataset(self.dataset_path, self.split, self.audio_column)
+        return f"{self}|{_fingerprint(ds)}"
+
+    def read(self):
+        _, audio_ds = _open_dataset(self.dataset_path, self.split, self.audio_column)
+        audio = audio_ds[self.index][self.audio_column]
+        data = audio["bytes"]
+        if data is None:
+            with open(audio["path"], "rb") as f:
+                data = f.read()
+        return _decode(data, mono=False)
+
+
+class ArrowAudioSource:
+    def __init__(self, dataset_path, split=None, audio_column="audio", text_column="prompt"):
+        self.dataset_path = str(dataset_path)
+        self.split = split
+        self.audio_column = audio_column
+
+        ds, _ = _open_dataset(self.dataset_path, split, audio_column)
+        # The original paths are a child of the audio struct column; reading them chunk by
+        # chunk never touches (or copies) the audio bytes.
+        column = ds.data.column(audio_column)
+        paths = [path for chunk in column.chunks for path in chunk.field("path").to_pylist()]
+        texts = ds[text_column]
+
+        taken = set()
+        self.names = [unique_filename(path, i, taken) for i, path in enumerate(paths)]
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.texts = [text.replace("\t", " ").replace("\n", " ") for text in texts]
+
+    def entries(self):
+        """(clip name, text) rows, in the same shape as the rows of an exported TSV."""
+        return _Entries([name, text] for name, text in zip(self.names, self.texts))
+
+    def clip(self, name):
+        return ArrowClip(self.dataset_path, self.split, self.audio_column, self.index[name], name)
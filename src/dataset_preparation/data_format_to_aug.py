@@ -6,10 +6,102 @@ Date: 21st Nov 2025
 
 
 import os
+import io
 import csv
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import soundfile as sf
 
 
+def unique_filename(original_path, index, taken):
+    """
+    The output file name for example `index`: the basename of its original path, or
+    audio_{index}.wav without one. A basename that is already in `taken` gets _{index}
+    before its extension instead of overwriting the earlier file. Adds the name to taken.
+    """
+    filename = os.path.basename(original_path) if original_path else f"audio_{index}.wav"
+    if filename in taken:
+        stem, ext = os.path.splitext(filename)
+        filename = f"{stem}_{index}{ext}"
+        suffix = 1
+        while filename in taken:
+            filename = f"{stem}_{index}_{suffix}{ext}"
+            suffix += 1
+    taken.add(filename)
+    return filename
+
+
+def _decode(data, mono):
+    """Decode encoded audio bytes to (float array, sr), with librosa for formats libsndfile cannot read."""
+    try:
+        y, sr = sf.read(io.BytesIO(data))
+    except RuntimeError:
+        import librosa
+        y, sr = librosa.load(io.BytesIO(data), sr=None, mono=False)
+        y = y.T
+    if mono and y.ndim == 2:
+        y = y.mean(axis=1)
+    return y, sr
+
+
+def _export_clip(filepath, audio, target_sr=None, mono=False):
+    """
+    Write one example's audio to filepath and return None, or an error message.
+
+    Decoded audio ({"array", "sampling_rate"}) is encoded as before. Undecoded audio
+    ({"bytes", "path"}) is copied byte for byte when it already has the right container,
+    sample rate and channel layout, and is decoded (and resampled to target_sr) otherwise.
+    The file is written under a temporary name and renamed, so a file that exists is complete.
+    """
+    stem, ext = os.path.splitext(filepath)
+    tmp_path = f"{stem}.{os.getpid()}-{threading.get_ident()}.part{ext}"
+    try:
+        if audio.get("array") is not None:
+            sf.write(tmp_path, audio["array"], audio["sampling_rate"])
+        else:
+            data = audio.get("bytes")
+            if data is None:
+                with open(audio["path"], "rb") as f:
+                    data = f.read()
+            try:
+                info = sf.info(io.BytesIO(data))
+            except RuntimeError:
+                info = None
+            if (info is not None and info.format == ext[1:].upper()
+                    and target_sr in (None, info.samplerate) and not (mono and info.channels > 1)):
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+            else:
+                y, sr = _decode(data, mono)
+                if target_sr is not None and sr != target_sr:
+                    from ..utils.audio_io import resample
+                    y = resample(y, sr, target_sr, axis=0)
+                    sr = target_sr
+                sf.write(tmp_path, y, sr)
+        os.replace(tmp_path, filepath)
+        return None
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return f"{type(e).__name__}: {e}"
+
+
+def _batches(split, batch_size):
+    """Yield lists of examples; HuggingFace datasets are read a whole batch at a time."""
+    if hasattr(split, "iter"):
+        for batch in split.iter(batch_size=batch_size):
+            yield [dict(zip(batch, values)) for values in zip(*batch.values())]
+        return
+    examples = iter(split)
+    while True:
+        batch = list(itertools.islice(examples, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
 class AudioTSVWriter:
     def __init__(self, output_dir="audio_files", tsv_path="metadata.tsv"):
         self.output_dir = output_dir
@@ -21,32 +113,73 @@ class AudioTSVWriter:
         """Removes tabs/newlines to avoid breaking TSV format."""
         return text.replace("\t", " ").replace("\n", " ")
 
-    def write_split(self, split):
+    def write_split(self, split, num_workers=1, batch_size=256, skip_existing=False, executor="thread"):
         """
         Convert a HuggingFace dataset split into:
         - Saved WAV files
         - TSV metadata file
-        """
 
-        with open(self.tsv_path, "w", encoding="utf-8", newline="") as f:
-            writer = csv.writer(f, delimiter="\t")
-            writer.writerow(["audio", "prompt"])
+        Examples are read batch_size at a time and written by a pool of num_workers
+        threads (executor="thread") or processes (executor="process"). For a
+        HuggingFace Dataset, the audio column is read undecoded and each worker decodes
+        (or directly copies) its own clips. skip_existing=True keeps files that an
+        earlier export already wrote. Repeated basenames get the row index appended
+        (see unique_filename) instead of overwriting each other.
+        """
+        target_sr, mono = None, False
+        if hasattr(split, "cast_column"):
+            from datasets import Audio
+            feature = split.features["audio"]
+            target_sr = feature.sampling_rate
+            mono = getattr(feature, "mono", False)
+            split = split.cast_column("audio", Audio(decode=False))
 
-            for i, example in enumerate(split):
-                audio_info = example["audio"]
-                prompt = self._sanitize_text(example["prompt"])
+        pool = None
+        if num_workers > 1:
+            from ..utils.audio_io import preload_scipy
+            preload_scipy()
+            pool_cls = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+            pool = pool_cls(max_workers=num_workers)
 
-                original_filename = audio_info.get("path")
-                if original_filename:
-                    filename = os.path.basename(original_filename)
-                else:
-                    filename = f"audio_{i}.wav"
+        taken, index = set(), 0
+        try:
+            with open(self.tsv_path, "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f, delimiter="\t")
+                writer.writerow(["audio", "prompt"])
 
-                filepath = os.path.join(self.output_dir, filename)
+                # Two batches are in flight: one being written while the next is read.
+                pending = deque()
+                for batch in _batches(split, batch_size):
+                    rows, results = [], []
+                    for example in batch:
+                        audio_info = example["audio"]
+                        filename = unique_filename(audio_info.get("path"), index, taken)
+                        index += 1
+                        filepath = os.path.join(self.output_dir, filename)
+                        rows.append([filepath, self._sanitize_text(example["prompt"])])
 
-                sf.write(filepath, audio_info["array"], audio_info["sampling_rate"])
+                        if skip_existing and os.path.exists(filepath):
+                            results.append(None)
+                        elif pool is None:
+                            results.append(_export_clip(filepath, audio_info, target_sr, mono))
+                        else:
+                            results.append(pool.submit(_export_clip, filepath, audio_info, target_sr, mono))
+                    pending.append((rows, results))
+                    if len(pending) >= 2:
+                        self._write_rows(writer, *pending.popleft())
+                while pending:
+                    self._write_rows(writer, *pending.popleft())
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
 
-                writer.writerow([filepath, prompt])
+    def _write_rows(self, writer, rows, results):
+        for row, result in zip(rows, results):
+            error = result.result() if hasattr(result, "result") else result
+            if error is not None:
+                print(f"Warning: failed to export {row[0]}: {error}")
+                continue
+            writer.writerow(row)
 
 #writer = AudioTSVWriter(
 #    output_dir="audio_files",
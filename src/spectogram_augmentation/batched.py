@@ -0,0 +1,206 @@
+"""
+Batched spectrogram augmentation over padded (B, n_mels, T) stacks
+Author: Ye Bhone Lin
+
+Every kernel takes a padded stack of log-mel spectrograms plus the number of valid frames
+of each item, draws its random parameters for the whole batch at once with the same
+distributions as the per-item functions in spectogram_aug_pipeline.py, and applies them
+with broadcasting and fancy indexing. Padding frames (t >= length) are left untouched.
+"""
+
+import numpy as np
+
+
+def pad_batch(mels, pad_value=0.0):
+    """Stack a list of (n_mels, T_i) spectrograms into (B, n_mels, max T) plus lengths."""
+    lengths = np.array([mel.shape[1] for mel in mels], dtype=np.int64)
+    batch = np.full((len(mels), mels[0].shape[0], lengths.max()), pad_value, dtype=mels[0].dtype)
+    for i, mel in enumerate(mels):
+        batch[i, :, :mel.shape[1]] = mel
+    return batch, lengths
+
+
+def unpad_batch(batch, lengths):
+    return [batch[i, :, :length] for i, length in enumerate(lengths)]
+
+
+def _valid_frames(batch, lengths):
+    return np.arange(batch.shape[2])[None, :] < np.asarray(lengths)[:, None]
+
+
+def _gather(batch, mel_index, frame_index):
+    """out[b, m, t] = batch[b, mel_index[b, m, t], frame_index[b, m, t]] (indices broadcast)."""
+    b = np.arange(batch.shape[0])[:, None, None]
+    return batch[b, mel_index, frame_index]
+
+
+def _frame_index(batch, lengths, source):
+    """Read valid frames from `source` (B, T) and leave padding frames where they are."""
+    frames = np.arange(batch.shape[2])[None, :]
+    source = np.where(_valid_frames(batch, lengths), source, frames)
+    return np.arange(batch.shape[1])[None, :, None], source[:, None, :]
+
+
+def batch_time_mask(batch, lengths, width=30):
+    lengths = np.asarray(lengths)
+    t = np.random.randint(0, width, size=len(lengths))
+    t0 = np.random.randint(0, np.maximum(1, lengths - t))
+    frames = np.arange(batch.shape[2])[None, :]
+    mask = (frames >= t0[:, None]) & (frames < (t0 + t)[:, None]) & _valid_frames(batch, lengths)
+    return np.where(mask[:, None, :], 0, batch)
+
+
+def batch_freq_mask(batch, lengths, width=15):
+    n_mels = batch.shape[1]
+    f = np.random.randint(0, width, size=batch.shape[0])
+    f0 = np.random.randint(0, np.maximum(1, n_mels - f))
+    bins = np.arange(n_mels)[None, :]
+    mask = (bins >= f0[:, None]) & (bins < (f0 + f)[:, None])
+    mask = mask[:, :, None] & _valid_frames(batch, lengths)[:, None, :]
+    return np.where(mask, 0, batch)
+
+
+def batch_spec_augment(batch, lengths, time_mask_width=30, freq_mask_width=15):
+    return batch_freq_mask(batch_time_mask(batch, lengths, time_mask_width), lengths, freq_mask_width)
+
+
+def batch_time_warp(batch, lengths, max_warp=5):
+    # Integer shift with edge replication, as scipy.ndimage.shift(mode='nearest') does.
+    lengths = np.asarray(lengths)
+    shift = np.random.randint(-max_warp, max_warp, size=len(lengths))
+    frames = np.arange(batch.shape[2])[None, :]
+    source = np.clip(frames - shift[:, None], 0, lengths[:, None] - 1)
+    return _gather(batch, *_frame_index(batch, lengths, source))
+
+
+def batch_add_noise(batch, lengths, level=0.01):
+    # float32 noise drawn directly, like add_noise.
+    rng = np.random.default_rng(np.random.randint(2**31))
+    noise = rng.standard_normal(batch.shape, dtype=np.float32)
+    noise *= level
+    noise *= _valid_frames(batch, lengths)[:, None, :]
+    return batch + noise
+
+
+def batch_time_shift(batch, lengths, max_shift=10):
+    lengths = np.asarray(lengths)
+    shift = np.random.randint(-max_shift, max_shift, size=len(lengths))
+    frames = np.arange(batch.shape[2])[None, :]
+    source = (frames - shift[:, None]) % lengths[:, None]
+    return _gather(batch, *_frame_index(batch, lengths, source))
+
+
+def batch_freq_shift(batch, lengths, max_shift=5):
+    n_mels = batch.shape[1]
+    shift = np.random.randint(-max_shift, max_shift, size=batch.shape[0])
+    source = (np.arange(n_mels)[None, :] - shift[:, None]) % n_mels
+    frames = np.arange(batch.shape[2])[None, None, :]
+    out = _gather(batch, source[:, :, None], frames)
+    return np.where(_valid_frames(batch, lengths)[:, None, :], out, batch)
+
+
+def _linear_taps(out_index, size, new_size, offset):
+    """
+    Source positions and weights for bilinear resizing `size` -> `new_size` (cv2 INTER_LINEAR
+    pixel centres), read at positions out_index + offset of the resized axis. Positions that
+    fall outside the resized axis are marked invalid (they become zero padding).
+    """
+    resized = out_index + offset
+    valid = (resized >= 0) & (resized < new_size)
+    x = (resized + 0.5) * (size / new_size) - 0.5
+    x0 = np.floor(x)
+    frac = x - x0
+    frac = np.where((x0 < 0) | (x0 >= size - 1), 0.0, frac)
+    x0 = np.clip(x0, 0, size - 1).astype(np.int64)
+    x1 = np.minimum(x0 + 1, size - 1)
+    return x0, x1, frac, valid
+
+
+def batch_resize_crop(batch, lengths, scale_range=(0.8, 1.2)):
+    lengths = np.asarray(lengths)
+    n_mels = batch.shape[1]
+    scale = np.random.uniform(*scale_range, size=len(lengths))
+    new_mels = np.maximum(1, (n_mels * scale).astype(np.int64))
+    new_frames = np.maximum(1, (lengths * scale).astype(np.int64))
+
+    # Centre crop when upscaling, centre pad when downscaling.
+    grow = scale >= 1.0
+    mel_offset = np.where(grow, (new_mels - n_mels) // 2, -((n_mels - new_mels) // 2))
+    frame_offset = np.where(grow, (new_frames - lengths) // 2, -((lengths - new_frames) // 2))
+
+    m0, m1, fm, valid_m = _linear_taps(np.arange(n_mels)[None, :], n_mels, new_mels[:, None], mel_offset[:, None])
+    t0, t1, ft, valid_t = _linear_taps(
+        np.arange(batch.shape[2])[None, :], lengths[:, None], new_frames[:, None], frame_offset[:, None]
+    )
+    m0, m1, fm = m0[:, :, None], m1[:, :, None], fm[:, :, None]
+    t0, t1, ft = t0[:, None, :], t1[:, None, :], ft[:, None, :]
+
+    top = _gather(batch, m0, t0) * (1 - ft) + _gather(batch, m0, t1) * ft
+    bottom = _gather(batch, m1, t0) * (1 - ft) + _gather(batch, m1, t1) * ft
+    out = top * (1 - fm) + bottom * fm
+
+    out = np.where(valid_m[:, :, None] & valid_t[:, None, :], out, 0).astype(batch.dtype)
+    return np.where(_valid_frames(batch, lengths)[:, None, :], out, batch)
+
+
+def batch_dynamic_range_compression(batch, lengths, C=1, clip_val=1e-5):
+    out = np.log10(C * np.maximum(batch, clip_val))
+    return np.where(_valid_frames(batch, lengths)[:, None, :], out, batch)
+
+
+def batch_band_drop(batch, lengths, prob=0.3, num_masks=2, max_width=8):
+    size = batch.shape[0]
+    n_mels = batch.shape[1]
+    apply = ~(np.random.rand(size) > prob)
+    width = np.random.randint(1, max_width + 1, size=(size, num_masks))
+    start = np.random.randint(0, n_mels - width)
+
+    bins = np.arange(n_mels)[None, None, :]
+    dropped = ((bins >= start[:, :, None]) & (bins < (start + width)[:, :, None])).any(axis=1)
+    mask = (dropped & apply[:, None])[:, :, None] & _valid_frames(batch, lengths)[:, None, :]
+    return np.where(mask, 0, batch)
+
+
+def batch_patch_swap(batch, lengths, patch_size=(10, 10)):
+    lengths = np.asarray(lengths)
+    size, h = batch.shape[0], batch.shape[1]
+    ph, pw = patch_size
+    if h < ph:
+        return batch
+    swap = lengths >= pw
+    m1 = np.random.randint(0, max(1, h - ph), size=size)
+    n1 = np.random.randint(0, np.maximum(1, lengths - pw))
+    m2 = np.random.randint(0, max(1, h - ph), size=size)
+    n2 = np.random.randint(0, np.maximum(1, lengths - pw))
+
+    m = np.arange(h)[None, :, None]
+    t = np.arange(batch.shape[2])[None, None, :]
+
+    def inside(m_start, n_start):
+        return (
+            (m >= m_start[:, None, None]) & (m < (m_start + ph)[:, None, None])
+            & (t >= n_start[:, None, None]) & (t < (n_start + pw)[:, None, None])
+            & swap[:, None, None]
+        )
+
+    # Patch 2 is written last, so it wins where the two patches overlap.
+    in_1, in_2 = inside(m1, n1), inside(m2, n2)
+    dm, dn = (m2 - m1)[:, None, None], (n2 - n1)[:, None, None]
+    mel_index = np.where(in_2, m - dm, np.where(in_1, m + dm, m))
+    frame_index = np.where(in_2, t - dn, np.where(in_1, t + dn, t))
+    return _gather(batch, mel_index, frame_index)
+
+
+BATCH_METHODS = {
+    'time_mask': batch_time_mask,
+    'freq_mask': batch_freq_mask,
+    'spec_augment': batch_spec_augment,
+    'time_warp': batch_time_warp,
+    'add_noise': batch_add_noise,
+    'time_shift': batch_time_shift,
+    'freq_shift': batch_freq_shift,
+    'resize_crop': batch_resize_crop,
+    'dynamic_range_compression': batch_dynamic_range_compression,
+    'band_drop': batch_band_drop,
+    'patch_swap': batch_patch_swap,
+}
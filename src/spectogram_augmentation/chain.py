@@ -0,0 +1,367 @@
+"""
+Fused wave-then-spectrogram augmentation chains, written in a single pass
+Author: Ye Bhone Lin
+
+    chains = ["pitch -> time_mask", "pitch -> freq_mask", "noise -> spec_augment", "speed"]
+    ChainAugmentation("metadata.txt", "output_of_chains", inversion="phase").augment(10, chains, seed=1)
+
+A chain is a list of steps: wave methods (AudioAugmentationPipeline) first, then
+spectrogram methods (SpectrogramAugmentationPipeline). Each clip is decoded once, the wave
+steps run on the in-memory float32 array, the log-mel is extracted from the result, the
+spectrogram steps run on it, and the inverted audio is written once, to
+output_dir/<step+step>/. This replaces running Augmentation and then
+SpecAugmentationAfterWav on its 16-bit WAVs.
+
+The chains of a clip form a prefix tree: a shared prefix (the "pitch" step and its mel in
+the example above) is computed once for all chains that start with it. Every step is
+seeded from the run seed, the clip and the chain up to that step, so a prefix gives the
+same result in every chain, and a one-step chain matches the output of the corresponding
+wave or spectrogram engine.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+import random
+import numpy as np
+
+from .feature_cache import load_features, open_cache
+from .inversion import SpectrogramInverter
+from .spectogram_aug_pipeline import SpectrogramAugmentationPipeline
+from ..wave_augmentation.pipeline import AudioAugmentationPipeline, normalize_peak
+from ..utils.audio_io import load_audio, preload_scipy
+from ..utils.metrics import Metrics, job_times
+from ..utils.outputs import make_output
+from ..utils.manifest import ManifestIndex
+from ..utils.run_state import select_clips
+from ..utils.seeds import derive_seed
+from ..utils.sharding import write_metadata
+from ..utils.stages import StagedRun
+
+
+def parse_chain(chain, wave_methods, spec_methods):
+    """
+    The steps of a chain given as "pitch -> time_mask", "pitch+time_mask" or a list of
+    method names. Wave methods must come before spectrogram methods.
+    """
+    if isinstance(chain, str):
+        chain = chain.replace("->", "+").split("+")
+    steps = tuple(step.strip() for step in chain)
+    in_spec = False
+    for step in steps:
+        if step in spec_methods:
+            in_spec = True
+        elif step in wave_methods:
+            if in_spec:
+                raise ValueError(f"Wave step '{step}' after a spectrogram step in chain {'+'.join(steps)}")
+        else:
+            raise ValueError(f"Unknown chain step: {step}")
+    if not steps:
+        raise ValueError("Empty chain")
+    return steps
+
+
+def chain_name(steps):
+    """The name of a chain's output folder and files, e.g. "pitch+time_mask"."""
+    return "+".join(steps)
+
+
+class ChainRunner:
+    """
+    Runs the chains of one clip. Holds the wave and spectrogram pipelines and the inverter;
+    every worker process builds its own from the same parameters.
+    """
+
+    def __init__(self, sr=16000, n_mels=80, backend="nlpaug", inversion="griffin_lim", n_iter=32, momentum=0.99):
+        self.params = dict(sr=sr, n_mels=n_mels, backend=backend, inversion=inversion, n_iter=n_iter,
+                           momentum=momentum)
+        self.sr = sr
+        self.wave = AudioAugmentationPipeline(sr=sr, backend=backend)
+        self.spec = SpectrogramAugmentationPipeline(sr=sr)
+        self.inverter = SpectrogramInverter(sr, n_mels=n_mels, mode=inversion, n_iter=n_iter, momentum=momentum)
+
+    def parse(self, chain):
+        return parse_chain(chain, self.wave.augmenters, self.spec.methods)
+
+    def run(self, y, features, chains, seed_of, times):
+        """
+        Returns one (audio, error) pair per chain. y is the decoded clip, or None when every
+        chain is spectrogram-only and features = (log_mel, stft, length) came from the reader.
+        seed_of(prefix) gives the seed of the step that ends the prefix.
+        """
+        chains = [self.parse(chain) for chain in chains]
+        # Intermediate values of a prefix that other chains extend are kept until the clip is
+        # done; a leaf spectrogram is inverted right away, so it can live in the pool buffer.
+        shared = {chain[:i] for chain in chains for i in range(1, len(chain))}
+        nodes = {(): ("wave", y)} if y is not None else {}
+        mels = {(): features} if features is not None else {}
+
+        def mel(prefix):
+            if prefix not in mels:
+                _, audio = node(prefix)
+                with times("feature"):
+                    log_mel, stft = self.inverter.analyze(audio)
+                mels[prefix] = (log_mel, stft, len(audio))
+            return mels[prefix]
+
+        def node(prefix):
+            if prefix in nodes:
+                kind, value = nodes[prefix]
+                if kind == "error":
+                    raise value
+                return kind, value
+            step = prefix[-1]
+            try:
+                if step in self.wave.augmenters:
+                    _, audio = node(prefix[:-1])
+                    _seed(seed_of(prefix))
+                    with times(f"augment/{step}"):
+                        augmented = self.wave.augment(audio, step)
+                    with times("normalise"):
+                        nodes[prefix] = ("wave", normalize_peak(augmented, inplace=True))
+                else:
+                    parent = prefix[:-1]
+                    # The first spectrogram step starts from the mel of the wave steps before it.
+                    base = node(parent)[1] if parent and parent[-1] in self.spec.methods else mel(parent)[0]
+                    out = None if prefix in shared else self.spec.pool.get("augmented", base.shape, base.dtype)
+                    _seed(seed_of(prefix))
+                    with times(f"augment/{step}"):
+                        nodes[prefix] = ("spec", self.spec.augment(base, step, out=out))
+            except Exception as e:
+                nodes[prefix] = ("error", e)
+                raise
+            return nodes[prefix]
+
+        results = []
+        for steps in chains:
+            try:
+                kind, value = node(steps)
+                if kind == "wave":
+                    results.append((value, None))
+                    continue
+                # Inverted against the mel (and STFT) the spectrogram steps started from.
+                wave_prefix = tuple(step for step in steps if step in self.wave.augmenters)
+                log_mel, stft, length = mel(wave_prefix)
+                with times("inversion"):
+                    results.append((self.inverter.invert(value, log_mel, stft, length=length), None))
+            except Exception as e:
+                results.append((None, f"{type(e).__name__}: {e}"))
+        return results
+
+
+def _seed(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+_worker_runner = None
+
+
+def _init_worker(params):
+    global _worker_runner
+    _worker_runner = ChainRunner(**params)
+
+
+def _read_job(job, runner, cache, metrics):
+    """
+    Reader stage: the decoded clip when any chain has a wave step, otherwise the clip's
+    log-mel (from the cache when there is one). Returns ((y, features), error).
+    """
+    wav_path, outputs, _, _ = job
+    try:
+        if any(step in runner.wave.augmenters for chain, _ in outputs for step in runner.parse(chain)):
+            y, _ = load_audio(wav_path, runner.sr, times=metrics.times)
+            return (y, None), None
+        log_mel, stft, length = load_features(wav_path, runner.inverter, cache, times=metrics.times)
+        return (None, (np.asarray(log_mel), stft, length)), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def _compute_job(job, decoded, runner=None, timed=True):
+    """CPU stage: run every chain of the clip. Returns one (audio, error) pair per chain, plus the timings."""
+    wav_path, outputs, run_seed, clip = job
+    runner = runner or _worker_runner
+    times = job_times(timed)
+
+    decoded, error = decoded
+    if error is not None:
+        return [(None, error)] * len(outputs), None
+    y, features = decoded
+
+    def seed_of(prefix):
+        return derive_seed(run_seed, clip, chain_name(prefix))
+
+    results = runner.run(y, features, [chain for chain, _ in outputs], seed_of, times)
+    return results, times.snapshot()
+
+
+def _write_job(job, computed, output, sr, metrics, state=None):
+    """Writer stage: write every chain's audio once. Returns one (ref, error) pair per chain."""
+    wav_path, outputs, _, clip = job
+    computed, times = computed
+    metrics.times.merge(times)
+    results = []
+    for (chain, seed), (audio, error) in zip(outputs, computed):
+        ref = None
+        if error is None:
+            try:
+                ref = output.write(chain, wav_path.name, audio, sr, times=metrics.times)
+                if state is not None:
+                    state.record(clip, chain, seed, ref)
+            except Exception as e:
+                ref, error = None, f"{type(e).__name__}: {e}"
+        if error is not None:
+            metrics.failure(wav_path, chain, error)
+        else:
+            metrics.output(ref, wav_path, chain, len(audio) / sr)
+        results.append((ref, error))
+    return results
+
+
+def run_chain_augmentation(runner, clips, chains, output_dir, run_seed, sep="|", cache=None, output_format="wav",
+                           num_workers=1, readers=2, writers=2, queue_depth=16, state=None, source=None,
+                           metrics=None, shard=None):
+    """
+    Run every chain on every selected clip and write aug_metadata.txt, with the same
+    stages, seeding, resume, metrics and sharding as run_spec_augmentation. chains are chain names
+    ("pitch+time_mask"); outputs go to output_dir/<chain name>/.
+    """
+    metrics = metrics or Metrics()
+    sr = runner.sr
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output = make_output(output_format, output_dir, sr, prefix=f"{shard.shard_index:05d}-" if shard else "")
+
+    for chain in chains:
+        (output_dir / chain).mkdir(exist_ok=True)
+
+    jobs, selected, refs = [], [], {}
+    for wav_path_str, text in clips:
+        with metrics.times("resolve"):
+            wav_path = source.clip(wav_path_str) if source is not None else Path(wav_path_str).resolve()
+            exists = wav_path.exists()
+
+        if not exists:
+            metrics.warn(f"file not found: {wav_path}")
+            metrics.count("missing")
+            continue
+        selected.append((wav_path_str, wav_path, text))
+
+        outputs = []
+        for chain in chains:
+            seed = derive_seed(run_seed, wav_path_str, chain)
+            ref = state.completed_ref(wav_path_str, chain, seed) if state is not None else None
+            if ref is not None:
+                refs[(wav_path, chain)] = ref
+            else:
+                outputs.append((chain, seed))
+        if outputs:
+            jobs.append((wav_path, outputs, run_seed, wav_path_str))
+
+    total = sum(len(job[1]) for job in jobs)
+    if state is not None and metrics.verbosity >= 1:
+        print(f"Resuming: {len(refs)} outputs already complete, {total} to do")
+    metrics.start(total, skipped=len(refs))
+
+    read = partial(_read_job, runner=runner, cache=cache, metrics=metrics)
+    write = partial(_write_job, output=output, sr=sr, metrics=metrics, state=state)
+    stage_args = dict(readers=readers, writers=writers, queue_depth=queue_depth)
+    preload_scipy()
+    if num_workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker,
+                                 initargs=(runner.params,)) as executor:
+            compute = partial(_compute_job, timed=metrics.enabled)
+            run = StagedRun(read, compute, write, executor=executor, workers=num_workers, **stage_args)
+            try:
+                results = run.run(jobs)
+            except BaseException:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+    else:
+        compute = partial(_compute_job, runner=runner, timed=metrics.enabled)
+        results = StagedRun(read, compute, write, **stage_args).run(jobs)
+
+    if output_format == "shards":
+        output.close()
+
+    for (wav_path, outputs, _, _), clip_results in zip(jobs, results):
+        for (chain, _), (ref, error) in zip(outputs, clip_results):
+            if error is None:
+                refs[(wav_path, chain)] = ref
+
+    write_metadata(output_dir, chains, selected, refs, sep, run_seed=run_seed, shard=shard)
+
+    if cache is not None:
+        for name, value in cache.stats().items():
+            if name in ("hits", "misses", "evictions"):
+                metrics.count(f"feature_cache_{name}", value)
+    return metrics.finish()
+
+
+class ChainAugmentation:
+    def __init__(self, metadata_path, output_dir, sr=16000, n_mels=80, backend="nlpaug", inversion="griffin_lim",
+                 n_iter=32, momentum=0.99, cache_dir=None, cache_max_bytes=10 * 1024**3):
+        self.metadata_path = Path(metadata_path)
+        self.output_dir = Path(output_dir)
+        self.sr = sr
+        self.runner = ChainRunner(sr, n_mels=n_mels, backend=backend, inversion=inversion, n_iter=n_iter,
+                                  momentum=momentum)
+        self.cache = open_cache(cache_dir, self.runner.inverter, max_bytes=cache_max_bytes)
+
+        self.entries = ManifestIndex(metadata_path)
+
+    def augment(self, percent, chains, output_format="wav", seed=None, num_workers=1, readers=2, writers=2,
+                queue_depth=16, resume=False, metrics=None, stratify=None, shard_index=0,
+                num_shards=1):
+        """
+        chains: e.g. ["pitch -> time_mask", "noise -> spec_augment"] (see the module docstring).
+        The other arguments work as in SpectrogramAugmentation.augment. Returns the run summary.
+        """
+        chains = list(dict.fromkeys(chain_name(self.runner.parse(chain)) for chain in chains))
+        params = dict(self.runner.params, output_format=output_format)
+        run_seed, clips, chains, state, shard = select_clips(self.entries, percent, chains, self.output_dir, params,
+                                                             seed=seed, stratify=stratify, resume=resume,
+                                                             shard_index=shard_index, num_shards=num_shards)
+        return run_chain_augmentation(self.runner, clips, chains, self.output_dir, run_seed, sep="|",
+                                      cache=self.cache, output_format=output_format, num_workers=num_workers,
+                                      readers=readers, writers=writers, queue_depth=queue_depth, state=state,
+                                      metrics=metrics, shard=shard)
+
+
+class HF_ChainAugmentation:
+    def __init__(self, metadata_path, output_dir, sr=16000, n_mels=80, backend="nlpaug", inversion="griffin_lim",
+                 n_iter=32, momentum=0.99, cache_dir=None, cache_max_bytes=10 * 1024**3, source=None):
+        """
+        source: an ArrowAudioSource to augment a cached HuggingFace dataset directly, without
+        exporting WAVs first; metadata_path is then not used.
+        """
+        self.metadata_path = Path(metadata_path) if metadata_path is not None else None
+        self.output_dir = Path(output_dir)
+        self.sr = sr
+        self.runner = ChainRunner(sr, n_mels=n_mels, backend=backend, inversion=inversion, n_iter=n_iter,
+                                  momentum=momentum)
+        self.cache = open_cache(cache_dir, self.runner.inverter, max_bytes=cache_max_bytes)
+        self.source = source
+
+        if source is not None:
+            self.entries = source.entries()
+            return
+        self.entries = ManifestIndex(metadata_path, sep="\t", header=True)
+
+    def augment(self, percent, chains, output_format="wav", seed=None, num_workers=1, readers=2, writers=2,
+                queue_depth=16, resume=False, metrics=None, stratify=None, shard_index=0,
+                num_shards=1):
+        """
+        chains: e.g. ["pitch -> time_mask", "noise -> spec_augment"] (see the module docstring).
+        The other arguments work as in SpectrogramAugmentation.augment. Returns the run summary.
+        """
+        chains = list(dict.fromkeys(chain_name(self.runner.parse(chain)) for chain in chains))
+        params = dict(self.runner.params, output_format=output_format)
+        run_seed, clips, chains, state, shard = select_clips(self.entries, percent, chains, self.output_dir, params,
+                                                             seed=seed, stratify=stratify, resume=resume,
+                                                             shard_index=shard_index, num_shards=num_shards)
+        return run_chain_augmentation(self.runner, clips, chains, self.output_dir, run_seed, sep="\t",
+                                      cache=self.cache, output_format=output_format, num_workers=num_workers,
+                                      readers=readers, writers=writers, queue_depth=queue_depth, state=state,
+                                      source=self.source, metrics=metrics, shard=shard)
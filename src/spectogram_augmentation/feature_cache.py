@@ -0,0 +1,192 @@
+"""
+On-disk log-mel feature cache shared by the spectrogram pipelines
+Author: Ye Bhone Lin
+
+Entries are keyed by file identity (resolved path, mtime and size, or the dataset
+fingerprint for clips read from an Arrow dataset) plus every parameter that changes the
+features (sr, n_mels, n_fft, hop_length), stored as .npy files that are opened
+memory-mapped, and evicted least-recently-used once the cache grows past max_bytes.
+A small SQLite index keeps sizes, clip lengths and last-use times. One cache can be
+shared by the reader threads of a run; index access is serialised by a lock.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+import numpy as np
+
+from ..dataset_preparation.arrow_source import ArrowClip
+from ..utils.audio_io import load_audio
+from ..utils.metrics import NULL_TIMES
+
+
+def open_cache(cache_dir, inverter, max_bytes=10 * 1024**3):
+    """
+    The FeatureCache for cache_dir, or None without one. Phase inversion needs every clip's
+    STFT, which is not cached, so it gets a warning instead of a cache it would never use.
+    """
+    if not cache_dir:
+        return None
+    if inverter.mode == "phase":
+        print(f"Warning: cache_dir {cache_dir} is not used with phase inversion, which needs each clip's STFT")
+        return None
+    return FeatureCache(cache_dir, max_bytes=max_bytes)
+
+
+class FeatureCache:
+    def __init__(self, cache_dir, max_bytes=10 * 1024**3):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(str(self.cache_dir / "index.sqlite"), timeout=30, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS entries "
+            "(key TEXT PRIMARY KEY, bytes INTEGER, length INTEGER, last_used REAL)"
+        )
+        self.db.commit()
+
+    def key(self, wav_path, inverter):
+        if isinstance(wav_path, ArrowClip):
+            source = wav_path.identity()
+        else:
+            wav_path = Path(wav_path).resolve()
+            st = wav_path.stat()
+            source = f"{wav_path}|{st.st_mtime_ns}|{st.st_size}"
+        ident = f"{source}|{inverter.sr}|{inverter.n_mels}|{inverter.n_fft}|{inverter.hop_length}"
+        return hashlib.sha1(ident.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.npy"
+
+    def get(self, key):
+        """Returns (log_mel, length) with log_mel memory-mapped read-only, or None."""
+        path = self._path(key)
+        with self._lock:
+            row = self.db.execute("SELECT length FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or not path.exists():
+                self.misses += 1
+                return None
+            self.db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+            self.hits += 1
+        return np.load(path, mmap_mode="r"), row[0]
+
+    def put(self, key, log_mel, length):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(log_mel))
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries (key, bytes, length, last_used) VALUES (?, ?, ?, ?)",
+                (key, path.stat().st_size, length, time.time()),
+            )
+            self.db.commit()
+            self._evict()
+
+    def _evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(bytes), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.db.execute("SELECT key, bytes FROM entries ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._path(key).unlink(missing_ok=True)
+            self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+        self.db.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM entries").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+def load_features(wav_path, inverter, cache=None, times=NULL_TIMES):
+    """
+    Returns (log_mel, stft, length) for a clip, using the cache when one is given.
+    The phase inversion mode needs the clip's STFT, which is not cached, so it always
+    decodes and analyses the audio and bypasses the cache. Clips are decoded and resampled
+    by load_audio (src/utils/audio_io.py). `times` receives the decode, resample and feature
+    timings (see src/utils/metrics.py).
+    """
+    if cache is None or inverter.mode == "phase":
+        y, _ = load_audio(wav_path, inverter.sr, times=times)
+        with times("feature"):
+            log_mel, stft = inverter.analyze(y)
+        return log_mel, stft, len(y)
+
+    with times("cache_lookup"):
+        key = cache.key(wav_path, inverter)
+        cached = cache.get(key)
+    if cached is not None:
+        log_mel, length = cached
+        return log_mel, None, length
+
+    y, _ = load_audio(wav_path, inverter.sr, times=times)
+    with times("feature"):
+        log_mel, _ = inverter.analyze(y)
+    with times("cache_store"):
+        cache.put(key, log_mel, len(y))
+    return log_mel, None, len(y)
+
+
+def load_features_batch(wav_paths, inverter, cache=None, times=NULL_TIMES):
+    """
+    load_features() for a bucket of clips: cached clips come from the cache, the rest are
+    decoded one by one and analysed together with inverter.analyze_batch. Returns one
+    ((log_mel, stft, length), error) pair per clip, error being None or a message.
+    """
+    results = [None] * len(wav_paths)
+    keys, pending, audio = {}, [], []
+    for i, wav_path in enumerate(wav_paths):
+        try:
+            if cache is not None and inverter.mode != "phase":
+                with times("cache_lookup"):
+                    keys[i] = cache.key(wav_path, inverter)
+                    cached = cache.get(keys[i])
+                if cached is not None:
+                    log_mel, length = cached
+                    results[i] = (log_mel, None, length), None
+                    continue
+            y, _ = load_audio(wav_path, inverter.sr, times=times)
+        except Exception as e:
+            results[i] = None, f"{type(e).__name__}: {e}"
+            continue
+        pending.append(i)
+        audio.append(y)
+
+    if audio:
+        try:
+            with times("feature"):
+                features = inverter.analyze_batch(audio)
+        except Exception as e:
+            for i in pending:
+                results[i] = None, f"{type(e).__name__}: {e}"
+            return results
+        for i, y, (log_mel, stft) in zip(pending, audio, features):
+            if i in keys:
+                with times("cache_store"):
+                    cache.put(keys[i], log_mel, len(y))
+            results[i] = (log_mel, stft, len(y)), None
+    return results
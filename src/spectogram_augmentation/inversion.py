@@ -0,0 +1,221 @@
+"""
+Log-mel analysis and inversion back to audio for the spectrogram pipelines
+Author: Ye Bhone Lin
+"""
+
+from functools import lru_cache
+import numpy as np
+import librosa
+
+
+INVERSION_MODES = ("griffin_lim", "phase")
+
+
+@lru_cache(maxsize=None)
+def mel_basis(sr, n_fft, n_mels):
+    return librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels)
+
+
+class SpectrogramInverter:
+    """
+    Computes log-mel spectrograms and turns augmented log-mels back into audio.
+
+    mode="griffin_lim" estimates the phase with Griffin-Lim (n_iter iterations, momentum).
+    mode="phase" keeps the STFT phase of the original clip: the augmentation is turned into
+    a per-bin gain (augmented mel power / original mel power, spread back onto the STFT bins
+    through the mel filterbank) and the audio is rebuilt with a single inverse STFT.
+    """
+
+    def __init__(self, sr, n_mels=80, mode="griffin_lim", n_iter=32, momentum=0.99, n_fft=2048, hop_length=512):
+        if mode not in INVERSION_MODES:
+            raise ValueError(f"Unknown inversion mode: {mode}")
+        self.sr = sr
+        self.n_mels = n_mels
+        self.mode = mode
+        self.n_iter = n_iter
+        self.momentum = momentum
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+
+    def analyze(self, y):
+        """
+        Returns (log_mel, stft). stft is only kept for the phase mode, otherwise None.
+        """
+        stft = librosa.stft(y, n_fft=self.n_fft, hop_length=self.hop_length)
+        power = np.abs(stft) ** 2
+        log_mel = librosa.power_to_db(mel_basis(self.sr, self.n_fft, self.n_mels) @ power)
+        return log_mel, (stft if self.mode == "phase" else None)
+
+    def invert(self, aug_log_mel, log_mel=None, stft=None, length=None):
+        if self.mode == "phase":
+            return self._invert_phase(aug_log_mel, log_mel, stft, length)
+
+        mel_power = librosa.db_to_power(aug_log_mel)
+        magnitude = librosa.feature.inverse.mel_to_stft(mel_power, sr=self.sr, n_fft=self.n_fft)
+        # The initial phase is drawn from the (per-output seeded) global RNG, so it is reproducible.
+        return librosa.griffinlim(
+            magnitude, n_iter=self.n_iter, momentum=self.momentum,
+            hop_length=self.hop_length, n_fft=self.n_fft, length=length,
+            random_state=np.random.randint(2**31),
+        )
+
+    def _invert_phase(self, aug_log_mel, log_mel, stft, length):
+        if stft is None or log_mel is None:
+            raise ValueError("Phase inversion needs the original log-mel and STFT from analyze().")
+        if aug_log_mel.shape != log_mel.shape:
+            raise ValueError(f"Augmented spectrogram shape {aug_log_mel.shape} does not match {log_mel.shape}")
+
+        basis = mel_basis(self.sr, self.n_fft, self.n_mels)
+        target = basis.T @ librosa.db_to_power(aug_log_mel)
+        source = basis.T @ librosa.db_to_power(log_mel)
+        # Bins outside every mel filter have source == 0 and are passed through unchanged.
+        gain = np.ones_like(source)
+        np.divide(target, source, out=gain, where=source > 0)
+        return librosa.istft(stft * np.sqrt(gain), hop_length=self.hop_length, n_fft=self.n_fft, length=length)
+
+    # Batched analysis and inversion. The clips of a bucket are zero-padded to the longest
+    # one and framed, transformed and overlap-added as one (B, ...) array with scipy.fft,
+    # which transforms float32 frames in single precision (librosa's numpy FFT upcasts them
+    # to float64), so results match analyze()/invert() to float32 rounding. Frame t of a
+    # clip only sees its own samples and the zeros that centring pads with anyway; frame
+    # counts, dB clipping, window sums and lengths are applied per clip. Griffin-Lim feeds
+    # each iteration's rounding into the next, so its batched output drifts further from
+    # invert()'s (tens of int16 steps) than a single pass does.
+
+    def analyze_batch(self, ys):
+        """analyze() for a list of clips; returns one (log_mel, stft) pair per clip."""
+        lengths = [len(y) for y in ys]
+        batch = np.zeros((len(ys), max(lengths)), dtype=np.float32)
+        for i, y in enumerate(ys):
+            batch[i, :len(y)] = y
+        stft = self._stft_batch(batch)
+        power = np.abs(stft) ** 2
+        mel = mel_basis(self.sr, self.n_fft, self.n_mels) @ power
+
+        results = []
+        for i, length in enumerate(lengths):
+            frames = 1 + length // self.hop_length
+            log_mel = librosa.power_to_db(mel[i, :, :frames])
+            results.append((log_mel, stft[i, :, :frames] if self.mode == "phase" else None))
+        return results
+
+    def invert_batch(self, aug_log_mels, log_mels=None, stfts=None, lengths=None, seeds=None):
+        """
+        invert() for a list of clips with their lengths. For Griffin-Lim, seeds are the
+        initial-phase seeds (one per clip) that invert() would have drawn.
+        """
+        n_frames = max(mel.shape[1] for mel in aug_log_mels)
+        window_sums = [self._window_sum(mel.shape[1], length) for mel, length in zip(aug_log_mels, lengths)]
+        if self.mode == "phase":
+            for aug_log_mel, log_mel, stft in zip(aug_log_mels, log_mels, stfts):
+                if stft is None or log_mel is None:
+                    raise ValueError("Phase inversion needs the original log-mel and STFT from analyze().")
+                if aug_log_mel.shape != log_mel.shape:
+                    raise ValueError(f"Augmented spectrogram shape {aug_log_mel.shape} does not match {log_mel.shape}")
+            basis = mel_basis(self.sr, self.n_fft, self.n_mels)
+            target = basis.T @ librosa.db_to_power(_pad_frames(aug_log_mels, n_frames))
+            source = basis.T @ librosa.db_to_power(_pad_frames(log_mels, n_frames))
+            gain = np.ones_like(source)
+            np.divide(target, source, out=gain, where=source > 0)
+            spectra = _pad_frames(stfts, n_frames)
+            spectra *= np.sqrt(gain, out=gain)
+            return self._istft_batch(spectra, lengths, window_sums)
+
+        # mel_to_stft solves a per-clip NNLS problem; only the Griffin-Lim iterations are batched.
+        magnitudes = [librosa.feature.inverse.mel_to_stft(librosa.db_to_power(mel), sr=self.sr, n_fft=self.n_fft)
+                      for mel in aug_log_mels]
+        S = _pad_frames(magnitudes, n_frames)
+        angles = np.zeros(S.shape, dtype=np.complex64)
+        for i, (magnitude, seed) in enumerate(zip(magnitudes, seeds)):
+            rng = np.random.RandomState(seed=seed)
+            angles[i, :, :magnitude.shape[1]] = librosa.util.phasor(2 * np.pi * rng.random_sample(magnitude.shape))
+        return self._griffinlim_batch(S, angles, lengths, window_sums)
+
+    def _griffinlim_batch(self, S, angles, lengths, window_sums):
+        """librosa.griffinlim's fast Griffin-Lim over a padded (B, bins, frames) stack."""
+        eps = librosa.util.tiny(angles)
+        tprev = None
+        angles *= S
+        for _ in range(self.n_iter):
+            inverse = self._istft_batch(angles, lengths, window_sums, padded=True)
+            rebuilt = self._stft_batch(inverse)[..., :S.shape[-1]]
+            angles[:] = rebuilt
+            if tprev is not None:
+                angles -= (self.momentum / (1 + self.momentum)) * tprev
+            angles /= np.abs(angles) + eps
+            angles *= S
+            tprev = rebuilt
+        return self._istft_batch(angles, lengths, window_sums)
+
+    def _stft_batch(self, batch):
+        """Centred, zero-padded STFT of a (B, samples) array, as (B, bins, frames) complex64."""
+        import scipy.fft
+
+        n_fft, hop = self.n_fft, self.hop_length
+        padded = np.pad(batch, [(0, 0), (n_fft // 2, n_fft // 2)])
+        frames = np.lib.stride_tricks.sliding_window_view(padded, n_fft, axis=-1)[:, ::hop]
+        window = stft_window(n_fft)
+        stft = np.empty((len(batch), frames.shape[1], 1 + n_fft // 2), dtype=np.complex64)
+        block = max(1, librosa.util.MAX_MEM_BLOCK // (len(batch) * n_fft * frames.itemsize))
+        for start in range(0, frames.shape[1], block):
+            stft[:, start:start + block] = scipy.fft.rfft(frames[:, start:start + block] * window, axis=-1)
+        return stft.transpose(0, 2, 1)
+
+    def _window_sum(self, n_frames, length):
+        """The squared-window sum librosa.istft divides a clip of n_frames frames by, trimmed to length."""
+        window_sum = window_sumsquare(self.n_fft, self.hop_length, n_frames)
+        return librosa.util.fix_length(window_sum[self.n_fft // 2:], size=length)
+
+    def _istft_batch(self, stft, lengths, window_sums, padded=False):
+        """
+        Inverse of a padded (B, bins, frames) STFT: one clip per length, as a list, or as
+        a zero-padded (B, max length) array with padded=True.
+        """
+        import scipy.fft
+
+        n_fft, hop = self.n_fft, self.hop_length
+        batch, _, n_frames = stft.shape
+        window = stft_window(n_fft)
+        y = np.zeros((batch, n_fft + hop * (n_frames - 1)), dtype=np.float32)
+        spectra = stft.transpose(0, 2, 1)
+        block = max(1, librosa.util.MAX_MEM_BLOCK // (batch * n_fft * 4))
+        for start in range(0, n_frames, block):
+            frames = scipy.fft.irfft(spectra[:, start:start + block], n=n_fft, axis=-1)
+            frames *= window
+            for t in range(frames.shape[1]):
+                offset = (start + t) * hop
+                y[:, offset:offset + n_fft] += frames[:, t]
+
+        out = np.zeros((batch, max(lengths)), dtype=np.float32) if padded else []
+        for i, (length, window_sum) in enumerate(zip(lengths, window_sums)):
+            clip = librosa.util.fix_length(y[i, n_fft // 2:], size=length)
+            nonzero = window_sum > librosa.util.tiny(window_sum)
+            clip[nonzero] /= window_sum[nonzero]
+            if padded:
+                out[i, :length] = clip
+            else:
+                out.append(clip)
+        return out
+
+
+@lru_cache(maxsize=None)
+def stft_window(n_fft):
+    """The periodic Hann window of the batched (i)STFT, in float32, computed once per n_fft."""
+    return librosa.filters.get_window("hann", n_fft, fftbins=True).astype(np.float32)
+
+
+@lru_cache(maxsize=256)
+def window_sumsquare(n_fft, hop_length, n_frames):
+    """Squared Hann window sum over n_frames frames; the clips of a bucket share a few frame counts."""
+    window_sum = librosa.filters.window_sumsquare(window="hann", n_frames=n_frames, hop_length=hop_length,
+                                                  n_fft=n_fft, dtype=np.float32)
+    window_sum.flags.writeable = False
+    return window_sum
+
+
+def _pad_frames(arrays, n_frames):
+    """Stack (rows, frames_i) arrays into (B, rows, n_frames), zero-padded at the end."""
+    out = np.zeros((len(arrays), arrays[0].shape[0], n_frames), dtype=arrays[0].dtype)
+    for i, array in enumerate(arrays):
+        out[i, :, :array.shape[1]] = array
+    return out
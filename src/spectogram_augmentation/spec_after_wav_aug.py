@@ -7,22 +7,12 @@ Date: 21st Nov 2025
 import os
 from pathlib import Path
 import soundfile as sf
-import librosa
-import numpy as np
-
-def time_mask(mel, width=30):
-    aug = mel.copy()
-    t = np.random.randint(0, width)
-    t0 = np.random.randint(0, max(1, aug.shape[1]-t))
-    aug[:, t0:t0+t] = 0
-    return aug
-
-def freq_mask(mel, width=15):
-    aug = mel.copy()
-    f = np.random.randint(0, width)
-    f0 = np.random.randint(0, max(1, aug.shape[0]-f))
-    aug[f0:f0+f, :] = 0
-    return aug
+from .inversion import SpectrogramInverter
+from .spectogram_aug_pipeline import freq_mask, time_mask
+from .feature_cache import load_features, open_cache
+from ..utils.buffers import BufferPool
+from ..utils.metrics import Metrics
+from ..utils.outputs import make_output
 
 class SpectrogramAugmentationPipeline:
     def __init__(self):
@@ -30,43 +20,82 @@ class SpectrogramAugmentationPipeline:
             'time_mask': time_mask,
             'freq_mask': freq_mask
         }
-    def augment(self, mel, method):
+        self.pool = BufferPool()
+    def augment(self, mel, method, out=None):
         if method not in self.methods:
             raise ValueError(f"Unknown spec method: {method}")
-        return self.methods[method](mel)
+        return self.methods[method](mel, out=out)
 
 class SpecAugmentationAfterWav:
-    def __init__(self, base_input_dir, base_output_dir, sr=16000, n_mels=80):
+    def __init__(self, base_input_dir, base_output_dir, sr=16000, n_mels=80, inversion="griffin_lim", n_iter=32, momentum=0.99,
+                 cache_dir=None, cache_max_bytes=10 * 1024**3):
         self.base_input_dir = Path(base_input_dir)
         self.base_output_dir = Path(base_output_dir)
         self.sr = sr
         self.n_mels = n_mels
         self.pipeline = SpectrogramAugmentationPipeline()
+        self.inverter = SpectrogramInverter(sr, n_mels=n_mels, mode=inversion, n_iter=n_iter, momentum=momentum)
+        self.cache = open_cache(cache_dir, self.inverter, max_bytes=cache_max_bytes)
 
-    def augment(self, spec_methods):
-        for folder in self.base_input_dir.iterdir():
-            if not folder.is_dir():
-                continue
+    def augment(self, spec_methods, output_format="wav", metrics=None):
+        """
+        output_format="shards" packs each input folder's results into shard files under
+        base_output_dir/<folder>/<method>/ and lists them in base_output_dir/<folder>/shard_index.txt
+        as "<shard reference>|<source wav name>".
+        Progress, stage timings and the run summary go through metrics (src/utils/metrics.py);
+        returns the summary. A clip that fails is reported and skipped.
+        """
+        metrics = metrics or Metrics()
+        folders = []
+        for folder in sorted(self.base_input_dir.iterdir()):
+            if folder.is_dir():
+                wav_files = sorted(folder.glob("*.wav"))
+                if wav_files:
+                    folders.append((folder, wav_files))
+        metrics.start(sum(len(wav_files) for _, wav_files in folders) * len(spec_methods))
 
-            wav_files = list(folder.glob("*.wav"))
-            if not wav_files:
+        for folder, wav_files in folders:
+            if output_format != "shards":
+                self._augment_folder(folder, wav_files, spec_methods, metrics)
                 continue
+            shards = make_output("shards", self.base_output_dir / folder.name, self.sr)
+            try:
+                with open(self.base_output_dir / folder.name / "shard_index.txt", "w", encoding="utf-8") as shard_index:
+                    self._augment_folder(folder, wav_files, spec_methods, metrics, shards, shard_index)
+            finally:
+                shards.close()
+        return metrics.finish()
 
-            for wav_path in wav_files:
-                y, sr = librosa.load(wav_path, sr=self.sr)
-                mel_spec = librosa.feature.melspectrogram(y=y, sr=self.sr, n_mels=self.n_mels)
-                log_mel_spec = librosa.power_to_db(mel_spec)
-
+    def _augment_folder(self, folder, wav_files, spec_methods, metrics, shards=None, shard_index=None):
+        for wav_path in wav_files:
+            try:
+                log_mel_spec, stft, length = load_features(wav_path, self.inverter, self.cache, times=metrics.times)
+            except Exception as e:
                 for method in spec_methods:
-                    aug_spec = self.pipeline.augment(log_mel_spec, method)
-                    mel_spec_recon = librosa.db_to_power(aug_spec)
-                    y_recon = librosa.feature.inverse.mel_to_audio(mel_spec_recon, sr=self.sr)
+                    metrics.failure(wav_path, method, f"{type(e).__name__}: {e}")
+                continue
+
+            for method in spec_methods:
+                try:
+                    with metrics.times(f"augment/{method}"):
+                        out = self.pipeline.pool.get("augmented", log_mel_spec.shape, log_mel_spec.dtype)
+                        aug_spec = self.pipeline.augment(log_mel_spec, method, out=out)
+                    with metrics.times("inversion"):
+                        y_recon = self.inverter.invert(aug_spec, log_mel_spec, stft, length=length)
 
-                    out_dir = self.base_output_dir / folder.name / method
-                    out_dir.mkdir(parents=True, exist_ok=True)
-                    out_path = out_dir / wav_path.name
-                    sf.write(out_path, y_recon, self.sr, format="WAV", subtype="PCM_16")
-                    print(f"Saved: {out_path}")
+                    if shards is not None:
+                        ref = shards.write(method, wav_path.name, y_recon, self.sr, times=metrics.times)
+                        shard_index.write(f"{ref}|{wav_path.name}\n")
+                    else:
+                        out_dir = self.base_output_dir / folder.name / method
+                        out_dir.mkdir(parents=True, exist_ok=True)
+                        ref = out_dir / wav_path.name
+                        with metrics.times("write"):
+                            sf.write(ref, y_recon, self.sr, format="WAV", subtype="PCM_16")
+                except Exception as e:
+                    metrics.failure(wav_path, method, f"{type(e).__name__}: {e}")
+                    continue
+                metrics.output(str(ref), wav_path, method, len(y_recon) / self.sr)
 
 #if __name__ == "__main__":
 #    base_input_dir = "output_of_aug2"  # folder containing speed/, pitch/, etc.
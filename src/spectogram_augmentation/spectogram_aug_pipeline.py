@@ -1,43 +1,85 @@
-import csv
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 import random
 import numpy as np
 import soundfile as sf
-import librosa
-import cv2
-from scipy.signal import istft
-
-def time_mask(mel, width=30):
-    aug = mel.copy()
+from .inversion import SpectrogramInverter
+from .batched import BATCH_METHODS
+from .feature_cache import load_features, load_features_batch, open_cache
+from ..utils.audio_io import preload_scipy
+from ..utils.buffers import BufferPool
+from ..utils.outputs import make_output
+from ..utils.manifest import ManifestIndex
+from ..utils.run_state import select_clips
+from ..utils.metrics import Metrics, job_times
+from ..utils.stages import StagedRun
+from ..utils.seeds import derive_seed
+from ..utils.sharding import write_metadata
+from ..utils.registry import Registry
+
+# Every method takes out=: a preallocated array of mel's shape and dtype to write the
+# result into instead of allocating one (see src/utils/buffers.py). out must not overlap
+# mel, except in the masks, which also work in place (out=mel).
+
+def _into(mel, out):
+    if out is None:
+        return mel.copy()
+    if out is not mel:
+        np.copyto(out, mel)
+    return out
+
+def time_mask(mel, width=30, out=None):
+    aug = _into(mel, out)
     t = np.random.randint(0, width)
     t0 = np.random.randint(0, max(1, aug.shape[1] - t))
     aug[:, t0:t0+t] = 0
     return aug
 
-def freq_mask(mel, width=15):
-    aug = mel.copy()
+def freq_mask(mel, width=15, out=None):
+    aug = _into(mel, out)
     f = np.random.randint(0, width)
     f0 = np.random.randint(0, max(1, aug.shape[0] - f))
     aug[f0:f0+f, :] = 0
     return aug
 
-def spec_augment(mel, time_mask_width=30, freq_mask_width=15):
-    return freq_mask(time_mask(mel, time_mask_width), freq_mask_width)
+def spec_augment(mel, time_mask_width=30, freq_mask_width=15, out=None):
+    aug = time_mask(mel, time_mask_width, out=out)
+    return freq_mask(aug, freq_mask_width, out=aug)
 
-def time_warp(mel, max_warp=5):
+def time_warp(mel, max_warp=5, out=None):
     import scipy.ndimage
-    return scipy.ndimage.shift(mel, shift=(0, np.random.randint(-max_warp, max_warp)), mode='nearest')
-
-def add_noise(mel, level=0.01):
-    return mel + np.random.randn(*mel.shape) * level
-
-def time_shift(mel, max_shift=10):
-    return np.roll(mel, np.random.randint(-max_shift, max_shift), axis=1)
+    return scipy.ndimage.shift(mel, shift=(0, np.random.randint(-max_warp, max_warp)), mode='nearest', output=out)
+
+def add_noise(mel, level=0.01, out=None):
+    # Noise is drawn straight into the result, in float32 for float32 spectrograms.
+    rng = np.random.default_rng(np.random.randint(2**31))
+    out = np.empty(mel.shape, dtype=np.result_type(mel.dtype, np.float32)) if out is None else out
+    rng.standard_normal(dtype=out.dtype, out=out)
+    out *= level
+    out += mel
+    return out
+
+def _roll(mel, shift, axis, out):
+    """np.roll(mel, shift, axis) written into out."""
+    if out is None:
+        return np.roll(mel, shift, axis=axis)
+    n = mel.shape[axis]
+    shift %= n
+    head = (slice(None),) * axis
+    out[head + (slice(shift, None),)] = mel[head + (slice(0, n - shift),)]
+    out[head + (slice(0, shift),)] = mel[head + (slice(n - shift, None),)]
+    return out
+
+def time_shift(mel, max_shift=10, out=None):
+    return _roll(mel, np.random.randint(-max_shift, max_shift), 1, out)
+
+def freq_shift(mel, max_shift=5, out=None):
+    return _roll(mel, np.random.randint(-max_shift, max_shift), 0, out)
+
+def resize_crop(mel, scale_range=(0.8, 1.2), out=None):
+    import cv2
 
-def freq_shift(mel, max_shift=5):
-    return np.roll(mel, np.random.randint(-max_shift, max_shift), axis=0)
-
-def resize_crop(mel, scale_range=(0.8, 1.2)):
     num_mels, num_frames = mel.shape
     scale = np.random.uniform(*scale_range)
     new_mels, new_frames = int(num_mels * scale), int(num_frames * scale)
@@ -46,25 +88,36 @@ def resize_crop(mel, scale_range=(0.8, 1.2)):
     if scale >= 1.0:
         start_m = (new_mels - num_mels) // 2
         start_f = (new_frames - num_frames) // 2
-        return resized[start_m:start_m+num_mels, start_f:start_f+num_frames]
+        cropped = resized[start_m:start_m+num_mels, start_f:start_f+num_frames]
+        return cropped if out is None else _into(cropped, out)
     else:
         pad_m = (num_mels - new_mels) // 2
         pad_f = (num_frames - new_frames) // 2
-        return np.pad(resized, ((pad_m, num_mels - new_mels - pad_m), (pad_f, num_frames - new_frames - pad_f)))
-
-def dynamic_range_compression(mel, C=1, clip_val=1e-5):
-    return np.log10(C * np.maximum(mel, clip_val))
+        if out is None:
+            return np.pad(resized, ((pad_m, num_mels - new_mels - pad_m), (pad_f, num_frames - new_frames - pad_f)))
+        out.fill(0)
+        out[pad_m:pad_m+new_mels, pad_f:pad_f+new_frames] = resized
+        return out
+
+def dynamic_range_compression(mel, C=1, clip_val=1e-5, out=None):
+    if out is None:
+        return np.log10(C * np.maximum(mel, clip_val))
+    np.maximum(mel, clip_val, out=out)
+    if C != 1:
+        out *= C
+    return np.log10(out, out=out)
 
 def band_drop(
     mel,
     prob=0.3,
     num_masks=2,
-    max_width=8
+    max_width=8,
+    out=None
 ):
     if np.random.rand() > prob:
-        return mel
+        return mel if out is None else _into(mel, out)
 
-    mel = mel.copy()
+    mel = _into(mel, out)
     n_mels = mel.shape[0]
 
     for _ in range(num_masks):
@@ -75,134 +128,400 @@ def band_drop(
     return mel
 
 
-def patch_swap(mel, patch_size=(10, 10)):
+def patch_swap(mel, patch_size=(10, 10), out=None):
     h, w = mel.shape
     ph, pw = patch_size
     if h < ph or w < pw:
-        return mel
+        return mel if out is None else _into(mel, out)
+    mel = _into(mel, out)
     m1, n1 = np.random.randint(0, h - ph), np.random.randint(0, w - pw)
     m2, n2 = np.random.randint(0, h - ph), np.random.randint(0, w - pw)
     mel[m1:m1+ph, n1:n1+pw], mel[m2:m2+ph, n2:n2+pw] = mel[m2:m2+ph, n2:n2+pw].copy(), mel[m1:m1+ph, n1:n1+pw].copy()
     return mel
 
 
+# Spectrogram methods by name: functions of (mel, out=None) returning the augmented mel.
+# Register more with SPEC_METHODS.register("name", fn) (see src/utils/registry.py).
+SPEC_METHODS = Registry("spectrogram method")
+for _name, _method in [
+    ('time_mask', time_mask),
+    ('freq_mask', freq_mask),
+    ('spec_augment', spec_augment),
+    ('time_warp', time_warp),
+    ('add_noise', add_noise),
+    ('time_shift', time_shift),
+    ('freq_shift', freq_shift),
+    ('resize_crop', resize_crop),
+    ('dynamic_range_compression', dynamic_range_compression),
+    ('band_drop', band_drop),
+    ('patch_swap', patch_swap),
+]:
+    SPEC_METHODS.register(_name, _method)
+
+
 class SpectrogramAugmentationPipeline:
     def __init__(self, sr):
         self.sr = sr
-        self.methods = {
-            'time_mask': time_mask,
-            'freq_mask': freq_mask,
-            'spec_augment': spec_augment,
-            'time_warp': time_warp,
-            'add_noise': add_noise,
-            'time_shift': time_shift,
-            'freq_shift': freq_shift,
-            'resize_crop': resize_crop,
-            'dynamic_range_compression': dynamic_range_compression,
-            'band_drop': band_drop,
-            'patch_swap': patch_swap,
-        }
-
-    def augment(self, mel_spec, method):
+        self.pool = BufferPool()
+        self.methods = SPEC_METHODS
+
+    def augment(self, mel_spec, method, out=None):
+        """out: write the result into this preallocated array instead of a new one (see above)."""
         if method not in self.methods:
             raise ValueError(f"Unknown method: {method}")
-        return self.methods[method](mel_spec)
+        if out is None:
+            return self.methods[method](mel_spec)
+        return self.methods[method](mel_spec, out=out)
+
+    def augment_batch(self, mel_batch, lengths, method):
+        """
+        Augment a padded (B, n_mels, T) stack in one vectorized call; lengths holds the
+        number of valid frames of each item (see batched.pad_batch).
+        """
+        if method not in BATCH_METHODS:
+            raise ValueError(f"Unknown method: {method}")
+        return BATCH_METHODS[method](mel_batch, lengths)
+
+
+_worker_pipeline = None
+_worker_inverter = None
+
+
+def _init_worker(pipeline, inverter):
+    global _worker_pipeline, _worker_inverter
+    _worker_pipeline = pipeline
+    _worker_inverter = inverter
+
+
+def _read_job(job, inverter, cache, metrics):
+    """Reader stage: the clip's log-mel (decoded and analysed, or from the cache), its STFT and length."""
+    wav_path, _, _ = job
+    try:
+        log_mel, stft, length = load_features(wav_path, inverter, cache, times=metrics.times)
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+    return (np.asarray(log_mel), stft, length), None
+
+
+def _compute_job(job, features, pipeline=None, inverter=None, timed=True):
+    """
+    CPU stage: augment and invert the clip for every method. Returns one (audio, error)
+    pair per method, plus the job's stage timings.
+    """
+    _, outputs, _ = job
+    pipeline = pipeline or _worker_pipeline
+    inverter = inverter or _worker_inverter
+    times = job_times(timed)
+
+    features, error = features
+    if error is not None:
+        return [(None, error)] * len(outputs), None
+    log_mel_spec, stft, length = features
+
+    results = []
+    for method, seed in outputs:
+        try:
+            random.seed(seed)
+            np.random.seed(seed)
+            with times(f"augment/{method}"):
+                # Inverted right away, so the worker's pooled buffer can hold it.
+                out = pipeline.pool.get("augmented", log_mel_spec.shape, log_mel_spec.dtype)
+                aug_spec = pipeline.augment(log_mel_spec, method, out=out)
+            with times("inversion"):
+                results.append((inverter.invert(aug_spec, log_mel_spec, stft, length=length), None))
+        except Exception as e:
+            results.append((None, f"{type(e).__name__}: {e}"))
+    return results, times.snapshot()
+
+
+def _write_job(job, computed, output, sr, metrics, state=None):
+    """
+    Writer stage: encode every method's audio, and log every finished output when the
+    run is resumable. Returns one (ref, error) pair per method.
+    """
+    wav_path, outputs, clip = job
+    computed, times = computed
+    metrics.times.merge(times)
+    results = []
+    for (method, seed), (audio, error) in zip(outputs, computed):
+        ref = None
+        if error is None:
+            try:
+                ref = output.write(method, wav_path.name, audio, sr, times=metrics.times)
+                if state is not None:
+                    state.record(clip, method, seed, ref)
+            except Exception as e:
+                ref, error = None, f"{type(e).__name__}: {e}"
+        if error is not None:
+            metrics.failure(wav_path, method, error)
+        else:
+            metrics.output(ref, wav_path, method, len(audio) / sr)
+        results.append((ref, error))
+    return results
+
+
+def _duration(wav_path):
+    try:
+        return sf.info(str(wav_path)).duration
+    except Exception:
+        return 0.0
+
+
+def _buckets(jobs, batch_size):
+    """Jobs sorted by clip duration and cut into buckets of batch_size similar-length clips."""
+    jobs = sorted(jobs, key=lambda job: _duration(job[0]))
+    return [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
+
+
+def _read_bucket(bucket, inverter, cache, metrics):
+    """Batched reader stage: the features of every clip in the bucket (see load_features_batch)."""
+    features = load_features_batch([wav_path for wav_path, _, _ in bucket], inverter, cache, times=metrics.times)
+    return [(None, error) if error is not None else ((np.asarray(f[0]), f[1], f[2]), None)
+            for f, error in features]
+
+
+def _compute_bucket(bucket, features, pipeline=None, inverter=None, timed=True):
+    """
+    Batched CPU stage: augment every (clip, method) of the bucket, then invert each
+    method's outputs as one batch. Each output draws from the RNGs exactly as in
+    _compute_job; how closely the audio matches an unbatched run depends on the inversion
+    mode (see run_spec_augmentation). Returns the per-clip (audio, error) lists, plus the
+    bucket's stage timings.
+    """
+    pipeline = pipeline or _worker_pipeline
+    inverter = inverter or _worker_inverter
+    times = job_times(timed)
+
+    results = [[None] * len(outputs) for _, outputs, _ in bucket]
+    batches = {}
+    for i, ((_, outputs, _), (clip_features, error)) in enumerate(zip(bucket, features)):
+        for j, (method, seed) in enumerate(outputs):
+            if error is not None:
+                results[i][j] = (None, error)
+                continue
+            log_mel_spec, stft, length = clip_features
+            try:
+                random.seed(seed)
+                np.random.seed(seed)
+                with times(f"augment/{method}"):
+                    # Held until the whole batch is inverted, so not a pooled buffer.
+                    aug_spec = pipeline.augment(log_mel_spec, method)
+                # The Griffin-Lim initial phase seed that invert() would draw next.
+                phase_seed = np.random.randint(2**31) if inverter.mode == "griffin_lim" else None
+                batches.setdefault(method, []).append((i, j, aug_spec, log_mel_spec, stft, length, phase_seed))
+            except Exception as e:
+                results[i][j] = (None, f"{type(e).__name__}: {e}")
+
+    for batch in batches.values():
+        index, aug_specs, log_mels, stfts, lengths, seeds = zip(*[((i, j), *rest) for i, j, *rest in batch])
+        with times("inversion"):
+            try:
+                audio = [(a, None) for a in inverter.invert_batch(aug_specs, log_mels, stfts, lengths, seeds)]
+            except Exception:
+                # Fall back to one clip at a time, so only the outputs that fail are lost.
+                audio = []
+                for item in zip(aug_specs, log_mels, stfts, lengths, seeds):
+                    try:
+                        audio.append((inverter.invert_batch(*([value] for value in item))[0], None))
+                    except Exception as e:
+                        audio.append((None, f"{type(e).__name__}: {e}"))
+        for (i, j), result in zip(index, audio):
+            results[i][j] = result
+    return results, times.snapshot()
+
+
+def _write_bucket(bucket, computed, output, sr, metrics, state=None):
+    """Batched writer stage: _write_job for every clip of the bucket."""
+    computed, times = computed
+    metrics.times.merge(times)
+    return [_write_job(job, (audio, None), output, sr, metrics, state) for job, audio in zip(bucket, computed)]
+
+
+def run_spec_augmentation(pipeline, inverter, clips, methods, output_dir, run_seed, sep="|", cache=None,
+                          output_format="wav", num_workers=1, readers=2, writers=2, queue_depth=16, state=None,
+                          source=None, metrics=None, batch_size=None, shard=None):
+    """
+    Augment every selected clip with every method and write aug_metadata.txt.
+
+    clips is a list of (wav_path, text). The work runs as three overlapping stages (see
+    src/utils/stages.py): `readers` threads load each clip's log-mel spectrogram once
+    (or take it from the FeatureCache), the CPU stage fans it out to all methods and
+    turns the results back into audio with inverter (inline, or on a pool of num_workers
+    processes), and `writers` threads encode the audio, with at most queue_depth clips
+    waiting between stages. Every output is seeded from run_seed, the clip and the
+    method. Metadata lines are written in (method, clip) order. output_format="shards"
+    packs the audio into shard files (see src/utils/outputs.py). With a RunState
+    (src/utils/run_state.py), outputs that an earlier run already completed are kept,
+    and every new output is logged as it finishes. With an ArrowAudioSource, clips are
+    dataset clip names read straight from the dataset (see
+    src/dataset_preparation/arrow_source.py). Progress, stage timings and the run
+    summary go through metrics (src/utils/metrics.py). With batch_size, clips are sorted
+    by duration and handled in buckets of batch_size: each bucket is analysed with one
+    batched STFT and mel projection, and every method's outputs are inverted as one
+    batch (see SpectrogramInverter.analyze_batch). With phase inversion the audio is
+    within one int16 step of an unbatched run whatever the batch_size; Griffin-Lim's
+    iterations amplify the float32 rounding differences of the batched transforms, so
+    its outputs can differ from an unbatched run (and between batch sizes) by tens of
+    int16 steps, up to 81 in a 12-clip run with n_iter=4. With a ShardSpec
+    (src/utils/sharding.py), clips are that shard's part of the selection and the
+    metadata goes to the shard's own file and plan. Returns the summary.
+    """
+    metrics = metrics or Metrics()
+    sr = inverter.sr
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output = make_output(output_format, output_dir, sr, prefix=f"{shard.shard_index:05d}-" if shard else "")
+
+    for method in methods:
+        (output_dir / method).mkdir(exist_ok=True)
+
+    jobs, selected, refs = [], [], {}
+    for wav_path_str, text in clips:
+        with metrics.times("resolve"):
+            wav_path = source.clip(wav_path_str) if source is not None else Path(wav_path_str).resolve()
+            exists = wav_path.exists()
+
+        if not exists:
+            metrics.warn(f"file not found: {wav_path}")
+            metrics.count("missing")
+            continue
+        selected.append((wav_path_str, wav_path, text))
+
+        outputs = []
+        for method in methods:
+            seed = derive_seed(run_seed, wav_path_str, method)
+            ref = state.completed_ref(wav_path_str, method, seed) if state is not None else None
+            if ref is not None:
+                refs[(wav_path, method)] = ref
+            else:
+                outputs.append((method, seed))
+        if outputs:
+            jobs.append((wav_path, outputs, wav_path_str))
+
+    total = sum(len(job[1]) for job in jobs)
+    if state is not None and metrics.verbosity >= 1:
+        print(f"Resuming: {len(refs)} outputs already complete, {total} to do")
+    metrics.start(total, skipped=len(refs))
+
+    read_stage, compute_stage, write_stage, items = _read_job, _compute_job, _write_job, jobs
+    if batch_size:
+        read_stage, compute_stage, write_stage = _read_bucket, _compute_bucket, _write_bucket
+        items = _buckets(jobs, batch_size)
+    read = partial(read_stage, inverter=inverter, cache=cache, metrics=metrics)
+    write = partial(write_stage, output=output, sr=sr, metrics=metrics, state=state)
+    stage_args = dict(readers=readers, writers=writers, queue_depth=queue_depth)
+    preload_scipy()
+    if num_workers > 1 and len(items) > 1:
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker,
+                                 initargs=(pipeline, inverter)) as executor:
+            compute = partial(compute_stage, timed=metrics.enabled)
+            run = StagedRun(read, compute, write, executor=executor, workers=num_workers, **stage_args)
+            try:
+                results = run.run(items)
+            except BaseException:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+    else:
+        compute = partial(compute_stage, pipeline=pipeline, inverter=inverter, timed=metrics.enabled)
+        results = StagedRun(read, compute, write, **stage_args).run(items)
+
+    if output_format == "shards":
+        output.close()
+    if batch_size:
+        jobs = [job for bucket in items for job in bucket]
+        results = [clip_results for bucket_results in results for clip_results in bucket_results]
+
+    for (wav_path, outputs, _), clip_results in zip(jobs, results):
+        for (method, _), (ref, error) in zip(outputs, clip_results):
+            if error is None:
+                refs[(wav_path, method)] = ref
+
+    write_metadata(output_dir, methods, selected, refs, sep, run_seed=run_seed, shard=shard)
+
+    if cache is not None:
+        for name, value in cache.stats().items():
+            if name in ("hits", "misses", "evictions"):
+                metrics.count(f"feature_cache_{name}", value)
+    return metrics.finish()
 
 
 class SpectrogramAugmentation:
-    def __init__(self, metadata_path, output_dir, sr=16000, n_mels=80):
+    def __init__(self, metadata_path, output_dir, sr=16000, n_mels=80, inversion="griffin_lim", n_iter=32, momentum=0.99,
+                 cache_dir=None, cache_max_bytes=10 * 1024**3):
         self.metadata_path = Path(metadata_path)
         self.output_dir = Path(output_dir)
         self.sr = sr
         self.n_mels = n_mels
         self.pipeline = SpectrogramAugmentationPipeline(sr=sr)
-
-        with open(metadata_path, "r", encoding="utf-8") as f:
-            self.entries = [line.strip() for line in f if "|" in line]
-
-    def augment(self, percent, methods):
-        total = len(self.entries)
-        sample_count = max(1, int(total * percent / 100))
-        selected = random.sample(self.entries, sample_count)
-
-        aug_meta_path = self.output_dir / "aug_metadata.txt"
-        self.output_dir.mkdir(parents=True, exist_ok=True)
-
-        with open(aug_meta_path, "w", encoding="utf-8") as meta_out:
-            for method in methods:
-                method_dir = self.output_dir / method
-                method_dir.mkdir(exist_ok=True)
-
-                for line in selected:
-                    wav_path_str, text = line.split("|")
-                    wav_path = Path(wav_path_str).resolve()
-
-                    if not wav_path.exists():
-                        print(f"Missing file: {wav_path}")
-                        continue
-
-                    y, sr = librosa.load(wav_path, sr=self.sr)
-                    mel_spec = librosa.feature.melspectrogram(y=y, sr=self.sr, n_mels=self.n_mels)
-                    log_mel_spec = librosa.power_to_db(mel_spec)
-
-                    aug_spec = self.pipeline.augment(log_mel_spec, method)
-
-                    mel_spec_recon = librosa.db_to_power(aug_spec)
-                    y_recon = librosa.feature.inverse.mel_to_audio(mel_spec_recon, sr=self.sr)
-
-                    out_filename = f"{method}_{wav_path.name}"
-                    out_path = method_dir / out_filename
-                    sf.write(out_path, y_recon, self.sr, format="WAV", subtype="PCM_16")
-
-                    meta_out.write(f"{out_path.resolve()}|{text.strip()}\n")
-                    print(f"Saved augmented: {out_path}")
+        self.inverter = SpectrogramInverter(sr, n_mels=n_mels, mode=inversion, n_iter=n_iter, momentum=momentum)
+        self.cache = open_cache(cache_dir, self.inverter, max_bytes=cache_max_bytes)
+
+        self.entries = ManifestIndex(metadata_path)
+
+    def _run_params(self, output_format):
+        inverter = self.inverter
+        return dict(sr=self.sr, n_mels=self.n_mels, inversion=inverter.mode, n_iter=inverter.n_iter,
+                    momentum=inverter.momentum, output_format=output_format)
+
+    def augment(self, percent, methods, output_format="wav", seed=None, num_workers=1, readers=2, writers=2,
+                queue_depth=16, resume=False, metrics=None, batch_size=None, stratify=None, shard_index=0,
+                num_shards=1):
+        """
+        Augment percent% of the rows with every method and return the run summary. See
+        select_clips (src/utils/run_state.py) for resume, stratify and sharding; batch_size
+        analyses and inverts length-bucketed batches of that many clips.
+        """
+        params = self._run_params(output_format)
+        run_seed, clips, methods, state, shard = select_clips(self.entries, percent, methods, self.output_dir, params,
+                                                              seed=seed, stratify=stratify, resume=resume,
+                                                              shard_index=shard_index, num_shards=num_shards)
+        return run_spec_augmentation(self.pipeline, self.inverter, clips, methods, self.output_dir, run_seed,
+                                     sep="|", cache=self.cache, output_format=output_format,
+                                     num_workers=num_workers, readers=readers, writers=writers,
+                                     queue_depth=queue_depth, state=state, metrics=metrics,
+                                     batch_size=batch_size, shard=shard)
 
 
 class HF_SpectrogramAugmentation:
-    def __init__(self, metadata_path, output_dir, sr=16000, n_mels=80):
-        self.metadata_path = Path(metadata_path)
+    def __init__(self, metadata_path, output_dir, sr=16000, n_mels=80, inversion="griffin_lim", n_iter=32, momentum=0.99,
+                 cache_dir=None, cache_max_bytes=10 * 1024**3, source=None):
+        """
+        source: an ArrowAudioSource to augment a cached HuggingFace dataset directly, without
+        exporting WAVs first; metadata_path is then not used.
+        """
+        self.metadata_path = Path(metadata_path) if metadata_path is not None else None
         self.output_dir = Path(output_dir)
         self.sr = sr
         self.n_mels = n_mels
         self.pipeline = SpectrogramAugmentationPipeline(sr=sr)
-
-        with open(metadata_path, "r", encoding="utf-8", newline='') as f:
-            reader = csv.reader(f, delimiter='\t')
-            self.entries = [row for row in reader if len(row) >= 2]
-
-    def augment(self, percent, methods):
-        total = len(self.entries)
-        sample_count = max(1, int(total * percent / 100))
-        selected = random.sample(self.entries, sample_count)
-
-        aug_meta_path = self.output_dir / "aug_metadata.txt"
-        self.output_dir.mkdir(parents=True, exist_ok=True)
-
-        with open(aug_meta_path, "w", encoding="utf-8") as meta_out:
-            for method in methods:
-                method_dir = self.output_dir / method
-                method_dir.mkdir(exist_ok=True)
-
-                for wav_path_str, text in selected:
-                    wav_path = Path(wav_path_str).resolve()
-
-                    if not wav_path.exists():
-                        print(f"Missing file: {wav_path}")
-                        continue
-
-                    y, sr = librosa.load(wav_path, sr=self.sr)
-                    mel_spec = librosa.feature.melspectrogram(y=y, sr=self.sr, n_mels=self.n_mels)
-                    log_mel_spec = librosa.power_to_db(mel_spec)
-
-                    aug_spec = self.pipeline.augment(log_mel_spec, method)
-
-                    mel_spec_recon = librosa.db_to_power(aug_spec)
-                    y_recon = librosa.feature.inverse.mel_to_audio(mel_spec_recon, sr=self.sr)
-
-                    out_filename = f"{method}_{wav_path.name}"
-                    out_path = method_dir / out_filename
-                    sf.write(out_path, y_recon, self.sr, format="WAV", subtype="PCM_16")
-
-                    meta_out.write(f"{out_path.resolve()}\t{text.strip()}\n")
-                    print(f"Saved augmented: {out_path}")
-
+        self.inverter = SpectrogramInverter(sr, n_mels=n_mels, mode=inversion, n_iter=n_iter, momentum=momentum)
+        self.cache = open_cache(cache_dir, self.inverter, max_bytes=cache_max_bytes)
+        self.source = source
+
+        if source is not None:
+            self.entries = source.entries()
+            return
+        self.entries = ManifestIndex(metadata_path, sep="\t", header=True)
+
+    def _run_params(self, output_format):
+        inverter = self.inverter
+        return dict(sr=self.sr, n_mels=self.n_mels, inversion=inverter.mode, n_iter=inverter.n_iter,
+                    momentum=inverter.momentum, output_format=output_format)
+
+    def augment(self, percent, methods, output_format="wav", seed=None, num_workers=1, readers=2, writers=2,
+                queue_depth=16, resume=False, metrics=None, batch_size=None, stratify=None, shard_index=0,
+                num_shards=1):
+        """
+        Augment percent% of the rows with every method and return the run summary. See
+        select_clips (src/utils/run_state.py) for resume, stratify and sharding; batch_size
+        analyses and inverts length-bucketed batches of that many clips.
+        """
+        params = self._run_params(output_format)
+        run_seed, clips, methods, state, shard = select_clips(self.entries, percent, methods, self.output_dir, params,
+                                                              seed=seed, stratify=stratify, resume=resume,
+                                                              shard_index=shard_index, num_shards=num_shards)
+        return run_spec_augmentation(self.pipeline, self.inverter, clips, methods, self.output_dir, run_seed,
+                                     sep="\t", cache=self.cache, output_format=output_format,
+                                     num_workers=num_workers, readers=readers, writers=writers,
+                                     queue_depth=queue_depth, state=state, source=self.source, metrics=metrics,
+                                     batch_size=batch_size, shard=shard)
@@ -0,0 +1,105 @@
+"""
+Shared audio loader for the wave and spectrogram pipelines
+Author: Ye Bhone Lin
+
+    y, file_sr = load_audio("clip.wav", sr=16000)   # mono float32 at 16 kHz
+
+Every entry point decodes clips through load_audio: straight to float32 (half the memory
+of sf.read's float64), downmixed to mono by averaging the channels (like librosa.load),
+and resampled to the pipeline rate with a polyphase filter that is designed once per
+(src_sr, dst_sr) pair. Multichannel and resampled clips are decoded into a per-thread
+scratch buffer that grows to the longest such clip, so only the returned array is
+allocated per clip. Resampling is timed as the "resample" stage, whose call count in the
+run summary is the number of resampled clips.
+"""
+
+import threading
+from functools import lru_cache
+from math import gcd
+import numpy as np
+import soundfile as sf
+
+from .metrics import NULL_TIMES
+
+
+_scratch = threading.local()
+
+
+def _scratch_frames(frames, channels):
+    """A (frames, channels) float32 view of this thread's decode buffer."""
+    size = frames * channels
+    buffer = getattr(_scratch, "buffer", None)
+    if buffer is None or len(buffer) < size:
+        buffer = _scratch.buffer = np.empty(size, dtype=np.float32)
+    return buffer[:size].reshape(frames, channels)
+
+
+def preload_scipy():
+    """
+    Import the scipy modules that decoding, inversion and the numpy augmenters use. scipy
+    is imported lazily to keep module imports fast, but imported for the first time from
+    several threads at once it can hand out partially initialised modules, so every entry
+    point that decodes clips in threads calls this before it starts them.
+    """
+    import scipy.fft
+    import scipy.signal
+
+
+@lru_cache(maxsize=None)
+def polyphase_filter(src_sr, dst_sr):
+    """(up, down, taps) for src_sr -> dst_sr; the same Kaiser FIR that resample_poly designs by default."""
+    from scipy.signal import firwin
+
+    g = gcd(src_sr, dst_sr)
+    up, down = dst_sr // g, src_sr // g
+    max_rate = max(up, down)
+    taps = firwin(20 * max_rate + 1, 1.0 / max_rate, window=("kaiser", 5.0)).astype(np.float32)
+    return up, down, taps
+
+
+def resample(y, src_sr, dst_sr, axis=0):
+    if src_sr == dst_sr:
+        return y
+    from scipy.signal import resample_poly
+
+    up, down, taps = polyphase_filter(int(src_sr), int(dst_sr))
+    return resample_poly(y, up, down, axis=axis, window=taps)
+
+
+def downmix(y):
+    """Mono float32 from (frames,) or (frames, channels) audio: the mean of the channels."""
+    y = np.asarray(y, dtype=np.float32)
+    if y.ndim == 1:
+        return y
+    if y.shape[1] == 1:
+        return y[:, 0]
+    # A matrix-vector product is many times faster than mean(axis=1) over a short last axis.
+    return y @ np.full(y.shape[1], 1 / y.shape[1], dtype=np.float32)
+
+
+def _decode(path, sr):
+    with sf.SoundFile(str(path)) as f:
+        if f.channels == 1 and sr in (None, f.samplerate):
+            return f.read(dtype="float32"), f.samplerate
+        # Only an intermediate: the mono mix or the resampled clip is a new array.
+        block = f.read(dtype="float32", always_2d=True, out=_scratch_frames(f.frames, f.channels))
+        return downmix(block), f.samplerate
+
+
+def load_audio(source, sr=None, times=NULL_TIMES):
+    """
+    Returns (y, file_sr): the clip as mono float32 at sr (at its own rate with sr=None)
+    and the rate it was stored at. source is a path, or anything with a read() that
+    returns (audio, sr) like sf.read, such as an ArrowClip. `times` receives the decode
+    and resample timings (see src/utils/metrics.py).
+    """
+    with times("decode"):
+        if hasattr(source, "read"):
+            y, file_sr = source.read()
+            y = downmix(y)
+        else:
+            y, file_sr = _decode(source, sr)
+    if sr is not None and file_sr != sr:
+        with times("resample"):
+            y = resample(y, file_sr, sr)
+    return y, file_sr
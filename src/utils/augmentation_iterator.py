@@ -0,0 +1,224 @@
+"""
+On-the-fly augmentation iterator over a metadata file, with background prefetching
+Author: Ye Bhone Lin
+
+Yields augmented audio (or log-mel spectrograms) straight from memory, without writing
+anything to disk:
+
+    it = AugmentationIterator("metadata.txt", ["noise", "pitch"], prefetch=16, num_workers=4)
+    for epoch in range(3):
+        for audio, text, method in it:
+            ...
+
+Every epoch reshuffles the clips with seed + epoch, and every (epoch, clip, method) is
+seeded like the file pipelines, so an epoch is reproducible. With batch_size set, items
+are grouped into length-bucketed, zero-padded batches instead.
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import random
+import threading
+from pathlib import Path
+import numpy as np
+
+from .manifest import ManifestIndex
+
+
+class _Worker:
+    """Loads one clip and applies the requested methods; one instance per thread pool or process."""
+
+    def __init__(self, mode, sr, n_mels, backend, cache_dir):
+        self.mode = mode
+        self.lock = threading.Lock()
+        if mode == "wave":
+            from ..wave_augmentation.pipeline import AudioAugmentationPipeline
+            self.pipeline = AudioAugmentationPipeline(sr=sr, backend=backend)
+        else:
+            from ..spectogram_augmentation.spectogram_aug_pipeline import SpectrogramAugmentationPipeline
+            from ..spectogram_augmentation.inversion import SpectrogramInverter
+            from ..spectogram_augmentation.feature_cache import open_cache
+            self.pipeline = SpectrogramAugmentationPipeline(sr=sr)
+            self.inverter = SpectrogramInverter(sr, n_mels=n_mels)
+            self.cache = open_cache(cache_dir, self.inverter)
+        self.sr = sr
+
+    def run(self, wav_path, method_seeds):
+        from ..wave_augmentation.pipeline import normalize_peak
+        from ..spectogram_augmentation.feature_cache import load_features
+        from .audio_io import load_audio
+
+        try:
+            if self.mode == "wave":
+                data, _ = load_audio(wav_path, self.sr)
+            else:
+                data, _, _ = load_features(wav_path, self.inverter, self.cache)
+        except Exception as e:
+            # Like a failed augmentation below: skip the clip instead of ending the epoch.
+            print(f"Warning: failed to load {wav_path}: {type(e).__name__}: {e}")
+            return []
+
+        results = []
+        # nlpaug and the spectrogram functions draw from the global RNGs, so seeding and
+        # augmenting must not interleave between threads; decoding above still overlaps.
+        with self.lock:
+            for method, seed in method_seeds:
+                try:
+                    random.seed(seed)
+                    np.random.seed(seed)
+                    if self.mode == "wave":
+                        results.append((normalize_peak(self.pipeline.augment(data, method), inplace=True), method))
+                    else:
+                        results.append((np.asarray(self.pipeline.augment(data, method), dtype=np.float32), method))
+                except Exception as e:
+                    print(f"Warning: failed to augment {wav_path} with {method}: {type(e).__name__}: {e}")
+        return results
+
+
+_process_worker = None
+
+
+def _init_process(config):
+    global _process_worker
+    _process_worker = _Worker(*config)
+
+
+def _run_in_process(wav_path, method_seeds):
+    return _process_worker.run(wav_path, method_seeds)
+
+
+class AugmentationIterator:
+    """
+    mode="wave" yields (float32 audio, text, method); mode="spec" yields (log-mel, text, method).
+
+    prefetch: how many clips are decoded and augmented ahead of the consumer.
+    executor: "thread" (cheap to start, augmentation serialised by a lock) or "process"
+        (fully parallel). The pool is started on first use and kept across epochs; call
+        close() (or use the iterator as a context manager) to shut it down.
+    random_method: pick one method per clip and epoch instead of yielding every method.
+    batch_size: yield (padded batch, lengths, texts, methods) tuples of similar-length
+        items; bucket_batches batches are collected, sorted by length and shuffled.
+    """
+
+    def __init__(self, metadata_path, methods, sr=16000, sep="|", mode="wave", n_mels=80, backend="nlpaug",
+                 cache_dir=None, shuffle=True, seed=0, random_method=False, prefetch=8, num_workers=2,
+                 executor="thread", batch_size=None, bucket_batches=50):
+        if mode not in ("wave", "spec"):
+            raise ValueError(f"Unknown mode: {mode}")
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown executor: {executor}")
+        self.entries = ManifestIndex(metadata_path, sep=sep, header=sep == "\t")
+        self.methods = list(methods)
+        self.mode = mode
+        self.shuffle = shuffle
+        self.seed = seed
+        self.random_method = random_method
+        self.prefetch = max(1, prefetch)
+        self.num_workers = max(1, num_workers)
+        self.executor = executor
+        self.batch_size = batch_size
+        self.bucket_batches = bucket_batches
+        self.epoch = 0
+        self._config = (mode, sr, n_mels, backend, cache_dir)
+        self._worker = None
+        self._pool = None
+
+    def __len__(self):
+        per_clip = 1 if self.random_method else len(self.methods)
+        return len(self.entries) * per_clip
+
+    def _plan(self, epoch):
+        from .seeds import derive_seed
+
+        order = list(range(len(self.entries)))
+        rng = random.Random(f"{self.seed}:{epoch}")
+        if self.shuffle:
+            rng.shuffle(order)
+        for index in order:
+            wav_path_str, text = self.entries[index][:2]
+            wav_path = Path(wav_path_str).resolve()
+            if not wav_path.exists():
+                print(f"Warning: file not found: {wav_path}")
+                continue
+            methods = [rng.choice(self.methods)] if self.random_method else self.methods
+            yield wav_path, text, [(m, derive_seed(self.seed, epoch, wav_path_str, m)) for m in methods]
+
+    def _submit(self, wav_path, seeds):
+        # The pool (and, with processes, every worker's augmenters) lives for all epochs.
+        if self._pool is None:
+            if self.executor == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.num_workers, initializer=_init_process,
+                                                 initargs=(self._config,))
+            else:
+                from .audio_io import preload_scipy
+                preload_scipy()
+                self._worker = _Worker(*self._config)
+                self._pool = ThreadPoolExecutor(max_workers=self.num_workers)
+        if self.executor == "process":
+            return self._pool.submit(_run_in_process, wav_path, seeds)
+        return self._pool.submit(self._worker.run, wav_path, seeds)
+
+    def close(self):
+        """Shut down the worker pool; iterating again starts a new one."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _items(self, epoch):
+        pending = deque()
+        try:
+            for wav_path, text, seeds in self._plan(epoch):
+                pending.append((text, self._submit(wav_path, seeds)))
+                if len(pending) >= self.prefetch:
+                    text_, future = pending.popleft()
+                    for array, method in future.result():
+                        yield array, text_, method
+            while pending:
+                text_, future = pending.popleft()
+                for array, method in future.result():
+                    yield array, text_, method
+        finally:
+            # An epoch left early drops its queued clips but keeps the pool.
+            for _, future in pending:
+                future.cancel()
+
+    def _batches(self, items, epoch):
+        rng = random.Random(f"{self.seed}:{epoch}:batches")
+        pool_size = self.batch_size * self.bucket_batches
+        buffer = []
+        for item in items:
+            buffer.append(item)
+            if len(buffer) >= pool_size:
+                yield from self._flush(buffer, rng)
+                buffer = []
+        if buffer:
+            yield from self._flush(buffer, rng)
+
+    def _flush(self, buffer, rng):
+        length_axis = 0 if self.mode == "wave" else 1
+        buffer.sort(key=lambda item: item[0].shape[length_axis])
+        batches = [buffer[i:i + self.batch_size] for i in range(0, len(buffer), self.batch_size)]
+        rng.shuffle(batches)
+        for batch in batches:
+            lengths = np.array([a.shape[length_axis] for a, _, _ in batch], dtype=np.int64)
+            if self.mode == "wave":
+                padded = np.zeros((len(batch), lengths.max()) + batch[0][0].shape[1:], dtype=np.float32)
+                for i, (array, _, _) in enumerate(batch):
+                    padded[i, :len(array)] = array
+            else:
+                from ..spectogram_augmentation.batched import pad_batch
+                padded, lengths = pad_batch([a for a, _, _ in batch])
+            yield padded, lengths, [t for _, t, _ in batch], [m for _, _, m in batch]
+
+    def __iter__(self):
+        epoch, self.epoch = self.epoch, self.epoch + 1
+        items = self._items(epoch)
+        if self.batch_size:
+            return self._batches(items, epoch)
+        return items
@@ -0,0 +1,37 @@
+"""
+Per-worker pool of reusable scratch arrays
+Author: Ye Bhone Lin
+
+    pool = BufferPool()
+    aug = pipeline.augment(log_mel, "time_mask", out=pool.get("augmented", log_mel.shape))
+
+Each named buffer grows to the largest size requested so far and is then handed out as
+a view, so a worker augmenting a steady stream of clips stops allocating once it has seen
+the longest one. A view is only valid until the next get() with the same name and dtype,
+so use it for results that are consumed before the next clip (e.g. an augmented
+spectrogram that is inverted right away), never for results handed to another stage.
+A pool belongs to one worker thread or process; it is not locked.
+"""
+
+import numpy as np
+
+
+class BufferPool:
+    def __init__(self):
+        self._buffers = {}
+
+    def get(self, name, shape, dtype=np.float32):
+        """An uninitialised array of `shape`, backed by the pool's buffer for (name, dtype)."""
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape))
+        buffer = self._buffers.get((name, dtype))
+        if buffer is None or buffer.size < size:
+            buffer = self._buffers[(name, dtype)] = np.empty(size, dtype=dtype)
+        return buffer[:size].reshape(shape)
+
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+    def __getstate__(self):
+        # Buffers are per process; a pool sent to a worker starts empty.
+        return {"_buffers": {}}
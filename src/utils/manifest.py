@@ -0,0 +1,254 @@
+"""
+Byte-offset index over "path|text" and TSV metadata files, and the samplers used to pick clips
+Author: Ye Bhone Lin
+
+    index = ManifestIndex("metadata.txt")           # or ManifestIndex("metadata.tsv", sep="\t", header=True)
+    rows = sample_entries(index, 1000, seed=1)      # [[path, text], ...]
+    rows = sample_entries(index, 1000, seed=1, stratify="duration")
+    rows = reservoir_sample(iter_rows(sys.stdin), 1000, seed=1)
+
+A ManifestIndex keeps one uint64 start offset per row instead of the rows themselves.
+The offsets are built in one vectorised pass over the file and saved next to it as
+<manifest>.idx.npy (with <manifest>.idx.json recording the file size and mtime it was
+built from), so later runs open them memory-mapped, and a row is only read and parsed
+when it is indexed. "|" rows are split on the first "|" only, so transcripts may contain
+"|"; TSV rows are parsed with the csv module like before. Rows are the same ones the
+pipelines used to keep in memory: lines containing the separator.
+
+sample_entries() works on any sequence of rows (an index, or the rows of an
+ArrowAudioSource) and draws the same rows as random.Random(seed).sample(), touching only
+the k rows it returns. With stratify, the sample is spread over strata in proportion to
+their size: a column (index, or name with a TSV header) such as a speaker column, or
+"duration", binned into quantiles (durations are read once from the clip headers and
+cached next to the index).
+"""
+
+import csv
+import json
+import math
+import mmap
+import os
+import random
+from collections.abc import Sequence
+from itertools import islice
+from pathlib import Path
+import numpy as np
+import soundfile as sf
+
+
+_CHUNK = 1 << 24
+
+
+def _parse(line, sep):
+    line = line.rstrip("\r\n")
+    if sep == "|":
+        return line.strip().split("|", 1)
+    return next(csv.reader([line], delimiter=sep))
+
+
+def iter_rows(f, sep="|"):
+    """Rows of a text stream (e.g. sys.stdin) with the same rules as ManifestIndex, for reservoir_sample."""
+    for line in f:
+        if sep in line:
+            row = _parse(line, sep)
+            if len(row) >= 2:
+                yield row
+
+
+class ManifestIndex(Sequence):
+    """
+    Random access to the rows of a metadata file through a cached offset index.
+    header=True skips the first line (the "audio", "prompt" header of exported TSVs) and
+    keeps its fields as column names for stratify.
+    """
+
+    def __init__(self, path, sep="|", header=False):
+        self.path = Path(path)
+        self.sep = sep
+        self.header = header
+        self.index_path = self.path.with_name(self.path.name + ".idx.npy")
+        self._info_path = self.path.with_name(self.path.name + ".idx.json")
+        self._durations_path = self.path.with_name(self.path.name + ".dur.npy")
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, "rb")
+        # mmap cannot map an empty file.
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(
+            self._file.fileno()).st_size else b""
+        self.columns = _parse(self._line(0).decode("utf-8"), self.sep) if self.header and self._data else None
+        self.offsets = self._load_offsets()
+
+    def _identity(self):
+        st = self.path.stat()
+        return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sep": self.sep, "header": self.header}
+
+    def _load_offsets(self):
+        identity = self._identity()
+        try:
+            with open(self._info_path, "r", encoding="utf-8") as f:
+                if json.load(f) == identity:
+                    return np.load(self.index_path, mmap_mode="r")
+        except (OSError, ValueError):
+            pass
+
+        offsets = self._build()
+        try:
+            tmp_path = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, offsets)
+            os.replace(tmp_path, self.index_path)
+            with open(self._info_path, "w", encoding="utf-8") as f:
+                json.dump(identity, f)
+        except OSError as e:
+            print(f"Warning: could not cache the manifest index next to {self.path}: {e}")
+        return offsets
+
+    def _build(self):
+        """Start offsets of every line that contains the separator, found chunk by chunk."""
+        data = np.frombuffer(self._data, dtype=np.uint8) if self._data else np.zeros(0, dtype=np.uint8)
+        newline, sep = ord("\n"), ord(self.sep)
+        starts, ends, seps = [np.zeros(1, dtype=np.uint64)], [], []
+        for begin in range(0, len(data), _CHUNK):
+            chunk = data[begin:begin + _CHUNK]
+            breaks = np.flatnonzero(chunk == newline).astype(np.uint64) + np.uint64(begin)
+            starts.append(breaks + np.uint64(1))
+            ends.append(breaks)
+            seps.append(np.flatnonzero(chunk == sep).astype(np.uint64) + np.uint64(begin))
+        starts = np.concatenate(starts)
+        ends = np.concatenate(ends + [np.array([len(data)], dtype=np.uint64)])
+        seps = np.concatenate(seps) if seps else np.zeros(0, dtype=np.uint64)
+        if starts[-1] >= len(data):
+            starts, ends = starts[:-1], ends[:-1]
+        if self.header:
+            starts, ends = starts[1:], ends[1:]
+        has_sep = np.searchsorted(seps, ends) > np.searchsorted(seps, starts)
+        return starts[has_sep]
+
+    def _line(self, offset):
+        end = self._data.find(b"\n", offset)
+        return self._data[offset:end if end >= 0 else len(self._data)]
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return _parse(self._line(int(self.offsets[i])).decode("utf-8"), self.sep)
+
+    def column(self, column):
+        """The position of a column given by index or, with a header, by name."""
+        if isinstance(column, int):
+            return column
+        if self.columns is None or column not in self.columns:
+            raise ValueError(f"Unknown column {column!r}; columns: {self.columns}")
+        return self.columns.index(column)
+
+    def durations(self):
+        """Clip durations in seconds (NaN when unreadable), read once and cached next to the index."""
+        try:
+            if self._durations_path.stat().st_mtime_ns >= self.index_path.stat().st_mtime_ns:
+                durations = np.load(self._durations_path, mmap_mode="r")
+                if len(durations) == len(self):
+                    return durations
+        except (OSError, ValueError):
+            pass
+        durations = clip_durations(self)
+        try:
+            np.save(self._durations_path, durations)
+        except OSError:
+            pass
+        return durations
+
+    def __getstate__(self):
+        # The open file and mapping are per process.
+        return {"path": self.path, "sep": self.sep, "header": self.header}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+
+def clip_durations(entries):
+    durations = np.full(len(entries), np.nan, dtype=np.float32)
+    for i, entry in enumerate(entries):
+        try:
+            durations[i] = sf.info(str(Path(entry[0]).resolve())).duration
+        except Exception:
+            pass
+    return durations
+
+
+def _strata(entries, stratify, bins):
+    """One integer stratum per entry."""
+    if stratify == "duration":
+        durations = np.asarray(entries.durations() if hasattr(entries, "durations") else clip_durations(entries))
+        known = ~np.isnan(durations)
+        keys = np.full(len(durations), bins, dtype=np.int64)
+        if known.any():
+            edges = np.quantile(durations[known], np.linspace(0, 1, bins + 1)[1:-1])
+            keys[known] = np.searchsorted(edges, durations[known], side="right")
+        return keys
+    column = entries.column(stratify) if isinstance(entries, ManifestIndex) else stratify
+    if not isinstance(column, int):
+        raise ValueError(f"stratify must be 'duration' or a column index, got {stratify!r}")
+    _, keys = np.unique(np.array([entry[column] for entry in entries], dtype=object).astype(str),
+                        return_inverse=True)
+    return keys
+
+
+def sample_entries(entries, k, seed, stratify=None, bins=10):
+    """
+    k rows of entries, drawn with a seeded random.Random. Without stratify these are the
+    rows random.Random(seed).sample(entries, k) picks, and only they are read. With
+    stratify ("duration" or a column), every stratum gets its proportional share (largest
+    remainders first) and is sampled on its own.
+    """
+    rng = random.Random(seed)
+    if stratify is None:
+        # Sampling indices draws what sample(entries, k) would, but random.sample copies
+        # a population that is large next to k into a list, reading every row.
+        return [entries[i] for i in rng.sample(range(len(entries)), k)]
+
+    keys = _strata(entries, stratify, bins)
+    order = np.argsort(keys, kind="stable")
+    sizes = np.bincount(keys)
+    shares = k * sizes / len(keys)
+    quotas = np.floor(shares).astype(np.int64)
+    for stratum in np.argsort(-(shares - quotas), kind="stable")[:k - quotas.sum()]:
+        quotas[stratum] += 1
+
+    selected, start = [], 0
+    for size, quota in zip(sizes, quotas):
+        members = order[start:start + size]
+        selected += [entries[int(members[j])] for j in rng.sample(range(size), int(quota))]
+        start += size
+    return selected
+
+
+def reservoir_sample(rows, k, seed):
+    """
+    k rows from an iterable of unknown length in one pass and O(k) memory (Li's
+    Algorithm L, which skips ahead instead of drawing per row); the same seed and input
+    give the same sample.
+    """
+    rng = random.Random(seed)
+    rows = iter(rows)
+    reservoir = list(islice(rows, k))
+    if len(reservoir) < k or k == 0:
+        return reservoir
+
+    def uniform():
+        u = rng.random()
+        while u == 0.0:
+            u = rng.random()
+        return u
+
+    w = math.exp(math.log(uniform()) / k)
+    while True:
+        skip = math.floor(math.log(uniform()) / math.log(1 - w))
+        row = next(islice(rows, skip, skip + 1), None)
+        if row is None:
+            return reservoir
+        reservoir[rng.randrange(k)] = row
+        w *= math.exp(math.log(uniform()) / k)
@@ -0,0 +1,199 @@
+"""
+Per-stage timing, counters and progress reporting for the augmentation engines
+Author: Ye Bhone Lin
+
+    metrics = Metrics(verbosity=1, summary_path="run_summary.json", events_path="events.jsonl")
+    Augmentation("metadata.txt", "output_of_aug").augment(10, ["noise"], metrics=metrics)
+
+verbosity=0 prints warnings only, 1 (the default) prints a progress line every `interval`
+seconds and a summary at the end, 2 also prints one line per output like older versions.
+Stage timers (decode, feature, augment/<method>, inversion, normalise, encode, write, ...)
+are collected per job, also inside worker processes, and merged into the run's totals.
+Metrics(enabled=False) turns timers and events off; every timer is then a shared no-op.
+"""
+
+import json
+import threading
+import time
+from contextlib import nullcontext
+
+
+class _Span:
+    __slots__ = ("times", "stage", "start")
+
+    def __init__(self, times, stage):
+        self.times = times
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.times.add(self.stage, time.perf_counter() - self.start)
+
+
+class StageTimes:
+    """Wall time and call count per stage; `with times("decode"): ...` times one call."""
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, stage):
+        return _Span(self, stage)
+
+    def add(self, stage, seconds, calls=1):
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+            self.calls[stage] = self.calls.get(stage, 0) + calls
+
+    def snapshot(self):
+        """Picklable {stage: (calls, seconds)}, e.g. to send back from a worker process."""
+        with self._lock:
+            return {stage: (self.calls[stage], self.seconds[stage]) for stage in self.seconds}
+
+    def merge(self, snapshot):
+        for stage, (calls, seconds) in (snapshot or {}).items():
+            self.add(stage, seconds, calls)
+
+
+class _NullTimes:
+    _null = nullcontext()
+
+    def __call__(self, stage):
+        return self._null
+
+    def add(self, stage, seconds, calls=1):
+        pass
+
+    def snapshot(self):
+        return None
+
+    def merge(self, snapshot):
+        pass
+
+
+NULL_TIMES = _NullTimes()
+
+
+def job_times(enabled):
+    """A fresh StageTimes for one job, or the shared no-op when metrics are off."""
+    return StageTimes() if enabled else NULL_TIMES
+
+
+class Metrics:
+    def __init__(self, enabled=True, verbosity=1, interval=10.0, summary_path=None, events_path=None):
+        self.enabled = enabled
+        self.verbosity = verbosity
+        self.interval = interval
+        self.summary_path = summary_path
+        self.times = StageTimes() if enabled else NULL_TIMES
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._events = open(events_path, "a", encoding="utf-8") if enabled and events_path else None
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.audio_seconds = 0.0
+        self.started = time.perf_counter()
+        self._last_report = self.started
+
+    def start(self, total, skipped=0):
+        """Begin a run of `total` outputs; `skipped` were already done by an earlier run."""
+        self.total = total
+        self.started = self._last_report = time.perf_counter()
+        if skipped:
+            self.count("skipped", skipped)
+        self.event("start", total=total, skipped=skipped)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def event(self, kind, **fields):
+        if self._events is None:
+            return
+        line = json.dumps(dict(t=round(time.perf_counter() - self.started, 6), event=kind, **fields),
+                          ensure_ascii=False, default=str)
+        with self._lock:
+            self._events.write(line + "\n")
+
+    def warn(self, message, **fields):
+        print(f"Warning: {message}")
+        self.event("warning", message=message, **fields)
+
+    def output(self, ref, clip=None, method=None, audio_seconds=0.0):
+        """Record one finished output; prints progress every `interval` seconds."""
+        with self._lock:
+            self.done += 1
+            self.audio_seconds += audio_seconds
+            now = time.perf_counter()
+            report = now - self._last_report >= self.interval
+            if report:
+                self._last_report = now
+        if self.verbosity >= 2:
+            print(f"Augmented: {ref}")
+        self.event("output", ref=ref, clip=clip, method=method, audio_seconds=round(audio_seconds, 3))
+        if report and self.verbosity >= 1:
+            print(self.progress_line())
+
+    def failure(self, clip, method, error):
+        with self._lock:
+            self.failed += 1
+        self.warn(f"failed to augment {clip} with {method}: {error}", clip=clip, method=method)
+
+    def progress_line(self):
+        elapsed = time.perf_counter() - self.started
+        finished = self.done + self.failed
+        rate = finished / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - finished) / rate if rate > 0 else float("inf")
+        line = (f"[{finished}/{self.total}] {rate:.2f} outputs/s, "
+                f"{self.audio_seconds / elapsed if elapsed > 0 else 0.0:.1f}x realtime, "
+                f"elapsed {_duration(elapsed)}, ETA {_duration(eta)}")
+        self.event("progress", done=self.done, failed=self.failed, total=self.total, rate=rate, eta=eta)
+        return line
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        stages = {}
+        for stage, (calls, seconds) in sorted((self.times.snapshot() or {}).items()):
+            stages[stage] = {"calls": calls, "seconds": round(seconds, 6), "mean_ms": round(1000 * seconds / calls, 3)}
+        return {
+            "outputs": self.done,
+            "failed": self.failed,
+            "total": self.total,
+            "elapsed_seconds": round(elapsed, 3),
+            "outputs_per_second": self.done / elapsed if elapsed > 0 else 0.0,
+            "audio_seconds": round(self.audio_seconds, 3),
+            "realtime_factor": self.audio_seconds / elapsed if elapsed > 0 else 0.0,
+            "stages": stages,
+            "counters": dict(self.counters),
+        }
+
+    def finish(self):
+        """Print and save the run summary, close the event log and return the summary."""
+        summary = self.summary()
+        self.event("summary", **summary)
+        if self._events is not None:
+            self._events.close()
+            self._events = None
+        if self.summary_path:
+            with open(self.summary_path, "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=2)
+        if self.verbosity >= 1:
+            print(f"Done: {summary['outputs']} outputs, {summary['failed']} failed in "
+                  f"{_duration(summary['elapsed_seconds'])} ({summary['outputs_per_second']:.2f} outputs/s, "
+                  f"{summary['realtime_factor']:.1f}x realtime)")
+            for stage, entry in summary["stages"].items():
+                print(f"  {stage:<24} {entry['calls']:>8} calls {entry['seconds']:>10.2f} s "
+                      f"{entry['mean_ms']:>10.2f} ms/call")
+        return summary
+
+
+def _duration(seconds):
+    if seconds == float("inf"):
+        return "?"
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
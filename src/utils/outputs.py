@@ -0,0 +1,232 @@
+"""
+Output backends for augmented audio: one WAV per clip, or packed shard files
+Author: Ye Bhone Lin
+
+Both backends expose write(method, name, audio, sr[, times]) and write_blocks(method,
+name, blocks, sr, channels) and return the reference that goes into aug_metadata.txt:
+the absolute WAV path, or "<shard>:<offset>:<frames>[:<channels>]" for shards. `times`
+(see src/utils/metrics.py) receives the encode and write timings.
+
+A shard is a flat file of little-endian int16 PCM (the same quantisation as the PCM_16
+WAVs) under output_dir/<method>/. Offsets and frame counts are in frames, so a clip is
+a contiguous slice that ShardReader returns as a zero-copy memmap view. Every process
+writes its own shards (the pid, and on sharded runs the node's shard index, is part of
+the name), so pool workers never share a file; threads within a process take turns
+through a lock.
+
+MetadataWriter appends aug_metadata lines for long-lived writers (SingleAugHF, the
+augmentation service): the file stays open, lines are buffered, and each flush is one
+write() of whole lines, so processes appending to the same file never split a line.
+"""
+
+import io
+import json
+import os
+import threading
+from pathlib import Path
+import numpy as np
+import soundfile as sf
+
+from .metrics import NULL_TIMES
+
+
+OUTPUT_FORMATS = ("wav", "shards")
+
+
+def _to_pcm16(audio):
+    # Same float -> int16 conversion as libsndfile, so shards hold the samples a PCM_16 WAV would.
+    return np.clip(np.floor(np.asarray(audio) * 32768), -32768, 32767).astype("<i2")
+
+
+class WavOutput:
+    def __init__(self, output_dir):
+        self.output_dir = Path(output_dir)
+
+    def path(self, method, name):
+        return self.output_dir / method / f"{method}_{name}"
+
+    def write(self, method, name, audio, sr, times=NULL_TIMES):
+        out_path = self.path(method, name)
+        with times("encode"):
+            buffer = io.BytesIO()
+            sf.write(buffer, audio, sr, format="WAV", subtype="PCM_16")
+        with times("write"):
+            with open(out_path, "wb") as f:
+                f.write(buffer.getbuffer())
+        return str(out_path.resolve())
+
+    def write_blocks(self, method, name, blocks, sr, channels):
+        out_path = self.path(method, name)
+        with sf.SoundFile(str(out_path), "w", samplerate=sr, channels=channels, format="WAV", subtype="PCM_16") as out:
+            for block in blocks:
+                out.write(block)
+        return str(out_path.resolve())
+
+
+class ShardOutput:
+    def __init__(self, output_dir, sr, max_shard_bytes=1 << 30, prefix=""):
+        """prefix: put in front of the pid in shard names, e.g. to keep machines apart."""
+        self.output_dir = Path(output_dir)
+        self.sr = sr
+        self.max_shard_bytes = max_shard_bytes
+        self.prefix = prefix
+        self._files = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        # Every process of every node writes the same content; replace it atomically.
+        tmp_path = self.output_dir / f"shards.json.{prefix}{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"sr": sr, "dtype": "int16"}, f)
+        os.replace(tmp_path, self.output_dir / "shards.json")
+
+    def __getstate__(self):
+        # Open shard files stay with the process that opened them.
+        state = self.__dict__.copy()
+        state["_files"], state["_counts"] = {}, {}
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _shard(self, method, channels):
+        f = self._files.get((method, channels))
+        if f is None or f.tell() >= self.max_shard_bytes:
+            if f is not None:
+                f.close()
+            count = self._counts.get((method, channels), 0)
+            self._counts[(method, channels)] = count + 1
+            suffix = f"-c{channels}" if channels > 1 else ""
+            shard_path = self.output_dir / method / f"shard-{self.prefix}{os.getpid()}-{count:05d}{suffix}.pcm"
+            f = self._files[(method, channels)] = open(shard_path, "ab")
+        return f
+
+    def _ref(self, f, offset_bytes, frames, channels):
+        rel = Path(f.name).relative_to(self.output_dir).as_posix()
+        ref = f"{rel}:{offset_bytes // (2 * channels)}:{frames}"
+        return f"{ref}:{channels}" if channels > 1 else ref
+
+    def write(self, method, name, audio, sr, times=NULL_TIMES):
+        channels = 1 if audio.ndim == 1 else audio.shape[1]
+        with times("encode"):
+            pcm = _to_pcm16(audio).tobytes()
+        with times("write"), self._lock:
+            f = self._shard(method, channels)
+            offset = f.tell()
+            f.write(pcm)
+            f.flush()
+            return self._ref(f, offset, len(audio), channels)
+
+    def write_blocks(self, method, name, blocks, sr, channels):
+        with self._lock:
+            f = self._shard(method, channels)
+            offset, frames = f.tell(), 0
+            for block in blocks:
+                f.write(_to_pcm16(block).tobytes())
+                frames += len(block)
+            f.flush()
+            return self._ref(f, offset, frames, channels)
+
+    def close(self):
+        with self._lock:
+            for f in self._files.values():
+                f.close()
+            self._files = {}
+
+
+class MetadataWriter:
+    def __init__(self, path, flush_lines=256):
+        """path is opened for appending on the first flush; flush_lines: flush once this many lines are buffered."""
+        self.path = Path(path)
+        self.flush_lines = flush_lines
+        self._lines = []
+        self._fd = None
+        self._lock = threading.Lock()
+
+    def append(self, line):
+        with self._lock:
+            self._lines.append(line if line.endswith("\n") else line + "\n")
+            if len(self._lines) >= self.flush_lines:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._lines:
+            return
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        data = "".join(self._lines).encode("utf-8")
+        self._lines = []
+        while data:
+            data = data[os.write(self._fd, data):]
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+def make_output(output_format, output_dir, sr, max_shard_bytes=1 << 30, prefix=""):
+    if output_format == "wav":
+        return WavOutput(output_dir)
+    if output_format == "shards":
+        return ShardOutput(output_dir, sr, max_shard_bytes=max_shard_bytes, prefix=prefix)
+    raise ValueError(f"Unknown output format: {output_format}")
+
+
+class ShardReader:
+    """
+    Zero-copy access to clips written by ShardOutput.
+
+    reader = ShardReader("output_of_aug")
+    pcm = reader.get("noise/shard-1234-00000.pcm:48000:32000")   # int16 memmap view
+    audio = reader.load(ref)                                       # float32 copy in [-1, 1)
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = Path(output_dir)
+        with open(self.output_dir / "shards.json", "r", encoding="utf-8") as f:
+            self.sr = json.load(f)["sr"]
+        self._maps = {}
+
+    def _map(self, shard, channels):
+        data = self._maps.get(shard)
+        if data is None:
+            data = np.memmap(self.output_dir / shard, dtype="<i2", mode="r")
+            data = self._maps[shard] = data.reshape(-1, channels) if channels > 1 else data
+        return data
+
+    def get(self, ref):
+        shard, offset, frames, *rest = ref.split(":")
+        channels = int(rest[0]) if rest else 1
+        offset, frames = int(offset), int(frames)
+        return self._map(shard, channels)[offset:offset + frames]
+
+    def read_bytes(self, ref):
+        """The clip's raw PCM bytes, read from the file instead of a cached map (sees growing shards)."""
+        shard, offset, frames, *rest = ref.split(":")
+        frame_bytes = 2 * (int(rest[0]) if rest else 1)
+        with open(self.output_dir / shard, "rb") as f:
+            f.seek(int(offset) * frame_bytes)
+            data = f.read(int(frames) * frame_bytes)
+        if len(data) != int(frames) * frame_bytes:
+            raise ValueError(f"Shard {shard} is shorter than {ref} expects")
+        return data
+
+    def load(self, ref):
+        return self.get(ref).astype(np.float32) / 32768.0
+
+    def read_metadata(self, sep="|"):
+        """Yields (ref, text) pairs from the aug_metadata.txt next to the shards."""
+        with open(self.output_dir / "aug_metadata.txt", "r", encoding="utf-8") as f:
+            for line in f:
+                ref, _, text = line.rstrip("\n").partition(sep)
+                yield ref, text
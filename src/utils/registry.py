@@ -0,0 +1,82 @@
+"""
+Named, pluggable augmenter registries
+Author: Ye Bhone Lin
+
+    from src.wave_augmentation.pipeline import WAVE_AUGMENTERS
+
+    @WAVE_AUGMENTERS.register("reverb")
+    def make_reverb(sr):
+        return MyReverb(sr)          # an object with augment(data), or a function of data
+
+A Registry maps method names to what was registered: factories for the waveform
+augmenters (called with the sample rate), plain functions for the spectrogram methods.
+Registering never imports or builds anything, so the heavy libraries behind the built-in
+methods (nlpaug, cv2, scipy.signal) are only imported by the first run that uses one of
+them. registry.bind(sr) returns a read-only mapping that builds each entry on first
+access and keeps it. Process pools pickle registries by value, so entries used there must
+be picklable (module-level functions or functools.partial, not lambdas).
+"""
+
+from collections.abc import Mapping
+
+
+class Registry(Mapping):
+    def __init__(self, kind):
+        self.kind = kind
+        self._entries = {}
+
+    def register(self, name, entry=None, replace=False):
+        """Register entry under name; without entry, returns a decorator."""
+        if entry is None:
+            return lambda entry: self.register(name, entry, replace=replace)
+        if name in self._entries and not replace:
+            raise ValueError(f"{self.kind} '{name}' is already registered; pass replace=True to override it")
+        self._entries[name] = entry
+        return entry
+
+    def unregister(self, name):
+        del self._entries[name]
+
+    def bind(self, *args):
+        return _Bound(self, args)
+
+    def __getitem__(self, name):
+        return self._entries[name]
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"Registry({self.kind!r}, {list(self._entries)})"
+
+
+class _Bound(Mapping):
+    """The registry's entries built with fixed arguments, each on first access."""
+
+    def __init__(self, registry, args):
+        self._registry = registry
+        self._args = args
+        self._built = {}
+
+    def __getitem__(self, name):
+        built = self._built.get(name)
+        if built is None:
+            built = self._built[name] = self._registry[name](*self._args)
+        return built
+
+    def __contains__(self, name):
+        # Mapping's default would build the entry just to check for it.
+        return name in self._registry
+
+    def __iter__(self):
+        return iter(self._registry)
+
+    def __len__(self):
+        return len(self._registry)
+
+    def __getstate__(self):
+        # Built entries are per process; a worker builds its own on first use.
+        return {"_registry": self._registry, "_args": self._args, "_built": {}}
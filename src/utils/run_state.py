@@ -0,0 +1,204 @@
+"""
+Resumable, incremental augmentation runs
+Author: Ye Bhone Lin
+
+A resumable run keeps two files next to aug_metadata.txt:
+
+- run.json: the run seed, the sampling percent, the selected metadata entries, how many
+  metadata rows have been considered for sampling, and the methods requested so far.
+- completed.jsonl: a write-ahead log with one line per finished output (clip, method,
+  reference, SHA-1 of the written samples, and the parameters that produced it),
+  appended and fsynced right after the output is written.
+
+On restart, an output is skipped only if its log entry has the same parameters and its
+file (or shard slice) still has the recorded checksum; missing or corrupt outputs are
+redone. Metadata rows appended since the last call (rows past the recorded count, found
+in O(1) through the manifest index) are sampled with the saved percent and added to the
+selection, and newly requested methods are added to the run.
+"""
+
+import hashlib
+import json
+import os
+import random
+import threading
+from collections.abc import Sequence
+from pathlib import Path
+
+from .manifest import ManifestIndex, sample_entries
+from .outputs import ShardReader
+from .seeds import derive_seed
+from .sharding import make_shard
+
+
+class RunState:
+    def __init__(self, output_dir, params, tag=None):
+        """
+        params: everything besides the per-output seed that changes an output (sr, backend, ...).
+        tag: kept in the file names (run.<tag>.json, completed.<tag>.jsonl), so the shards of
+        a sharded run (src/utils/sharding.py) keep separate state in one output_dir.
+        """
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        suffix = f".{tag}" if tag else ""
+        self.run_path = self.output_dir / f"run{suffix}.json"
+        self.log_path = self.output_dir / f"completed{suffix}.jsonl"
+        self.params = params
+        self.run = None
+        self._completed = self._load_log()
+        self._lock = threading.Lock()
+        self._reader = None
+
+    def _load_log(self):
+        completed = {}
+        if not self.log_path.exists():
+            return completed
+        with open(self.log_path, "rb+") as f:
+            data = f.read()
+            # Drop a record that a crash cut short, so new records start on a fresh line.
+            f.truncate(data.rfind(b"\n") + 1)
+        for line in data.decode("utf-8").splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            completed[(record["clip"], record["method"])] = record
+        return completed
+
+    def _save_run(self):
+        tmp_path = self.run_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.run, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.run_path)
+
+    def select(self, entries, percent, methods, seed=None, stratify=None):
+        """
+        Returns (run_seed, selected entries, methods). The first call samples percent of
+        entries and saves the selection; later calls reuse it, sample percent of the rows
+        appended to entries since then, and add methods that were not requested before.
+        stratify is passed to sample_entries (src/utils/manifest.py).
+        """
+        if not self.run_path.exists():
+            run_seed = random.randrange(2**32) if seed is None else seed
+            sample_count = max(1, int(len(entries) * percent / 100))
+            self.run = {
+                "run_seed": run_seed,
+                "percent": percent,
+                "methods": list(dict.fromkeys(methods)),
+                "selection": sample_entries(entries, sample_count, run_seed, stratify=stratify),
+                "rows": len(entries),
+            }
+            self._save_run()
+            return self.run["run_seed"], self.run["selection"], self.run["methods"]
+
+        with open(self.run_path, "r", encoding="utf-8") as f:
+            self.run = json.load(f)
+        if seed is not None and seed != self.run["run_seed"]:
+            print(f"Warning: resuming with the saved run seed {self.run['run_seed']} instead of {seed}")
+        if percent != self.run["percent"]:
+            print(f"Warning: resuming with the saved percent {self.run['percent']} instead of {percent}")
+
+        changed = False
+        seen = self.run["rows"]
+        if len(entries) < seen:
+            print(f"Warning: the metadata has {len(entries)} rows, fewer than the {seen} this run has sampled "
+                  f"from; only rows appended past row {seen} are treated as new")
+        elif len(entries) > seen:
+            if isinstance(entries, ManifestIndex) and stratify not in (None, "duration"):
+                # The new rows are a plain sequence, which only knows column indices.
+                stratify = entries.column(stratify)
+            new_entries = _Tail(entries, seen)
+            sample_count = max(1, int(len(new_entries) * self.run["percent"] / 100))
+            increment_seed = derive_seed(self.run["run_seed"], "increment", seen)
+            added = sample_entries(new_entries, sample_count, increment_seed, stratify=stratify)
+            print(f"Incremental run: {len(new_entries)} new entries, {len(added)} selected")
+            self.run["selection"] += added
+            self.run["rows"] = len(entries)
+            changed = True
+        new_methods = [method for method in methods if method not in self.run["methods"]]
+        if new_methods:
+            self.run["methods"] += list(dict.fromkeys(new_methods))
+            changed = True
+        if changed:
+            self._save_run()
+        return self.run["run_seed"], self.run["selection"], self.run["methods"]
+
+    def checksum(self, ref):
+        if self.params.get("output_format") == "shards":
+            if self._reader is None:
+                self._reader = ShardReader(self.output_dir)
+            return hashlib.sha1(self._reader.read_bytes(ref)).hexdigest()
+        with open(ref, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    def completed_ref(self, clip, method, seed):
+        """The reference of a valid earlier output for (clip, method), or None if it must be (re)done."""
+        record = self._completed.get((str(clip), method))
+        if record is None or record["params"] != dict(self.params, seed=seed):
+            return None
+        try:
+            valid = self.checksum(record["ref"]) == record["checksum"]
+        except (OSError, ValueError):
+            valid = False
+        return record["ref"] if valid else None
+
+    def record(self, clip, method, seed, ref):
+        """Append a finished output to the log; called once its audio is fully written."""
+        record = {
+            "clip": str(clip),
+            "method": method,
+            "ref": ref,
+            "checksum": self.checksum(ref),
+            "params": dict(self.params, seed=seed),
+        }
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._completed[(record["clip"], method)] = record
+
+
+def select_clips(entries, percent, methods, output_dir, params, seed=None, stratify=None, resume=False,
+                 shard_index=0, num_shards=1):
+    """
+    Returns (run_seed, clips, methods, state, shard) for a run, clips being (clip, text)
+    rows. percent of entries are sampled with seed (a random one if None), spread over
+    stratify's strata if given (see sample_entries in src/utils/manifest.py). resume=True
+    keeps the selection in a RunState over output_dir with params, so a later call only
+    does missing outputs, new rows and new methods. With num_shards > 1 only shard_index's
+    rows are kept (see src/utils/sharding.py).
+    """
+    shard = make_shard(shard_index, num_shards, seed)
+    state = None
+    if resume:
+        state = RunState(output_dir, params, tag=shard.name if shard else None)
+        run_seed, selected, methods = state.select(entries, percent, methods, seed=seed, stratify=stratify)
+    else:
+        run_seed = random.randrange(2**32) if seed is None else seed
+        selected = sample_entries(entries, max(1, int(len(entries) * percent / 100)), run_seed, stratify=stratify)
+    clips = [(row[0], row[1]) for row in selected]
+    if shard is not None:
+        clips = shard.select(clips)
+    return run_seed, clips, methods, state, shard
+
+
+class _Tail(Sequence):
+    """entries[start:] without copying, so only the sampled rows are read."""
+
+    def __init__(self, entries, start):
+        self.entries = entries
+        self.start = start
+
+    def __len__(self):
+        return len(self.entries) - self.start
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return self.entries[self.start + i]
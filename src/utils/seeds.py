@@ -0,0 +1,18 @@
+"""
+Deterministic per-output seeds shared by the wave and spectrogram pipelines
+Author: Ye Bhone Lin
+"""
+
+import hashlib
+
+
+def derive_seed(run_seed, *keys):
+    """
+    Derive a 32-bit seed from the run seed and the given keys (e.g. clip path and method).
+    The result only depends on its inputs, so it is the same in every worker process.
+    Clips are keyed by their path as written in the metadata, not the resolved path, so
+    seeds do not change when the corpus is moved or mounted elsewhere.
+    """
+    key = "|".join(str(k) for k in (run_seed,) + keys)
+    digest = hashlib.sha256(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "little")
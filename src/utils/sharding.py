@@ -0,0 +1,192 @@
+"""
+Splitting one augmentation run across machines, and merging their metadata
+Author: Ye Bhone Lin
+
+Every node runs the same augment() call with the same seed and its own shard_index:
+
+    Augmentation("metadata.txt", "/shared/out").augment(10, tech, seed=1234, shard_index=3, num_shards=8)
+
+All nodes sample the same global selection; a clip belongs to the shard its metadata
+path hashes to, so the split needs no coordination and a clip stays on the same shard
+when a resumed run adds rows. Shard k of n writes aug_metadata.shard-0000k-of-0000n.txt
+and a .json plan next to it (the shard's clips with their positions in the global
+selection, and which (method, clip) every metadata line is), and resumable runs keep
+per-shard run/completed files, so nodes sharing output_dir never write the same file.
+Once every node is done:
+
+    python -m src.utils.sharding merge /shared/out
+
+writes aug_metadata.txt in the order a single-node run would (method by method, clips in
+selection order), drops duplicate lines, and reports missing shards and outputs.
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+from .seeds import derive_seed
+
+
+class ShardSpec:
+    def __init__(self, shard_index, num_shards):
+        if num_shards < 1 or not 0 <= shard_index < num_shards:
+            raise ValueError(f"shard_index must be in [0, {num_shards}), got {shard_index}")
+        self.shard_index = shard_index
+        self.num_shards = num_shards
+        self.name = f"shard-{shard_index:05d}-of-{num_shards:05d}"
+        self.positions = {}
+        self.selected = 0
+
+    def owns(self, clip):
+        return derive_seed("shard", clip) % self.num_shards == self.shard_index
+
+    def select(self, clips):
+        """This shard's part of the global selection; clips are (clip, text) rows."""
+        self.selected = len(clips)
+        own = []
+        for position, (clip, text) in enumerate(clips):
+            if self.owns(clip) and clip not in self.positions:
+                self.positions[clip] = position
+                own.append((clip, text))
+        return own
+
+    def metadata_path(self, output_dir):
+        return Path(output_dir) / f"aug_metadata.{self.name}.txt"
+
+    def plan_path(self, output_dir):
+        return Path(output_dir) / f"aug_metadata.{self.name}.json"
+
+
+def make_shard(shard_index, num_shards, seed):
+    """A ShardSpec for shard_index of num_shards, or None for an unsharded run."""
+    if num_shards is None or num_shards == 1:
+        return None
+    if seed is None:
+        raise ValueError("A sharded run needs a seed, so every node samples the same clips")
+    return ShardSpec(shard_index, num_shards)
+
+
+def _write_atomic(path, text):
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_metadata(output_dir, methods, selected, refs, sep, run_seed=None, shard=None):
+    """
+    Write the metadata lines (method by method, clips in selection order) of a run.
+    selected holds (clip, wav_path, text) and refs maps (wav_path, method) to the
+    output's reference. A sharded run writes its own metadata file and plan.
+    """
+    lines, plan_lines = [], []
+    for method in methods:
+        for clip, wav_path, text in selected:
+            ref = refs.get((wav_path, method))
+            if ref is not None:
+                lines.append(f"{ref}{sep}{text.strip()}\n")
+                if shard is not None:
+                    plan_lines.append([method, shard.positions[clip]])
+
+    if shard is None:
+        with open(Path(output_dir) / "aug_metadata.txt", "w", encoding="utf-8") as meta_out:
+            meta_out.writelines(lines)
+        return
+
+    plan = {
+        "shard_index": shard.shard_index,
+        "num_shards": shard.num_shards,
+        "run_seed": run_seed,
+        "sep": sep,
+        "selected": shard.selected,
+        "methods": list(methods),
+        "clips": [[position, clip] for clip, position in shard.positions.items()],
+        "lines": plan_lines,
+    }
+    # The plan goes last: a plan only exists once its metadata file is complete.
+    _write_atomic(shard.metadata_path(output_dir), "".join(lines))
+    _write_atomic(shard.plan_path(output_dir), json.dumps(plan, ensure_ascii=False))
+
+
+def merge_shards(output_dir):
+    """
+    Merge the per-shard metadata of output_dir into aug_metadata.txt. Returns a report:
+    shard and clip counts, missing shards, duplicate lines dropped, and the (clip, method)
+    outputs that no shard wrote.
+    """
+    output_dir = Path(output_dir)
+    plans = []
+    for plan_path in sorted(output_dir.glob("aug_metadata.shard-*-of-*.json")):
+        with open(plan_path, "r", encoding="utf-8") as f:
+            plan = json.load(f)
+        with open(plan_path.with_suffix(".txt"), "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        if len(lines) != len(plan["lines"]):
+            raise ValueError(f"{plan_path.with_suffix('.txt')} does not match its plan")
+        plans.append((plan, lines))
+    if not plans:
+        raise FileNotFoundError(f"No shard metadata in {output_dir}")
+
+    first = plans[0][0]
+    for plan, _ in plans:
+        for field in ("num_shards", "run_seed", "selected"):
+            if plan[field] != first[field]:
+                raise ValueError(f"Shards disagree on {field}: {plan[field]} != {first[field]}")
+
+    methods, merged, duplicates, missing = [], {}, 0, []
+    for plan, lines in plans:
+        methods += [method for method in plan["methods"] if method not in methods]
+        for (method, position), line in zip(plan["lines"], lines):
+            if (method, position) in merged:
+                duplicates += 1
+            else:
+                merged[(method, position)] = line
+    covered = set()
+    for plan, _ in plans:
+        for position, clip in plan["clips"]:
+            covered.add(position)
+            missing += [{"clip": clip, "method": method} for method in plan["methods"]
+                        if (method, position) not in merged]
+
+    order = {method: i for i, method in enumerate(methods)}
+    keys = sorted(merged, key=lambda key: (order[key[0]], key[1]))
+    _write_atomic(output_dir / "aug_metadata.txt", "".join(merged[key] for key in keys))
+
+    shards_found = {plan["shard_index"] for plan, _ in plans}
+    return {
+        "num_shards": first["num_shards"],
+        "missing_shards": [i for i in range(first["num_shards"]) if i not in shards_found],
+        "selected": first["selected"],
+        "clips_covered": len(covered),
+        "lines": len(keys),
+        "duplicates": duplicates,
+        "missing": missing,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge the per-shard metadata of a sharded run")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    merge = subparsers.add_parser("merge", help="write output_dir/aug_metadata.txt from every shard's metadata")
+    merge.add_argument("output_dir")
+    merge.add_argument("--report", help="also save the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = merge_shards(args.output_dir)
+    print(f"Merged {report['lines']} lines from {report['num_shards'] - len(report['missing_shards'])}"
+          f"/{report['num_shards']} shards ({report['clips_covered']}/{report['selected']} clips, "
+          f"{report['duplicates']} duplicates dropped)")
+    if report["missing_shards"]:
+        print(f"Missing shards: {report['missing_shards']}")
+    for output in report["missing"]:
+        print(f"Missing output: {output['clip']} ({output['method']})")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if report["missing_shards"] or report["missing"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
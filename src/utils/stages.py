@@ -0,0 +1,165 @@
+"""
+Staged producer/consumer execution: reader threads -> CPU workers -> writer threads
+Author: Ye Bhone Lin
+
+The stages are joined by bounded queues, so a slow stage applies backpressure to the
+ones before it instead of letting decoded audio pile up in memory. Reading and writing
+run in threads (file I/O releases the GIL), the CPU stage runs either in one inline
+thread or on a process pool supplied by the caller.
+
+If any stage raises, or the run is interrupted with Ctrl-C, every stage is told to stop,
+pending work is cancelled and the exception is re-raised in the calling thread.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, wait
+import queue
+import threading
+
+
+_DONE = object()
+_POLL = 0.1
+
+
+class StagedRun:
+    def __init__(self, read, compute, write, executor=None, workers=1, readers=2, writers=2, queue_depth=16):
+        """
+        read(item) -> payload runs in `readers` threads.
+        compute(item, payload) -> computed runs inline, or on `executor` (a process pool
+            with `workers` processes) when one is given; compute must then be picklable.
+        write(item, computed) -> result runs in `writers` threads.
+        queue_depth bounds both the read queue and the write queue.
+        """
+        self.read = read
+        self.compute = compute
+        self.write = write
+        self.executor = executor
+        self.workers = max(1, workers)
+        self.readers = max(1, readers)
+        self.writers = max(1, writers)
+        self.queue_depth = max(1, queue_depth)
+
+    def run(self, items):
+        """Runs every item through the stages and returns the write results in item order."""
+        items = list(items)
+        self._results = [None] * len(items)
+        self._next = iter(enumerate(items))
+        self._lock = threading.Lock()
+        self._readers_left = self.readers
+        self._read_q = queue.Queue(self.queue_depth)
+        self._write_q = queue.Queue(self.queue_depth)
+        self._stop = threading.Event()
+        self._errors = []
+
+        threads = [threading.Thread(target=self._guard, args=(self._reader,), daemon=True)
+                   for _ in range(self.readers)]
+        threads.append(threading.Thread(target=self._guard, args=(self._computer,), daemon=True))
+        threads += [threading.Thread(target=self._guard, args=(self._writer,), daemon=True)
+                    for _ in range(self.writers)]
+        for t in threads:
+            t.start()
+
+        try:
+            for t in threads:
+                while t.is_alive():
+                    t.join(_POLL)
+        except KeyboardInterrupt:
+            self._stop.set()
+            for t in threads:
+                t.join()
+            raise
+
+        if self._errors:
+            raise self._errors[0]
+        return self._results
+
+    def _guard(self, stage):
+        try:
+            stage()
+        except BaseException as e:
+            self._errors.append(e)
+            self._stop.set()
+
+    def _put(self, q, value):
+        while not self._stop.is_set():
+            try:
+                q.put(value, timeout=_POLL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=_POLL)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def _reader(self):
+        try:
+            while not self._stop.is_set():
+                with self._lock:
+                    index, item = next(self._next, (None, None))
+                if index is None:
+                    break
+                if not self._put(self._read_q, (index, item, self.read(item))):
+                    return
+        finally:
+            with self._lock:
+                self._readers_left -= 1
+                last = self._readers_left == 0
+            if last:
+                self._put(self._read_q, _DONE)
+
+    def _computer(self):
+        try:
+            if self.executor is None:
+                self._compute_inline()
+            else:
+                self._compute_pool()
+        finally:
+            for _ in range(self.writers):
+                self._put(self._write_q, _DONE)
+
+    def _compute_inline(self):
+        while True:
+            entry = self._get(self._read_q)
+            if entry is _DONE:
+                return
+            index, item, payload = entry
+            if not self._put(self._write_q, (index, item, self.compute(item, payload))):
+                return
+
+    def _compute_pool(self):
+        # At most two jobs per worker are in flight, so the pool never runs dry but the
+        # read queue still fills up and blocks the readers when the workers fall behind.
+        pending = {}
+        try:
+            while True:
+                entry = self._get(self._read_q)
+                if entry is _DONE:
+                    break
+                index, item, payload = entry
+                pending[self.executor.submit(self.compute, item, payload)] = (index, item)
+                while len(pending) >= 2 * self.workers and not self._stop.is_set():
+                    self._collect(pending)
+            while pending and not self._stop.is_set():
+                self._collect(pending)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _collect(self, pending):
+        done, _ = wait(list(pending), timeout=_POLL, return_when=FIRST_COMPLETED)
+        for future in done:
+            index, item = pending.pop(future)
+            self._put(self._write_q, (index, item, future.result()))
+
+    def _writer(self):
+        while True:
+            entry = self._get(self._write_q)
+            if entry is _DONE:
+                return
+            index, item, computed = entry
+            self._results[index] = self.write(item, computed)
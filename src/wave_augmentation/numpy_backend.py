@@ -0,0 +1,210 @@
+"""
+Native NumPy waveform augmenters (float32, batch-capable) used by AudioAugmentationPipeline(backend="numpy")
+Author: Ye Bhone Lin
+
+loudness, mask, crop and shift draw their random parameters exactly like the nlpaug
+augmenters configured in pipeline.py, so with the same seed they change the same samples.
+noise adds white noise at the same level as nlpaug's NoiseAug. speed and pitch use a
+windowed overlap-add time stretch (pitch is resampling followed by the stretch), a fast
+approximation of librosa's phase vocoder.
+"""
+
+from fractions import Fraction
+import numpy as np
+
+
+def _zone(length, zone):
+    return int(length * zone[0]), int(length * zone[1])
+
+
+def _coverage_range(length, zone, coverage):
+    """Same start/end draw as nlpaug's AudioAugmenter.get_augment_range_by_coverage."""
+    zone_start, zone_end = _zone(length, zone)
+    zone_size = zone_end - zone_start
+    last_start = zone_start + int(zone_size * (1 - coverage))
+    if zone_start == last_start:
+        return zone_start, zone_end
+    start = np.random.randint(zone_start, last_start)
+    return start, start + int(zone_size * coverage)
+
+
+def loudness(data, zone=(0.2, 0.8), factor=(0.5, 2)):
+    level = np.random.uniform(*factor)
+    start, end = _coverage_range(len(data), zone, 1.0)
+    out = np.array(data, dtype=np.float32)
+    out[start:end] *= level
+    return out
+
+
+def mask(data, zone=(0.0, 1.0), coverage=0.1):
+    start, end = _coverage_range(len(data), zone, coverage)
+    out = np.array(data, dtype=np.float32)
+    out[start:end] = 0
+    return out
+
+
+def crop(data, zone=(0.2, 0.8), coverage=0.1):
+    start, end = _coverage_range(len(data), zone, coverage)
+    data = np.asarray(data, dtype=np.float32)
+    return np.concatenate((data[:start], data[end:]), axis=0)
+
+
+def noise(data, zone=(0.2, 0.8)):
+    start, end = _coverage_range(len(data), zone, 1.0)
+    out = np.array(data, dtype=np.float32)
+    size = end - start
+    if size > 0:
+        rng = np.random.default_rng(np.random.randint(2**31))
+        out[start:end] += rng.standard_normal(out[start:end].shape, dtype=np.float32) / np.float32(np.sqrt(size))
+    return out
+
+
+def shift(data, sr, duration=3):
+    amount = int(sr * duration)
+    if np.random.randint(1, 3) == 2:
+        amount = -amount
+    out = np.roll(np.asarray(data, dtype=np.float32), amount, axis=0)
+    if amount > 0:
+        out[:amount] = 0
+    else:
+        out[amount:] = 0
+    return out
+
+
+def ola_stretch(data, rate, frame=1024):
+    """
+    Time-stretch by `rate` (> 1 is faster/shorter) with 50% overlap-add of Hann-windowed
+    frames. Fully vectorized; output length is round(len(data) / rate).
+    """
+    data = np.asarray(data, dtype=np.float32)
+    hop = frame // 2
+    n_out = int(round(len(data) / rate))
+    n_frames = n_out // hop + 2
+
+    padded = np.pad(data, (hop, frame + int(np.ceil(n_frames * hop * rate))))
+    starts = np.round(np.arange(n_frames) * hop * rate).astype(np.int64)
+    window = np.hanning(frame + 1)[:-1].astype(np.float32)
+    frames = padded[starts[:, None] + np.arange(frame)] * window
+
+    out = np.zeros((n_frames + 1) * hop, dtype=np.float32)
+    out[:n_frames * hop] += frames[:, :hop].ravel()
+    out[hop:] += frames[:, hop:].ravel()
+    return out[hop:hop + n_out]
+
+
+def speed(data, factor=(1.5, 1.5)):
+    return ola_stretch(data, np.random.uniform(*factor))
+
+
+def pitch_shift(data, n_steps, frame=1024):
+    """Resample by 2**(n_steps/12) with a polyphase filter, then stretch back to the original length."""
+    from scipy.signal import resample_poly
+
+    ratio = Fraction(2 ** (n_steps / 12)).limit_denominator(64)
+    data = np.asarray(data, dtype=np.float32)
+    resampled = resample_poly(data, ratio.denominator, ratio.numerator).astype(np.float32)
+    return ola_stretch(resampled, len(resampled) / len(data), frame=frame)[:len(data)]
+
+
+def pitch(data, zone=(0.2, 0.8), factor=(2, 3)):
+    n_steps = np.random.uniform(*factor)
+    start, end = _coverage_range(len(data), zone, 1.0)
+    out = np.array(data, dtype=np.float32)
+    if end > start:
+        out[start:end] = pitch_shift(out[start:end], n_steps)
+    return out
+
+
+# Batch kernels draw all random parameters for the batch in one call and then apply them
+# with one slice operation per row, which is cheaper than full-size masks for 1-D audio.
+
+def _coverage_ranges(lengths, zone, coverage):
+    zone_start, zone_end = (lengths * zone[0]).astype(np.int64), (lengths * zone[1]).astype(np.int64)
+    zone_size = zone_end - zone_start
+    last_start = zone_start + (zone_size * (1 - coverage)).astype(np.int64)
+    start = np.where(
+        zone_start == last_start, zone_start,
+        np.random.randint(zone_start, np.maximum(last_start, zone_start + 1)),
+    )
+    end = np.where(zone_start == last_start, zone_end, start + (zone_size * coverage).astype(np.int64))
+    return start, end
+
+
+def batch_loudness(batch, lengths, zone=(0.2, 0.8), factor=(0.5, 2)):
+    lengths = np.asarray(lengths)
+    level = np.random.uniform(*factor, size=len(lengths)).astype(np.float32)
+    start, end = _coverage_ranges(lengths, zone, 1.0)
+    out = np.array(batch, dtype=np.float32)
+    for i in range(len(lengths)):
+        out[i, start[i]:end[i]] *= level[i]
+    return out, lengths
+
+
+def batch_mask(batch, lengths, zone=(0.0, 1.0), coverage=0.1):
+    lengths = np.asarray(lengths)
+    start, end = _coverage_ranges(lengths, zone, coverage)
+    out = np.array(batch, dtype=np.float32)
+    for i in range(len(lengths)):
+        out[i, start[i]:end[i]] = 0
+    return out, lengths
+
+
+def batch_crop(batch, lengths, zone=(0.2, 0.8), coverage=0.1):
+    lengths = np.asarray(lengths)
+    start, end = _coverage_ranges(lengths, zone, coverage)
+    new_lengths = lengths - (end - start)
+    out = np.zeros((len(lengths), max(1, new_lengths.max())), dtype=np.float32)
+    for i in range(len(lengths)):
+        out[i, :start[i]] = batch[i, :start[i]]
+        out[i, start[i]:new_lengths[i]] = batch[i, end[i]:lengths[i]]
+    return out, new_lengths
+
+
+def batch_noise(batch, lengths, zone=(0.2, 0.8)):
+    lengths = np.asarray(lengths)
+    start, end = _coverage_ranges(lengths, zone, 1.0)
+    rng = np.random.default_rng(np.random.randint(2**31))
+    noise = rng.standard_normal(batch.shape, dtype=np.float32)
+    noise *= (1 / np.sqrt(np.maximum(end - start, 1))).astype(np.float32)[:, None]
+    out = np.array(batch, dtype=np.float32)
+    for i in range(len(lengths)):
+        out[i, start[i]:end[i]] += noise[i, start[i]:end[i]]
+    return out, lengths
+
+
+def batch_shift(batch, lengths, sr, duration=3):
+    lengths = np.asarray(lengths)
+    amount = np.full(len(lengths), int(sr * duration))
+    amount = np.where(np.random.randint(1, 3, size=len(lengths)) == 2, -amount, amount)
+    out = np.zeros_like(batch, dtype=np.float32)
+    for i, length in enumerate(lengths):
+        n = max(0, length - abs(amount[i]))
+        if amount[i] > 0:
+            out[i, amount[i]:amount[i] + n] = batch[i, :n]
+        else:
+            out[i, :n] = batch[i, length - n:length]
+    return out, lengths
+
+
+def numpy_augmenters(sr):
+    """Native counterparts of the nlpaug augmenters in AudioAugmentationPipeline (same settings)."""
+    return {
+        'loudness': loudness,
+        'crop': crop,
+        'mask': mask,
+        'noise': noise,
+        'pitch': lambda data: pitch(data, factor=(2, 3)),
+        'shift': lambda data: shift(data, sr),
+        'speed': lambda data: speed(data, factor=(1.5, 1.5)),
+    }
+
+
+def numpy_batch_augmenters(sr):
+    """Batch kernels over padded (B, N) float32 stacks; each returns (batch, lengths)."""
+    return {
+        'loudness': batch_loudness,
+        'crop': batch_crop,
+        'mask': batch_mask,
+        'noise': batch_noise,
+        'shift': lambda batch, lengths: batch_shift(batch, lengths, sr),
+    }
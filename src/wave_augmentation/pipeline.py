@@ -5,193 +5,432 @@ Date: 1st Sep 2025
 """
 
 
-import csv
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property, partial
 from pathlib import Path
 import random
 import numpy as np
 import soundfile as sf
-import nlpaug.augmenter.audio as naa
+from .numpy_backend import numpy_augmenters, numpy_batch_augmenters
+from .streaming import STREAMING_METHODS, stream_augment
+from ..utils.audio_io import load_audio, preload_scipy
+from ..utils.outputs import MetadataWriter, make_output
+from ..utils.registry import Registry
+from ..utils.manifest import ManifestIndex
+from ..utils.run_state import select_clips
+from ..utils.seeds import derive_seed
+from ..utils.sharding import write_metadata
+from ..utils.metrics import Metrics, job_times
+from ..utils.stages import StagedRun
+
+
+BACKENDS = ("nlpaug", "numpy")
+
+
+def nlpaug_augmenter(name, sr, with_sr=False, **kwargs):
+    """Build nlpaug.augmenter.audio.<name>; nlpaug is imported on first use."""
+    import nlpaug.augmenter.audio as naa
+
+    if with_sr:
+        kwargs["sampling_rate"] = sr
+    return getattr(naa, name)(**kwargs)
+
+
+# Factories called with the sample rate; see src/utils/registry.py to add your own.
+WAVE_AUGMENTERS = Registry("wave augmenter")
+WAVE_AUGMENTERS.register('loudness', partial(nlpaug_augmenter, "LoudnessAug"))
+WAVE_AUGMENTERS.register('crop', partial(nlpaug_augmenter, "CropAug", with_sr=True))
+WAVE_AUGMENTERS.register('mask', partial(nlpaug_augmenter, "MaskAug", with_sr=True, zone=(0.0, 1.0), coverage=0.1,
+                                         mask_with_noise=False, stateless=True))
+WAVE_AUGMENTERS.register('noise', partial(nlpaug_augmenter, "NoiseAug"))
+WAVE_AUGMENTERS.register('pitch', partial(nlpaug_augmenter, "PitchAug", with_sr=True, factor=(2, 3)))
+WAVE_AUGMENTERS.register('shift', partial(nlpaug_augmenter, "ShiftAug", with_sr=True))
+WAVE_AUGMENTERS.register('speed', partial(nlpaug_augmenter, "SpeedAug", zone=(0.0, 1.0), coverage=1.0,
+                                          factor=(1.5, 1.5)))
+WAVE_AUGMENTERS.register('vtlp', partial(nlpaug_augmenter, "VtlpAug", with_sr=True))
 
 
 class AudioAugmentationPipeline:
-    def __init__(self, sr):
+    """
+    backend="nlpaug" runs every method through nlpaug. backend="numpy" uses the native
+    float32 augmenters in numpy_backend.py where one exists and falls back to nlpaug
+    for the rest (vtlp). Methods come from WAVE_AUGMENTERS, and each augmenter is only
+    built (and nlpaug only imported) the first time a clip uses it.
+    """
+
+    def __init__(self, sr, backend="nlpaug"):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}")
         self.sr = sr
-        self.augmenters = {
-            'loudness': naa.LoudnessAug(),
-            'crop': naa.CropAug(sampling_rate=sr),
-            'mask': naa.MaskAug(sampling_rate=sr, zone=(0.0, 1.0), coverage=0.1, mask_with_noise=False, stateless=True),
-            'noise': naa.NoiseAug(),
-            'pitch': naa.PitchAug(sampling_rate=sr, factor=(2, 3)),
-            'shift': naa.ShiftAug(sampling_rate=sr),
-            'speed': naa.SpeedAug(zone=(0.0, 1.0), coverage=1.0, factor=(1.5, 1.5)),
-            'vtlp': naa.VtlpAug(sampling_rate=sr),
-        }
+        self.backend = backend
+        self.native = numpy_augmenters(sr) if backend == "numpy" else {}
+        self.native_batch = numpy_batch_augmenters(sr) if backend == "numpy" else {}
+        self.augmenters = WAVE_AUGMENTERS.bind(sr)
 
     def augment(self, data, augmenter_name):
         if augmenter_name not in self.augmenters:
             raise ValueError(f"Augmentation '{augmenter_name}' is not supported.")
         if len(data) < 100:
             raise ValueError("Audio too short.")
-        augmented = self.augmenters[augmenter_name].augment(data)
+        if augmenter_name in self.native:
+            return self.native[augmenter_name](data)
+        augmenter = self.augmenters[augmenter_name]
+        augmented = augmenter.augment(data) if hasattr(augmenter, "augment") else augmenter(data)
         return np.array(augmented, dtype=np.float32)
 
+    def augment_batch(self, batch, lengths, augmenter_name):
+        """
+        Augment a zero-padded (B, N) float32 stack of mono clips. Returns (batch, lengths),
+        since crop changes the clip lengths. Methods without a native batch kernel are
+        applied clip by clip.
+        """
+        if augmenter_name not in self.augmenters:
+            raise ValueError(f"Augmentation '{augmenter_name}' is not supported.")
+        if augmenter_name in self.native_batch:
+            return self.native_batch[augmenter_name](np.asarray(batch, dtype=np.float32), lengths)
+
+        clips = [self.augment(batch[i, :length], augmenter_name).reshape(-1) for i, length in enumerate(lengths)]
+        new_lengths = np.array([len(clip) for clip in clips], dtype=np.int64)
+        out = np.zeros((len(clips), new_lengths.max()), dtype=np.float32)
+        for i, clip in enumerate(clips):
+            out[i, :len(clip)] = clip
+        return out, new_lengths
+
+
+def normalize_peak(augmented, out=None, inplace=False):
+    """
+    Put channels last, drop a single channel axis and scale the peak to 0.8 (float32).
+    out: a float32 array of the result's shape to write into instead of a new one.
+    inplace=True scales augmented itself when it is float32, for fresh augmenter results
+    that nothing else refers to; the normalisation then allocates nothing.
+    """
+    if augmented.ndim == 2:
+        augmented = augmented.T
+        if augmented.shape[1] == 1:
+            augmented = augmented.squeeze()
+
+    # max/min instead of np.abs(augmented).max(), which needs a temporary of the clip's size.
+    max_val = max(np.max(augmented), -np.min(augmented)) if augmented.size else 0
+    if inplace and augmented.dtype == np.float32 and augmented.flags.writeable:
+        out = augmented
+    elif out is None:
+        out = np.empty(augmented.shape, dtype=np.float32)
+    if max_val > 0:
+        np.divide(augmented, max_val, out=out)
+        out *= 0.8
+    elif out is not augmented:
+        out[...] = augmented
+
+    return out
+
+
+_worker_pipeline = None
+_worker_output = None
+
+
+def _init_worker(sr, backend, output):
+    global _worker_pipeline, _worker_output
+    _worker_pipeline = AudioAugmentationPipeline(sr=sr, backend=backend)
+    _worker_output = output
+
+
+def _seeded_call(seed, fn, *args):
+    """Seed the global RNGs and run fn. Returns (result, None) or (None, error message)."""
+    try:
+        random.seed(seed)
+        np.random.seed(seed)
+        return fn(*args), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def _augment_normalized(pipeline, data, method, times):
+    with times(f"augment/{method}"):
+        augmented = pipeline.augment(data, method)
+    with times("normalise"):
+        return normalize_peak(augmented, inplace=True)
+
+
+def _read_job(job, metrics):
+    """
+    Reader stage: decode the clip once for all of its in-memory methods (see
+    src/utils/audio_io.py). Returns (data, error, streamed), where streamed says whether the
+    streamable methods read the file themselves; data is None when every method is streamed.
+    """
+    wav_path, outputs, sr, streaming, _ = job
+    try:
+        # Blocks cannot be resampled on their own, so clips at another rate are loaded whole.
+        streamed = streaming and sf.info(str(wav_path)).samplerate == sr
+        if streamed and all(method in STREAMING_METHODS for method, _, _ in outputs):
+            return None, None, True
+        data, _ = load_audio(wav_path, sr, times=metrics.times)
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}", False
+    return data, None, streamed
+
+
+def _compute_job(job, decoded, pipeline=None, output=None, timed=True):
+    """
+    CPU stage: apply every requested method to the decoded clip. Returns one
+    (audio, ref, error) triple per method, plus the job's stage timings. Streamed methods
+    read and write the clip block by block themselves (see streaming.py) and come back
+    with a ref; in-memory methods come back with the normalised audio for the writer
+    stage. Errors are returned instead of raised so that one bad clip does not stop the
+    whole run.
+    """
+    wav_path, outputs, sr, _, clip = job
+    pipeline = pipeline or _worker_pipeline
+    output = output or _worker_output
+    times = job_times(timed)
+
+    results = []
+    for method, name, seed in outputs:
+        if decoded[2] and method in STREAMING_METHODS:
+            with times(f"stream/{method}"):
+                ref, error = _seeded_call(seed, stream_augment, wav_path, output, method, name, sr)
+            results.append((None, ref, error))
+        elif decoded[1] is not None:
+            results.append((None, None, decoded[1]))
+        else:
+            audio, error = _seeded_call(seed, _augment_normalized, pipeline, decoded[0], method, times)
+            results.append((audio, None, error))
+    return results, times.snapshot()
+
+
+def _write_job(job, computed, output, metrics, state=None):
+    """
+    Writer stage: encode the in-memory results, and log every finished output when the
+    run is resumable. Returns one (ref, error) pair per method.
+    """
+    wav_path, outputs, sr, _, clip = job
+    computed, times = computed
+    metrics.times.merge(times)
+    results = []
+    for (method, name, seed), (audio, ref, error) in zip(outputs, computed):
+        try:
+            if audio is not None:
+                ref = output.write(method, name, audio, sr, times=metrics.times)
+            if error is None and state is not None:
+                state.record(clip, method, seed, ref)
+        except Exception as e:
+            ref, error = None, f"{type(e).__name__}: {e}"
+        if error is not None:
+            metrics.failure(wav_path, method, error)
+        else:
+            seconds = len(audio) / sr if audio is not None else sf.info(str(wav_path)).duration
+            metrics.output(ref, wav_path, method, seconds)
+        results.append((ref, error))
+    return results
+
+
+def run_augmentation(pipeline, clips, methods, output_dir, sr, run_seed, sep="|", num_workers=1, streaming=False,
+                     output_format="wav", readers=2, writers=2, queue_depth=16, state=None, source=None,
+                     metrics=None, shard=None):
+    """
+    Augment every selected clip with every method and write aug_metadata.txt.
+
+    clips is a list of (wav_path, text). The work runs as three overlapping stages (see
+    src/utils/stages.py): `readers` threads decode the clips, the CPU stage augments each
+    clip with all methods (inline, or on a pool of num_workers processes), and `writers`
+    threads encode the results, with at most queue_depth clips waiting between stages.
+    Every output is seeded from run_seed, the clip and the method, so it does not depend
+    on the worker count, and metadata lines are written in (method, clip) order.
+    streaming=True keeps memory bounded for long recordings by streaming the methods
+    that allow it. output_format="shards" packs the audio into shard files (see
+    src/utils/outputs.py). With a RunState (src/utils/run_state.py), outputs that an
+    earlier run already completed are kept, and every new output is logged as it finishes.
+    With an ArrowAudioSource, clips are dataset clip names read straight from the dataset
+    (see src/dataset_preparation/arrow_source.py); they cannot be streamed.
+    Progress, stage timings and the run summary go through metrics (src/utils/metrics.py).
+    With a ShardSpec (src/utils/sharding.py), clips are that shard's part of the selection
+    and the metadata goes to the shard's own file and plan. Returns the summary.
+    """
+    metrics = metrics or Metrics()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output = make_output(output_format, output_dir, sr, prefix=f"{shard.shard_index:05d}-" if shard else "")
+
+    for method in methods:
+        (output_dir / method).mkdir(exist_ok=True)
+
+    jobs, selected, refs = [], [], {}
+    for wav_path_str, text in clips:
+        with metrics.times("resolve"):
+            wav_path = source.clip(wav_path_str) if source is not None else Path(wav_path_str).resolve()
+            exists = wav_path.exists()
+
+        if not exists:
+            metrics.warn(f"file not found: {wav_path}")
+            metrics.count("missing")
+            continue
+        selected.append((wav_path_str, wav_path, text))
+
+        outputs = []
+        for method in methods:
+            seed = derive_seed(run_seed, wav_path_str, method)
+            ref = state.completed_ref(wav_path_str, method, seed) if state is not None else None
+            if ref is not None:
+                refs[(wav_path, method)] = ref
+            else:
+                outputs.append((method, wav_path.name, seed))
+        if outputs:
+            jobs.append((wav_path, outputs, sr, streaming and source is None, wav_path_str))
+
+    total = sum(len(job[1]) for job in jobs)
+    if state is not None and metrics.verbosity >= 1:
+        print(f"Resuming: {len(refs)} outputs already complete, {total} to do")
+    metrics.start(total, skipped=len(refs))
+
+    read = partial(_read_job, metrics=metrics)
+    write = partial(_write_job, output=output, metrics=metrics, state=state)
+    stage_args = dict(readers=readers, writers=writers, queue_depth=queue_depth)
+    preload_scipy()
+    if num_workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker,
+                                 initargs=(sr, pipeline.backend, output)) as executor:
+            compute = partial(_compute_job, timed=metrics.enabled)
+            run = StagedRun(read, compute, write, executor=executor, workers=num_workers, **stage_args)
+            try:
+                results = run.run(jobs)
+            except BaseException:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+    else:
+        compute = partial(_compute_job, pipeline=pipeline, output=output, timed=metrics.enabled)
+        results = StagedRun(read, compute, write, **stage_args).run(jobs)
+    if output_format == "shards":
+        output.close()
+
+    for (wav_path, outputs, _, _, _), clip_results in zip(jobs, results):
+        for (method, _, _), (ref, error) in zip(outputs, clip_results):
+            if error is None:
+                refs[(wav_path, method)] = ref
+
+    write_metadata(output_dir, methods, selected, refs, sep, run_seed=run_seed, shard=shard)
+    return metrics.finish()
+
 
 class Augmentation:
-    def __init__(self, metadata_path, output_dir, sr=16000):
+    def __init__(self, metadata_path, output_dir, sr=16000, backend="nlpaug"):
         self.metadata_path = Path(metadata_path)
         self.output_dir = Path(output_dir)
         self.sr = sr
-        self.pipeline = AudioAugmentationPipeline(sr=sr)
-
-        with open(metadata_path, "r", encoding="utf-8") as f:
-            self.entries = [line.strip() for line in f if "|" in line]
+        self.pipeline = AudioAugmentationPipeline(sr=sr, backend=backend)
 
-    def augment(self, percent, methods):
-        total = len(self.entries)
-        sample_count = max(1, int(total * percent / 100))
-        selected = random.sample(self.entries, sample_count)
+        self.entries = ManifestIndex(metadata_path)
 
-        aug_meta_path = self.output_dir / "aug_metadata.txt"
-        self.output_dir.mkdir(parents=True, exist_ok=True)
-
-        with open(aug_meta_path, "w", encoding="utf-8") as meta_out:
-            for method in methods:
-                method_dir = self.output_dir / method
-                method_dir.mkdir(exist_ok=True)
-
-                for line in selected:
-                    wav_path, text = line.split("|")
-                    wav_path = Path(wav_path).resolve()
-
-                    if not wav_path.exists():
-                        print(f"Warning: file not found: {wav_path}")
-                        continue
-
-                    data, sr = sf.read(wav_path)
-                    if sr != self.sr:
-                        print(f"Warning: sample rate mismatch for {wav_path}: expected {self.sr}, got {sr}")
-
-                    augmented = self.pipeline.augment(data, method)
-
-                    if augmented.ndim == 2:
-                        augmented = augmented.T
-                        if augmented.shape[1] == 1:
-                            augmented = augmented.squeeze()
-
-                    max_val = np.max(np.abs(augmented))
-                    if max_val > 0:
-                        augmented = augmented / max_val * 0.8
-
-                    out_filename = f"{method}_{wav_path.name}"
-                    out_path = method_dir / out_filename
-                    sf.write(out_path, augmented.astype(np.float32), self.sr, format="WAV", subtype="PCM_16")
-
-                    meta_out.write(f"{out_path.resolve()}|{text.strip()}\n")
+    def augment(self, percent, methods, num_workers=1, seed=None, streaming=False, output_format="wav", readers=2,
+                writers=2, queue_depth=16, resume=False, metrics=None, stratify=None, shard_index=0,
+                num_shards=1):
+        """
+        Augment percent% of the rows with every method and return the run summary. See
+        select_clips (src/utils/run_state.py) for resume, stratify and sharding.
+        """
+        params = dict(sr=self.sr, backend=self.pipeline.backend, streaming=streaming, output_format=output_format)
+        run_seed, clips, methods, state, shard = select_clips(self.entries, percent, methods, self.output_dir, params,
+                                                              seed=seed, stratify=stratify, resume=resume,
+                                                              shard_index=shard_index, num_shards=num_shards)
+        return run_augmentation(self.pipeline, clips, methods, self.output_dir, self.sr, run_seed,
+                                sep="|", num_workers=num_workers, streaming=streaming, output_format=output_format,
+                                readers=readers, writers=writers, queue_depth=queue_depth, state=state,
+                                metrics=metrics, shard=shard)
 
-                    print(f"Augmented: {out_path}")
 
 class HF_Augmentation:
-    def __init__(self, metadata_path, output_dir, sr=16000):
-        self.metadata_path = Path(metadata_path)
+    def __init__(self, metadata_path, output_dir, sr=16000, backend="nlpaug", source=None):
+        """
+        source: an ArrowAudioSource to augment a cached HuggingFace dataset directly, without
+        exporting WAVs first; metadata_path is then not used.
+        """
+        self.metadata_path = Path(metadata_path) if metadata_path is not None else None
         self.output_dir = Path(output_dir)
         self.sr = sr
-        self.pipeline = AudioAugmentationPipeline(sr=sr)
-
-        with open(metadata_path, "r", encoding="utf-8", newline='') as f:
-            reader = csv.reader(f, delimiter='\t')
-            self.entries = [row for row in reader if len(row) >= 2]
-
-    def augment(self, percent, methods):
-        total = len(self.entries)
-        sample_count = max(1, int(total * percent / 100))
-        selected = random.sample(self.entries, sample_count)
-
-        aug_meta_path = self.output_dir / "aug_metadata.txt"
-        self.output_dir.mkdir(parents=True, exist_ok=True)
-
-        with open(aug_meta_path, "w", encoding="utf-8") as meta_out:
-            for method in methods:
-                method_dir = self.output_dir / method
-                method_dir.mkdir(exist_ok=True)
-
-                for wav_path_str, text in selected:
-                    wav_path = Path(wav_path_str).resolve()
-
-                    if not wav_path.exists():
-                        print(f"Warning: file not found: {wav_path}")
-                        continue
-
-                    data, sr = sf.read(wav_path)
-                    if sr != self.sr:
-                        print(f"Warning: sample rate mismatch for {wav_path}: expected {self.sr}, got {sr}")
-
-                    augmented = self.pipeline.augment(data, method)
-
-                    if augmented.ndim == 2:
-                        augmented = augmented.T
-                        if augmented.shape[1] == 1:
-                            augmented = augmented.squeeze()
-
-                    max_val = np.max(np.abs(augmented))
-                    if max_val > 0:
-                        augmented = augmented / max_val * 0.8
-
-                    out_filename = f"{method}_{wav_path.name}"
-                    out_path = method_dir / out_filename
-                    sf.write(out_path, augmented.astype(np.float32), self.sr, format="WAV", subtype="PCM_16")
+        self.pipeline = AudioAugmentationPipeline(sr=sr, backend=backend)
+        self.source = source
 
-                    meta_out.write(f"{out_path.resolve()}\t{text.strip()}\n")
+        if source is not None:
+            self.entries = source.entries()
+            return
+        self.entries = ManifestIndex(metadata_path, sep="\t", header=True)
 
-                    print(f"Augmented: {out_path}")
+    def augment(self, percent, methods, num_workers=1, seed=None, streaming=False, output_format="wav", readers=2,
+                writers=2, queue_depth=16, resume=False, metrics=None, stratify=None, shard_index=0,
+                num_shards=1):
+        """
+        Augment percent% of the rows with every method and return the run summary. See
+        select_clips (src/utils/run_state.py) for resume, stratify and sharding.
+        """
+        params = dict(sr=self.sr, backend=self.pipeline.backend, streaming=streaming, output_format=output_format)
+        run_seed, clips, methods, state, shard = select_clips(self.entries, percent, methods, self.output_dir, params,
+                                                              seed=seed, stratify=stratify, resume=resume,
+                                                              shard_index=shard_index, num_shards=num_shards)
+        return run_augmentation(self.pipeline, clips, methods, self.output_dir, self.sr, run_seed,
+                                sep="\t", num_workers=num_workers, streaming=streaming, output_format=output_format,
+                                readers=readers, writers=writers, queue_depth=queue_depth, state=state,
+                                source=self.source, metrics=metrics, shard=shard)
 
 class SingleAugHF:
-    def __init__(self, metadata_path, output_dir, sr=16000):
-        self.metadata_path = Path(metadata_path)
+    def __init__(self, metadata_path, output_dir, sr=16000, backend="nlpaug", output_format="wav", metrics=None):
+        """
+        One clip per augment_single call. The metadata TSV is only indexed if entries is
+        used, and aug_metadata.txt stays open between calls (see MetadataWriter in
+        src/utils/outputs.py); call close() when done. For many concurrent callers, use
+        AugmentationService (service.py), which batches requests.
+        Outputs, warnings and stage timings go through metrics (src/utils/metrics.py); the
+        default prints warnings only, Metrics(verbosity=2) prints every output.
+        """
+        self.metadata_path = Path(metadata_path) if metadata_path is not None else None
         self.output_dir = Path(output_dir)
         self.sr = sr
-        self.pipeline = AudioAugmentationPipeline(sr=sr)
+        self.pipeline = AudioAugmentationPipeline(sr=sr, backend=backend)
+        self.output = make_output(output_format, output_dir, sr)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.metadata = MetadataWriter(self.output_dir / "aug_metadata.txt", flush_lines=1)
+        self._method_dirs = set()
+        self.metrics = metrics or Metrics(verbosity=0)
 
-        with open(metadata_path, "r", encoding="utf-8", newline='') as f:
-            reader = csv.reader(f, delimiter='\t')
-            self.entries = [row for row in reader if len(row) >= 2]
+    @cached_property
+    def entries(self):
+        return ManifestIndex(self.metadata_path, sep="\t", header=True)
 
-    def augment_single(self, audio_path_str, method, text=""):
+    def augment_single(self, audio_path_str, method, text="", streaming=False):
         """
-        Augment a single audio file using the specified method.
+        Augment a single audio file using the specified method and return the output's reference.
+        With streaming=True, streamable methods process the file block by block.
         """
-        self.output_dir.mkdir(parents=True, exist_ok=True)
-        method_dir = self.output_dir / method
-        method_dir.mkdir(exist_ok=True)
+        if method not in self._method_dirs:
+            (self.output_dir / method).mkdir(exist_ok=True)
+            self._method_dirs.add(method)
 
+        metrics = self.metrics
         wav_path = Path(audio_path_str).resolve()
         if not wav_path.exists():
-            print(f"Warning: file not found: {wav_path}")
+            metrics.warn(f"file not found: {wav_path}")
+            metrics.count("missing")
             return
 
-        # Load audio
-        data, sr = sf.read(wav_path)
-        if sr != self.sr:
-            print(f"Warning: sample rate mismatch for {wav_path}: expected {self.sr}, got {sr}")
-
-        # Apply augmentation
-        augmented = self.pipeline.augment(data, method)
-
-        if augmented.ndim == 2:
-            augmented = augmented.T
-            if augmented.shape[1] == 1:
-                augmented = augmented.squeeze()
-
-        max_val = np.max(np.abs(augmented))
-        if max_val > 0:
-            augmented = augmented / max_val * 0.8
-
-        out_filename = f"{method}_{wav_path.name}"
-        out_path = method_dir / out_filename
-        sf.write(out_path, augmented.astype(np.float32), self.sr, format="WAV", subtype="PCM_16")
+        if streaming and method in STREAMING_METHODS and sf.info(str(wav_path)).samplerate == self.sr:
+            with metrics.times(f"stream/{method}"):
+                ref = stream_augment(wav_path, self.output, method, wav_path.name, self.sr)
+            seconds = sf.info(str(wav_path)).duration
+        else:
+            # Load audio
+            data, sr = load_audio(wav_path, self.sr, times=metrics.times)
+            if sr != self.sr:
+                metrics.count("resampled")
+
+            # Apply augmentation
+            augmented = _augment_normalized(self.pipeline, data, method, metrics.times)
+            ref = self.output.write(method, wav_path.name, augmented, self.sr, times=metrics.times)
+            seconds = len(augmented) / self.sr
 
         if text:
-            aug_meta_path = self.output_dir / "aug_metadata.txt"
-            with open(aug_meta_path, "a", encoding="utf-8") as f:
-                f.write(f"{out_path.resolve()}\t{text.strip()}\n")
+            self.metadata.append(f"{ref}\t{text.strip()}")
+
+        metrics.output(ref, audio_path_str, method, seconds)
+        return ref
 
-        print(f"Augmented: {out_path}")
+    def close(self):
+        self.metadata.close()
+        if hasattr(self.output, "close"):
+            self.output.close()
@@ -0,0 +1,426 @@
+"""
+Long-lived local augmentation service for single-clip requests
+Author: Ye Bhone Lin
+
+    service = AugmentationService("aug_out", backend="numpy", methods=["noise", "mask"])
+    ref = service.augment("clip.wav", "noise", text="hello")["ref"]
+    audio = service.augment(samples, "mask", write=False)["audio"]
+
+or, for other processes, over localhost HTTP:
+
+    python -m src.wave_augmentation.service aug_out --backend numpy --methods noise mask
+    ServiceClient("http://127.0.0.1:8765").augment("clip.wav", "noise", text="hello")
+
+The service holds one pipeline whose augmenters stay built; the methods passed at startup
+are run once on a dummy clip, so no request pays for imports or first-call setup.
+Requests queue up for a single batcher thread. It takes everything queued (waiting up to
+batch_window seconds after the first request, at most max_batch requests), decodes the
+batch's files in parallel on I/O threads and augments the clips. The I/O threads then
+encode and write them while the batcher moves on to the next batch. A finisher thread
+appends the batch's metadata lines through one MetadataWriter (src/utils/outputs.py)
+with a single flush per batch, so concurrent callers never interleave lines, and then
+resolves the requests. A request's seed (or, when the service has a seed,
+derive_seed(seed, path as given, method) as in run_augmentation, so pass the metadata's
+path string) makes its output reproducible and identical to a batch run's.
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlencode, urlsplit
+import numpy as np
+
+from .pipeline import AudioAugmentationPipeline, _augment_normalized, _seeded_call
+from ..utils.audio_io import load_audio, preload_scipy
+from ..utils.metrics import NULL_TIMES
+from ..utils.outputs import MetadataWriter, make_output
+from ..utils.seeds import derive_seed
+
+
+class _Request:
+    def __init__(self, audio, method, text, seed, name, write, return_audio):
+        self.audio = audio
+        self.method = method
+        self.text = text
+        self.seed = seed
+        self.name = name
+        self.write = write
+        self.return_audio = return_audio
+        self.future = Future()
+        self.submitted = time.perf_counter()
+
+
+class AugmentationService:
+    def __init__(self, output_dir=None, sr=16000, backend="nlpaug", output_format="wav", methods=(), seed=None,
+                 batch_window=0.002, max_batch=32, io_threads=4, sep="\t"):
+        """
+        output_dir: where outputs and aug_metadata.txt go; None only returns arrays.
+        methods: augmenters to build and run once now, so the first requests are fast.
+        seed: seed requests that bring none from the clip path and method, like a batch run.
+        batch_window: seconds the batcher waits for more requests after the first one.
+        io_threads: threads that decode, encode and write the clips of a batch.
+        sep: separator of the aug_metadata.txt lines (tab, as SingleAugHF writes).
+        """
+        self.output_dir = Path(output_dir) if output_dir is not None else None
+        self.sr = sr
+        self.seed = seed
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.sep = sep
+        self.pipeline = AudioAugmentationPipeline(sr=sr, backend=backend)
+        self.output = self.metadata = None
+        if self.output_dir is not None:
+            self.output = make_output(output_format, self.output_dir, sr)
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            self.metadata = MetadataWriter(self.output_dir / "aug_metadata.txt")
+        self._method_dirs = set()
+        self._names = itertools.count()
+        self._latencies = deque(maxlen=10000)
+        self._counts = {"requests": 0, "batches": 0, "failed": 0}
+        self.warm(methods)
+        preload_scipy()
+
+        self._queue = queue.Queue()
+        self._io = ThreadPoolExecutor(io_threads, thread_name_prefix="augment-io")
+        self._closed = False
+        self._lock = threading.Lock()
+        # Batches whose writes are in flight; the finisher records them while the next batch is augmented.
+        self._finishing = queue.Queue(maxsize=2)
+        self._thread = threading.Thread(target=self._loop, name="augment-batcher", daemon=True)
+        self._finisher = threading.Thread(target=self._finish_loop, name="augment-finisher", daemon=True)
+        self._thread.start()
+        self._finisher.start()
+
+    def warm(self, methods):
+        """Build and run each method once on a second of noise, leaving the global RNGs as they were."""
+        if not methods:
+            return
+        states = random.getstate(), np.random.get_state()
+        dummy = np.random.default_rng(0).uniform(-0.5, 0.5, self.sr).astype(np.float32)
+        try:
+            for method in methods:
+                if method not in self.pipeline.augmenters:
+                    raise ValueError(f"Augmentation '{method}' is not supported.")
+                self.pipeline.augment(dummy.copy(), method)
+        finally:
+            random.setstate(states[0])
+            np.random.set_state(states[1])
+
+    def submit(self, audio, method, text="", seed=None, name=None, write=None, return_audio=None):
+        """
+        Queue one clip; returns a Future of {"ref": output reference or None, "audio": array or None}.
+        audio: a file path, or mono float32 samples at the service's sample rate.
+        write: write the output (and a metadata line, if text is given); defaults to
+        whether the service has an output_dir. name: output file name for arrays.
+        return_audio: include the augmented samples; defaults to not write.
+        """
+        if method not in self.pipeline.augmenters:
+            raise ValueError(f"Augmentation '{method}' is not supported.")
+        write = self.output is not None if write is None else write
+        if write and self.output is None:
+            raise ValueError("This service has no output_dir to write to")
+        if not isinstance(audio, (str, os.PathLike)):
+            audio = np.asarray(audio, dtype=np.float32)
+        if seed is None and self.seed is not None:
+            clip = os.fspath(audio) if isinstance(audio, (str, os.PathLike)) else name
+            seed = derive_seed(self.seed, clip, method) if clip is not None else None
+        request = _Request(audio, method, text, seed, name, write, not write if return_audio is None else return_audio)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The augmentation service is closed")
+            self._queue.put(request)
+        return request.future
+
+    def augment(self, audio, method, text="", seed=None, name=None, write=None, return_audio=None, timeout=None):
+        """submit() and wait for the result."""
+        return self.submit(audio, method, text, seed, name, write, return_audio).result(timeout)
+
+    def _loop(self):
+        running = True
+        while running:
+            request = self._queue.get()
+            if request is None:
+                break
+            batch = [request]
+            deadline = time.perf_counter() + self.batch_window
+            while len(batch) < self.max_batch:
+                try:
+                    request = self._queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if request is None:
+                    running = False
+                    break
+                batch.append(request)
+            try:
+                self._finishing.put((batch, *self._process(batch)))
+            except Exception as e:
+                _fail(batch, e)
+        self._finishing.put(None)
+
+    def _finish_loop(self):
+        while True:
+            item = self._finishing.get()
+            if item is None:
+                break
+            try:
+                self._finish(*item)
+            except Exception as e:
+                _fail(item[0], e)
+
+    def _decode(self, request):
+        if not isinstance(request.audio, (str, os.PathLike)):
+            return request.audio, None
+        try:
+            return load_audio(Path(request.audio), self.sr)[0], None
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}"
+
+    def _augment(self, request, data):
+        if request.seed is not None:
+            return _seeded_call(request.seed, _augment_normalized, self.pipeline, data, request.method, NULL_TIMES)
+        try:
+            return _augment_normalized(self.pipeline, data, request.method, NULL_TIMES), None
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}"
+
+    def _write(self, request, audio):
+        if request.method not in self._method_dirs:
+            (self.output_dir / request.method).mkdir(exist_ok=True)
+            self._method_dirs.add(request.method)
+        name = request.name
+        if name is None:
+            name = (Path(request.audio).name if isinstance(request.audio, (str, os.PathLike))
+                    else f"{os.getpid()}-{next(self._names):08d}.wav")
+        return self.output.write(request.method, name, audio, self.sr)
+
+    def _process(self, batch):
+        """Decode the batch on the I/O threads and augment it clip by clip; returns the results and their writes."""
+        results = []
+        for request, (data, error) in zip(batch, self._io.map(self._decode, batch)):
+            results.append((None, error) if error is not None else self._augment(request, data))
+        writes = [self._io.submit(self._write, request, audio) if error is None and request.write else None
+                  for request, (audio, error) in zip(batch, results)]
+        return results, writes
+
+    def _finish(self, batch, results, writes):
+        """Wait for the batch's writes, append and flush its metadata, and resolve its futures."""
+        refs = [None] * len(batch)
+        for i, (request, write) in enumerate(zip(batch, writes)):
+            if write is None:
+                continue
+            try:
+                refs[i] = write.result()
+            except Exception as e:
+                results[i] = (None, f"{type(e).__name__}: {e}")
+                continue
+            if request.text:
+                self.metadata.append(f"{refs[i]}{self.sep}{request.text.strip()}")
+        if self.metadata is not None:
+            # Results are handed out once their metadata is on disk.
+            self.metadata.flush()
+
+        now = time.perf_counter()
+        self._counts["batches"] += 1
+        self._counts["requests"] += len(batch)
+        for request, ref, (audio, error) in zip(batch, refs, results):
+            self._latencies.append(now - request.submitted)
+            if error is not None:
+                self._counts["failed"] += 1
+                request.future.set_exception(RuntimeError(error))
+            else:
+                request.future.set_result({"ref": ref, "audio": audio if request.return_audio else None})
+
+    def stats(self):
+        """Request, batch and failure counts, and latency percentiles (ms) over the last 10000 requests."""
+        stats = dict(self._counts)
+        stats["mean_batch"] = stats["requests"] / stats["batches"] if stats["batches"] else 0.0
+        latencies = np.array(list(self._latencies)) * 1000
+        for q in (50, 90, 99):
+            stats[f"p{q}_ms"] = float(np.percentile(latencies, q)) if len(latencies) else 0.0
+        return stats
+
+    def close(self):
+        """Finish the queued requests, then flush the metadata and close the outputs."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+        self._finisher.join()
+        self._io.shutdown()
+        if self.metadata is not None:
+            self.metadata.close()
+        if hasattr(self.output, "close"):
+            self.output.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _fail(batch, error):
+    # Never leave a caller waiting, whatever went wrong.
+    for request in batch:
+        if not request.future.done():
+            request.future.set_exception(error)
+
+
+def _json_request(body):
+    """The JSON body of POST /augment, checked field by field."""
+    request = json.loads(body)
+    if not isinstance(request, dict):
+        raise ValueError("The request body must be a JSON object")
+    for field in ("path", "method"):
+        if not isinstance(request.get(field), str):
+            raise ValueError(f"'{field}' must be a string")
+    if not isinstance(request.get("text", ""), str):
+        raise ValueError("'text' must be a string")
+    seed = request.get("seed")
+    if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool)):
+        raise ValueError("'seed' must be an integer")
+    return request
+
+
+def _handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; without this, delayed ACKs add ~40 ms.
+        disable_nagle_algorithm = True
+
+        def _send(self, status, body, content_type="application/json", headers=()):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in headers:
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, status, payload):
+            self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+        def do_GET(self):
+            if urlsplit(self.path).path == "/stats":
+                self._json(200, service.stats())
+            else:
+                self._json(404, {"error": f"Unknown path: {self.path}"})
+
+        def do_POST(self):
+            url = urlsplit(self.path)
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if url.path != "/augment":
+                return self._json(404, {"error": f"Unknown path: {self.path}"})
+            try:
+                if self.headers.get("Content-Type") == "application/octet-stream":
+                    # Raw float32 samples in, raw float32 samples out; the rest is in the query.
+                    query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                    result = service.augment(np.frombuffer(body, dtype="<f4"), query["method"],
+                                             text=query.get("text", ""),
+                                             seed=int(query["seed"]) if "seed" in query else None,
+                                             name=query.get("name"), write=query.get("write") == "1",
+                                             return_audio=True)
+                    headers = [("X-Ref", result["ref"])] if result["ref"] else []
+                    return self._send(200, result["audio"].astype("<f4").tobytes(), "application/octet-stream",
+                                      headers)
+                request = _json_request(body)
+                result = service.augment(request["path"], request["method"], text=request.get("text", ""),
+                                         seed=request.get("seed"), write=True, return_audio=False)
+                self._json(200, {"ref": result["ref"]})
+            except (KeyError, ValueError, RuntimeError, OSError) as e:
+                self._json(400, {"error": f"{type(e).__name__}: {e}"})
+            except Exception as e:
+                # Always answer, so a keep-alive client is not left with a dropped connection.
+                self._json(500, {"error": f"{type(e).__name__}: {e}"})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def make_server(service, host="127.0.0.1", port=8765):
+    """A threading HTTP server in front of service: POST /augment, GET /stats. Call serve_forever() on it."""
+    server = ThreadingHTTPServer((host, port), _handler(service))
+    server.daemon_threads = True
+    return server
+
+
+class ServiceClient:
+    """Keep-alive client for make_server; use one per thread."""
+
+    def __init__(self, url="http://127.0.0.1:8765", timeout=60):
+        url = urlsplit(url)
+        self.connection = http.client.HTTPConnection(url.hostname, url.port, timeout=timeout)
+
+    def _post(self, path, body, content_type):
+        self.connection.request("POST", path, body=body, headers={"Content-Type": content_type})
+        response = self.connection.getresponse()
+        data = response.read()
+        if response.status != 200:
+            raise RuntimeError(json.loads(data)["error"])
+        return response, data
+
+    def augment(self, path, method, text="", seed=None):
+        """Augment and write the file at path (as the server sees it); returns the output reference."""
+        body = json.dumps({"path": str(path), "method": method, "text": text, "seed": seed})
+        return json.loads(self._post("/augment", body, "application/json")[1])["ref"]
+
+    def augment_array(self, audio, method, seed=None):
+        """Augment mono samples at the server's sample rate; returns the augmented float32 samples."""
+        query = urlencode({"method": method} if seed is None else {"method": method, "seed": seed})
+        body = np.asarray(audio, dtype="<f4").tobytes()
+        return np.frombuffer(self._post(f"/augment?{query}", body, "application/octet-stream")[1], dtype="<f4")
+
+    def stats(self):
+        self.connection.request("GET", "/stats")
+        return json.loads(self.connection.getresponse().read())
+
+    def close(self):
+        self.connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve single-clip augmentation requests on localhost")
+    parser.add_argument("output_dir")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--sr", type=int, default=16000)
+    parser.add_argument("--backend", choices=("nlpaug", "numpy"), default="nlpaug")
+    parser.add_argument("--output-format", choices=("wav", "shards"), default="wav")
+    parser.add_argument("--methods", nargs="+", default=[], help="augmenters to build and warm up at startup")
+    parser.add_argument("--seed", type=int, help="seed unseeded requests from the clip path and method")
+    parser.add_argument("--batch-window-ms", type=float, default=2.0)
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--io-threads", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    service = AugmentationService(args.output_dir, sr=args.sr, backend=args.backend, output_format=args.output_format,
+                                  methods=args.methods, seed=args.seed, batch_window=args.batch_window_ms / 1000,
+                                  max_batch=args.max_batch, io_threads=args.io_threads)
+    server = make_server(service, args.host, args.port)
+    print(f"Serving augmentation on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Bounded-memory streaming augmentation for long recordings
+Author: Ye Bhone Lin
+
+The file is read in blocks with sf.blocks and written incrementally through the output
+backend (sf.SoundFile for WAVs, appends for shards), so memory stays constant whatever the file length.
+Multichannel blocks are downmixed to mono like in src/utils/audio_io.py. Only sample-local
+methods can be streamed: loudness, noise, mask, crop and shift. Their random parameters
+are drawn once for the whole file, in the same way as numpy_backend.py (and therefore nlpaug).
+
+Peak normalisation needs the peak of the augmented audio before the first sample is
+written, so every file is streamed twice: the first pass only measures the peak, the
+second pass writes the scaled audio. Noise is generated per block from a fixed seed so
+both passes produce the same samples.
+"""
+
+import numpy as np
+import soundfile as sf
+from .numpy_backend import _coverage_range
+from ..utils.audio_io import downmix
+
+
+STREAMING_METHODS = ("loudness", "noise", "mask", "crop", "shift")
+
+
+class StreamingPlan:
+    """Random parameters of one method for a file of `frames` samples."""
+
+    def __init__(self, method, frames, sr):
+        if method not in STREAMING_METHODS:
+            raise ValueError(f"Augmentation '{method}' cannot be streamed.")
+        self.method = method
+        self.frames = frames
+        self.start, self.end = 0, 0
+        self.level = 1.0
+        self.shift = 0
+        self.noise_seed = None
+
+        if method == "loudness":
+            self.level = np.random.uniform(0.5, 2)
+            self.start, self.end = _coverage_range(frames, (0.2, 0.8), 1.0)
+        elif method == "mask":
+            self.start, self.end = _coverage_range(frames, (0.0, 1.0), 0.1)
+        elif method == "crop":
+            self.start, self.end = _coverage_range(frames, (0.2, 0.8), 0.1)
+        elif method == "noise":
+            self.start, self.end = _coverage_range(frames, (0.2, 0.8), 1.0)
+            self.noise_seed = np.random.randint(2**31)
+        elif method == "shift":
+            self.shift = int(sr * 3)
+            if np.random.randint(1, 3) == 2:
+                self.shift = -self.shift
+
+    def _apply(self, block, pos):
+        """Augment one input block starting at input frame `pos`; returns the output samples."""
+        lo, hi = max(self.start, pos) - pos, min(self.end, pos + len(block)) - pos
+        if hi <= lo:
+            return block
+        if self.method == "loudness":
+            block[lo:hi] *= self.level
+        elif self.method == "mask":
+            block[lo:hi] = 0
+        elif self.method == "crop":
+            block = np.concatenate((block[:lo], block[hi:]), axis=0)
+        elif self.method == "noise":
+            rng = np.random.default_rng((self.noise_seed, pos))
+            scale = np.float32(1 / np.sqrt(self.end - self.start))
+            block[lo:hi] += rng.standard_normal(block[lo:hi].shape, dtype=np.float32) * scale
+        return block
+
+    def blocks(self, path, blocksize):
+        """Yield augmented output blocks (float32, frames x 1) of the file at `path`."""
+        if self.shift > 0:
+            yield from _zeros(min(self.shift, self.frames), path, blocksize)
+            yield from _read(path, 0, self.frames - self.shift, blocksize)
+        elif self.shift < 0:
+            yield from _read(path, -self.shift, self.frames, blocksize)
+            yield from _zeros(min(-self.shift, self.frames), path, blocksize)
+        else:
+            pos = 0
+            for block in _read(path, 0, self.frames, blocksize):
+                block_pos, pos = pos, pos + len(block)
+                yield self._apply(block, block_pos)
+
+
+def _read(path, start, stop, blocksize):
+    """Mono (frames x 1) blocks, downmixed by averaging like src/utils/audio_io.py."""
+    if stop > start:
+        for block in sf.blocks(str(path), blocksize=blocksize, start=start, stop=stop, dtype="float32",
+                               always_2d=True):
+            yield block if block.shape[1] == 1 else downmix(block)[:, None]
+
+
+def _zeros(frames, path, blocksize):
+    for i in range(0, frames, blocksize):
+        yield np.zeros((min(blocksize, frames - i), 1), dtype=np.float32)
+
+
+def stream_augment(wav_path, output, method, name, sr, blocksize=1 << 16):
+    """
+    Augment wav_path with a streamable method and write it through `output` (see
+    src/utils/outputs.py), peak-normalised to 0.8 like the in-memory pipelines, without
+    holding the whole file in memory. Returns the output reference.
+    """
+    info = sf.info(str(wav_path))
+    if info.samplerate != sr:
+        print(f"Warning: sample rate mismatch for {wav_path}: expected {sr}, got {info.samplerate}")
+    plan = StreamingPlan(method, info.frames, sr)
+
+    peak = 0.0
+    for block in plan.blocks(wav_path, blocksize):
+        if len(block):
+            peak = max(peak, float(np.max(np.abs(block))))
+    scale = np.float32(0.8 / peak) if peak > 0 else np.float32(1.0)
+
+    def scaled_blocks():
+        for block in plan.blocks(wav_path, blocksize):
+            block *= scale
+            yield block[:, 0]
+
+    return output.write_blocks(method, name, scaled_blocks(), sr, 1)
@@ -0,0 +1,77 @@
+import io
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from src.dataset_preparation.arrow_source import ArrowAudioSource
+from src.utils.audio_io import load_audio
+from src.utils.manifest import sample_entries
+from src.wave_augmentation.pipeline import HF_Augmentation
+
+datasets = pytest.importorskip("datasets")
+
+
+def _wav_bytes(samples, sr, channels=1):
+    buffer = io.BytesIO()
+    audio = np.random.default_rng(samples).uniform(-0.3, 0.3, (samples, channels)).astype(np.float32)
+    sf.write(buffer, audio, sr, format="WAV")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def dataset_dir(tmp_path):
+    # Built undecoded and cast to Audio, which needs no audio backend to encode.
+    rows = [{"bytes": _wav_bytes(8000 + 1000 * i, 16000 if i % 2 == 0 else 22050, channels=1 + i % 2),
+             "path": f"clip{i % 4}.wav"} for i in range(6)]
+    ds = datasets.Dataset.from_dict({"audio": rows, "prompt": [f"text\t{i}" for i in range(6)]})
+    ds = ds.cast_column("audio", datasets.Audio())
+    path = tmp_path / "saved"
+    datasets.DatasetDict({"train": ds}).save_to_disk(str(path))
+    return path
+
+
+def test_entries_and_clips(dataset_dir):
+    source = ArrowAudioSource(dataset_dir, split="train")
+    assert source.entries() == [["clip0.wav", "text 0"], ["clip1.wav", "text 1"], ["clip2.wav", "text 2"],
+                                ["clip3.wav", "text 3"], ["clip0_4.wav", "text 4"], ["clip1_5.wav", "text 5"]]
+
+    y, file_sr = load_audio(source.clip("clip1_5.wav"), 16000)
+    assert file_sr == 22050 and y.dtype == np.float32 and y.ndim == 1
+    assert len(y) == -(-13000 * 16000 // 22050)
+
+    identity = source.clip("clip0.wav").identity()
+    assert identity == source.clip("clip0.wav").identity()
+    assert identity != source.clip("clip1.wav").identity()
+
+
+def test_split_is_required(dataset_dir):
+    with pytest.raises(ValueError, match="pass split="):
+        ArrowAudioSource(dataset_dir)
+
+
+def test_identity_without_the_private_fingerprint(dataset_dir):
+    from src.dataset_preparation.arrow_source import _fingerprint
+
+    ds = datasets.load_from_disk(str(dataset_dir))["train"]
+    fingerprint = _fingerprint(ds)
+    del ds._fingerprint
+    fallback = _fingerprint(ds)
+    assert fallback != fingerprint and fallback == _fingerprint(ds)
+
+
+def test_duration_strata_are_rejected(dataset_dir):
+    source = ArrowAudioSource(dataset_dir, split="train")
+    with pytest.raises(ValueError, match="duration"):
+        sample_entries(source.entries(), 3, seed=0, stratify="duration")
+    assert len(sample_entries(source.entries(), 3, seed=0, stratify=1)) == 3
+
+
+def test_augment_from_the_dataset(dataset_dir, tmp_path):
+    source = ArrowAudioSource(dataset_dir, split="train")
+    output = tmp_path / "out"
+    summary = HF_Augmentation(None, output, backend="numpy", source=source).augment(
+        100, ["noise"], seed=1, readers=2)
+    assert summary["outputs"] == 6 and summary["failed"] == 0
+    lines = (output / "aug_metadata.txt").read_text(encoding="utf-8").splitlines()
+    assert sorted(line.split("\t")[1] for line in lines) == [f"text {i}" for i in range(6)]
@@ -0,0 +1,13 @@
+from src.spectogram_augmentation.feature_cache import FeatureCache, open_cache
+from src.spectogram_augmentation.inversion import SpectrogramInverter
+
+
+def test_phase_inversion_warns_instead_of_caching(tmp_path, capsys):
+    assert open_cache(tmp_path / "cache", SpectrogramInverter(16000, mode="phase")) is None
+    assert "not used with phase inversion" in capsys.readouterr().out
+    assert not (tmp_path / "cache").exists()
+
+
+def test_griffin_lim_gets_a_cache(tmp_path):
+    assert isinstance(open_cache(tmp_path / "cache", SpectrogramInverter(16000)), FeatureCache)
+    assert open_cache(None, SpectrogramInverter(16000)) is None
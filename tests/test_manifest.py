@@ -0,0 +1,37 @@
+import random
+from collections.abc import Sequence
+
+from src.utils.manifest import ManifestIndex, sample_entries
+
+
+class _CountingRows(Sequence):
+    """Rows 0..n-1 that count how many are read."""
+
+    def __init__(self, n):
+        self.n = n
+        self.reads = 0
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.n:
+            raise IndexError(i)
+        self.reads += 1
+        return i
+
+    def __len__(self):
+        return self.n
+
+
+def test_sample_reads_only_the_sampled_rows():
+    for percent in (10, 30, 60, 100):
+        rows = _CountingRows(200_000)
+        k = len(rows) * percent // 100
+        sample = sample_entries(rows, k, seed=7)
+        assert rows.reads == k
+        assert sample == random.Random(7).sample(range(len(rows)), k)
+
+
+def test_sample_of_an_index_matches_random_sample(tmp_path):
+    metadata = tmp_path / "metadata.txt"
+    metadata.write_text("".join(f"clip{i}.wav|text {i}\n" for i in range(1000)), encoding="utf-8")
+    entries = ManifestIndex(metadata)
+    assert sample_entries(entries, 600, seed=3) == random.Random(3).sample(list(entries), 600)
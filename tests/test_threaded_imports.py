@@ -0,0 +1,73 @@
+"""
+The pipelines import scipy lazily. Imported for the first time from several reader
+threads at once, scipy can come back partially initialised, so every entry point must
+import it before it starts threads. Each check runs in a fresh interpreter.
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Records, for every thread started, whether scipy was already imported.
+PRELUDE = """
+import sys
+import threading
+ready = []
+_start = threading.Thread.start
+def _checked_start(self):
+    ready.append("scipy.fft" in sys.modules and "scipy.signal" in sys.modules)
+    _start(self)
+threading.Thread.start = _checked_start
+from src.utils.metrics import Metrics
+"""
+
+RUNS = {
+    "spec": """
+from src.spectogram_augmentation.spectogram_aug_pipeline import SpectrogramAugmentation
+summary = SpectrogramAugmentation({metadata!r}, {output!r}, inversion="phase").augment(
+    100, ["time_mask"], seed=1, readers=4, metrics=Metrics(verbosity=0))
+print(summary["outputs"], summary["failed"], bool(ready) and all(ready))
+""",
+    "wave": """
+from src.wave_augmentation.pipeline import Augmentation
+summary = Augmentation({metadata!r}, {output!r}, backend="numpy").augment(
+    100, ["noise"], seed=1, readers=4, metrics=Metrics(verbosity=0))
+print(summary["outputs"], summary["failed"], bool(ready) and all(ready))
+""",
+    "iterator": """
+from src.utils.augmentation_iterator import AugmentationIterator
+with AugmentationIterator({metadata!r}, ["time_mask"], mode="spec", num_workers=4, seed=1) as it:
+    print(len(list(it)), 0, bool(ready) and all(ready))
+""",
+}
+
+
+def _python(code):
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return result.stdout.split("\n")[-2]
+
+
+def _clips(root, count=12):
+    # Every other clip is at another rate, so the readers resample as well as analyse.
+    metadata = root / "metadata.txt"
+    with open(metadata, "w", encoding="utf-8") as f:
+        for i in range(count):
+            sr = 22050 if i % 2 else 16000
+            path = root / f"clip{i}.wav"
+            sf.write(path, np.random.default_rng(i).uniform(-0.3, 0.3, sr).astype(np.float32), sr)
+            f.write(f"{path}|text {i}\n")
+    return metadata
+
+
+def test_multi_reader_runs_import_scipy_first(tmp_path):
+    metadata = _clips(tmp_path)
+    for name, run in RUNS.items():
+        for repeat in range(3):
+            output = tmp_path / f"{name}{repeat}"
+            code = PRELUDE + run.format(metadata=str(metadata), output=str(output))
+            assert _python(code) == "12 0 True", name